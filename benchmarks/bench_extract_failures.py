@@ -0,0 +1,147 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from debug_companion.context_tools import extract_failures_impl, open_context_location  # noqa: E402
+from debug_companion.path_safety import safe_path  # noqa: E402
+
+# Streaming parser vs. the previous regex-over-the-whole-string implementation.
+# Usage: python benchmarks/bench_extract_failures.py --mb 100
+
+
+def legacy_extract_failures(*, pytest_output: str, limit: int, base_dir: str, root_dir: Path) -> Dict[str, Any]:
+    text = (pytest_output or "")
+    if text.strip() == "":
+        return {"ok": False, "error": "pytest_output is empty"}
+
+    lim = max(1, min(int(limit), 50))
+    pattern = re.compile(r"(?P<file>[A-Za-z0-9_./\\:\-]+\.py):(?P<line>\d+):")
+
+    failures: List[Dict[str, Any]] = []
+    seen = set()
+
+    safe_base: Optional[Path] = None
+    if base_dir.strip():
+        try:
+            safe_base = safe_path(base_dir, root_dir=root_dir)
+        except Exception:
+            safe_base = None
+
+    for m in pattern.finditer(text):
+        f_raw = m.group("file")
+        f_norm = f_raw.replace("\\", "/")
+        line = int(m.group("line"))
+        key = (f_norm, line)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        item: Dict[str, Any] = {"path": f_norm, "line": line}
+
+        resolved_abs: Optional[str] = None
+        try:
+            p = Path(f_raw).expanduser()
+            if p.is_absolute():
+                resolved_abs = str(p.resolve())
+            elif safe_base is not None:
+                resolved_abs = str((safe_base / p).resolve())
+        except Exception:
+            resolved_abs = None
+
+        if resolved_abs:
+            item["resolved_path"] = resolved_abs
+            try:
+                item.update(open_context_location(Path(resolved_abs), root_dir))
+            except Exception:
+                item["path_for_open_context"] = f_norm
+                item["open_context_base_dir"] = str(safe_base) if safe_base else ""
+        else:
+            item["path_for_open_context"] = f_norm
+            item["open_context_base_dir"] = str(safe_base) if safe_base else ""
+
+        failures.append(item)
+        if len(failures) >= lim:
+            break
+
+    return {"ok": True, "count": len(failures), "failures": failures}
+
+
+FAILURE_BLOCK = """___________________________________ test_{i} ___________________________________
+tests/test_mod{m}.py:{line}: in test_{i}
+    assert compute({i}) == {i}
+src/pkg/mod{m}.py:{inner}: in compute
+    return helper(x) + 1
+E   AssertionError: mismatch for {i}
+"""
+
+
+def write_log(path: str, mb: float, failures: int) -> int:
+    target = int(mb * 1024 * 1024)
+    progress = ("." * 76 + " [ 42%]\n") * 200
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("============================= test session starts ==============================\n")
+        while written < target:
+            written += f.write(progress)
+        f.write("=================================== FAILURES ===================================\n")
+        for i in range(failures):
+            written += f.write(FAILURE_BLOCK.format(i=i, m=i % 7, line=10 + i, inner=20 + i % 5))
+        f.write("=========================== short test summary info ============================\n")
+        for i in range(failures):
+            f.write(f"FAILED tests/test_mod{i % 7}.py::test_{i} - AssertionError: mismatch for {i}\n")
+    return os.path.getsize(path)
+
+
+def measure(fn) -> Dict[str, float]:
+    # Timed without tracemalloc (it slows allocation-heavy code several times), then traced once for the peak.
+    started = time.perf_counter()
+    res = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1024 / 1024, "count": res.get("count", 0)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=50.0)
+    ap.add_argument("--failures", type=int, default=40)
+    ap.add_argument("--limit", type=int, default=50)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        log = str(root / "pytest.log")
+        size = write_log(log, args.mb, args.failures)
+        size_mb = size / 1024 / 1024
+
+        def legacy():
+            with open(log, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            return legacy_extract_failures(pytest_output=text, limit=args.limit, base_dir=tmp, root_dir=root)
+
+        def streaming():
+            return extract_failures_impl(pytest_output="", log_path=log, limit=args.limit, base_dir=tmp, root_dir=root)
+
+        print(f"log: {size_mb:.1f} MB, {args.failures} failures")
+        for name, fn in (("legacy", legacy), ("streaming", streaming)):
+            r = measure(fn)
+            print(
+                f"{name:>10}: {size_mb / r['seconds']:8.1f} MB/s  {r['seconds']:.3f}s  "
+                f"peak {r['peak_mb']:.1f} MB  locations {r['count']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
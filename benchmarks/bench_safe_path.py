@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from debug_companion.path_safety import get_resolve_cache, safe_path  # noqa: E402
+
+# safe_path with the trie allowlist and resolution cache vs. the previous implementation.
+# Usage: python benchmarks/bench_safe_path.py --paths 5000 --rounds 5
+
+
+def _legacy_allowed_roots() -> List[Path]:
+    raw = os.environ.get("MCP_ALLOWED_ROOTS", "").strip()
+    parts: List[str] = []
+    for chunk in raw.split(";"):
+        parts.extend(chunk.split(os.pathsep))
+    roots = []
+    for p in parts:
+        p = p.strip().strip('"')
+        if p:
+            roots.append(Path(p).expanduser().resolve())
+    return roots
+
+
+def legacy_safe_path(user_path: str, root_dir: Path) -> Path:
+    s = (user_path or "").strip()
+    if s == "":
+        raise ValueError("path is empty")
+    p = Path(s).expanduser()
+    root = root_dir.resolve()
+    if not p.is_absolute():
+        resolved = (root_dir / p).resolve()
+        if resolved != root and root not in resolved.parents:
+            raise ValueError("path escapes root directory")
+        return resolved
+    resolved = p.resolve()
+    if resolved == root or root in resolved.parents:
+        return resolved
+    allowed_roots = _legacy_allowed_roots()
+    if not allowed_roots:
+        raise ValueError("absolute paths are disabled (set MCP_ALLOWED_ROOTS)")
+    for r in allowed_roots:
+        if resolved == r or resolved.is_relative_to(r):
+            return resolved
+    raise ValueError("path is outside allowed roots")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--paths", type=int, default=5000)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--allowed-roots", type=int, default=20)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        root = base / "root"
+        allowed = [base / f"allowed{i}" / "deep" / "tree" for i in range(args.allowed_roots)]
+        for d in [root, *allowed]:
+            d.mkdir(parents=True)
+        os.environ["MCP_ALLOWED_ROOTS"] = os.pathsep.join(str(d) for d in allowed)
+        get_resolve_cache().max_entries = max(get_resolve_cache().max_entries, args.paths * 2)
+
+        paths: List[str] = []
+        for i in range(args.paths):
+            kind = i % 4
+            if kind == 0:
+                paths.append(f"pkg/mod{i % 50}/file{i % 200}.py")
+            elif kind == 1:
+                paths.append(str(root / "pkg" / f"m{i % 100}.py"))
+            elif kind == 2:
+                paths.append(str(allowed[i % len(allowed)] / f"f{i % 300}.py"))
+            else:
+                paths.append(f"pkg/../../escape{i % 10}.py")
+
+        def run(fn) -> float:
+            started = time.perf_counter()
+            for _ in range(args.rounds):
+                for p in paths:
+                    try:
+                        fn(p, root)
+                    except ValueError:
+                        pass
+            return time.perf_counter() - started
+
+        calls = args.paths * args.rounds
+        for name, fn in (("legacy", legacy_safe_path), ("cached", safe_path)):
+            secs = run(fn)
+            print(f"{name:>7}: {calls / secs:10.0f} calls/s  {secs * 1e6 / calls:7.2f} us/call")
+        print(f"resolve cache: {get_resolve_cache().stats()}")
+
+
+if __name__ == "__main__":
+    main()
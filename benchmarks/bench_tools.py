@@ -0,0 +1,246 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synth_project import generate_project  # noqa: E402
+
+# Latency of the MCP tools on a generated project, with p50/p95 per tool and peak RSS, compared
+# against a JSON baseline. The LLM is the local fake backend, so no network or API key is needed.
+# Usage:
+#   python benchmarks/bench_tools.py --update-baseline          # record benchmarks/baseline.json
+#   python benchmarks/bench_tools.py                            # compare; exit code 1 on regression
+#   python benchmarks/bench_tools.py --modules 100 --tests 20 --output-lines 200 --depth 40
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    # Nearest-rank percentile.
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples_s: List[float]) -> Dict[str, Any]:
+    ms = [s * 1000.0 for s in samples_s]
+    return {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "mean_ms": round(sum(ms) / len(ms), 4) if ms else 0.0,
+    }
+
+
+def _rss_mb(who: int) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    raw = resource.getrusage(who).ru_maxrss
+    return round(raw / (1024 * 1024) if sys.platform == "darwin" else raw / 1024, 1)
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    out: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - started)
+    return out
+
+
+def run_benchmarks(args: argparse.Namespace, base: Path) -> Dict[str, Any]:
+    proj = base / "synth"
+    info = generate_project(
+        proj,
+        modules=args.modules,
+        tests_per_module=args.tests,
+        failure_rate=args.failure_rate,
+        output_lines=args.output_lines,
+        depth=args.depth,
+        big_file_lines=args.big_file_lines,
+        seed=args.seed,
+    )
+
+    os.environ["GEMINI_BACKEND"] = "fake"
+    os.environ["GEMINI_CACHE_TTL_SECONDS"] = "0"  # measure the whole analysis path every time
+    os.environ["MCP_CACHE_DIR"] = str(base / "cache")
+    os.environ.pop("MCP_ALLOWED_ROOTS", None)
+
+    import server
+    from debug_companion.path_safety import safe_path
+
+    logging.getLogger("debug-companion").setLevel(logging.WARNING)
+
+    server.ROOT_DIR = base
+    tools: Dict[str, Dict[str, Any]] = {}
+    rss: Dict[str, float] = {}
+
+    def record(name: str, samples: List[float]) -> None:
+        tools[name] = summarize(samples)
+        rss[name] = _rss_mb(resource.RUSAGE_SELF)
+        print(f"{name:>22}: p50 {tools[name]['p50_ms']:10.3f} ms  p95 {tools[name]['p95_ms']:10.3f} ms  (n={len(samples)})")
+
+    record(
+        "run_pytest",
+        _time(lambda: server.run_pytest(target="synth", max_output_lines=args.max_output_lines, timeout_seconds=300), args.repeat),
+    )
+
+    # Full output of the whole suite (no --maxfail) as input for the parser.
+    full = subprocess.run(
+        [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", str(proj)],
+        cwd=str(base),
+        capture_output=True,
+        text=True,
+        timeout=600,
+    ).stdout
+    log_path = base / "pytest_full.log"
+    log_path.write_text(full, encoding="utf-8")
+    print(f"{'(full output)':>22}: {len(full) / 1e6:.2f} MB, {full.count(chr(10))} lines")
+    record(
+        "extract_failures",
+        _time(lambda: server.extract_failures(pytest_output=full, limit=50, base_dir=str(base)), args.repeat),
+    )
+    record(
+        "extract_failures_log",
+        _time(lambda: server.extract_failures(log_path=str(log_path), limit=50, base_dir=str(base)), args.repeat),
+    )
+
+    rng = random.Random(args.seed)
+    if info["big_file"]:
+        lines = [rng.randint(1, info["big_file_lines"]) for _ in range(args.samples)]
+        it = iter(lines * 2)
+        record(
+            "open_context",
+            _time(lambda: server.open_context(path="synth/pkg/big_module.py", line=next(it), radius=35), args.samples),
+        )
+        it = iter(lines * 2)
+        record(
+            "open_context_scope",
+            _time(
+                lambda: server.open_context(path="synth/pkg/big_module.py", line=next(it), radius=35, mode="scope"),
+                args.samples,
+            ),
+        )
+
+    candidates = [f"synth/pkg/mod_{rng.randrange(args.modules)}.py" for _ in range(args.samples)]
+    candidates += [str(proj / "tests" / f"test_mod_{rng.randrange(args.modules)}.py") for _ in range(args.samples)]
+    candidates += ["synth/../../escape.py"] * (args.samples // 10)
+
+    def one_safe_path(p: str) -> None:
+        try:
+            safe_path(p, base)
+        except ValueError:
+            pass
+
+    it = iter(candidates)
+    record("safe_path", _time(lambda: one_safe_path(next(it)), len(candidates)))
+
+    record(
+        "debug_project",
+        _time(
+            lambda: server.debug_project(
+                target="synth", failure_limit=args.failure_limit, timeout_seconds=300, token_budget=2000
+            ),
+            args.repeat,
+        ),
+    )
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "project": {k: v for k, v in info.items() if k not in ("root", "big_file")},
+            "full_output_bytes": len(full),
+        },
+        "tools": tools,
+        "peak_rss_mb": {
+            "after_tool": rss,
+            "self": _rss_mb(resource.RUSAGE_SELF),
+            "children": _rss_mb(resource.RUSAGE_CHILDREN),
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    # A tool regresses when its p50 or p95 is more than `tolerance` (relative) and `min_delta_ms`
+    # (absolute, against timer noise on sub-millisecond tools) above the baseline.
+    problems: List[str] = []
+    for name, cur in current.get("tools", {}).items():
+        old = baseline.get("tools", {}).get(name)
+        if not old:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            before, after = float(old.get(key) or 0), float(cur.get(key) or 0)
+            if after > before * (1 + tolerance) and after - before > min_delta_ms:
+                problems.append(f"{name} {key}: {before:.3f} -> {after:.3f} ms (+{(after / before - 1) * 100 if before else 0:.0f}%)")
+    old_rss = float(baseline.get("peak_rss_mb", {}).get("self") or 0)
+    new_rss = float(current.get("peak_rss_mb", {}).get("self") or 0)
+    if old_rss and new_rss > old_rss * (1 + tolerance):
+        problems.append(f"peak RSS: {old_rss:.1f} -> {new_rss:.1f} MB")
+    return problems
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modules", type=int, default=20)
+    ap.add_argument("--tests", type=int, default=10, help="tests per module")
+    ap.add_argument("--failure-rate", type=float, default=0.1)
+    ap.add_argument("--output-lines", type=int, default=50, help="lines printed by each failing test")
+    ap.add_argument("--depth", type=int, default=15, help="call depth of failing tracebacks")
+    ap.add_argument("--big-file-lines", type=int, default=50_000)
+    ap.add_argument("--max-output-lines", type=int, default=1200)
+    ap.add_argument("--failure-limit", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=5, help="samples for the pytest-running tools")
+    ap.add_argument("--samples", type=int, default=500, help="samples for open_context / safe_path")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--min-delta-ms", type=float, default=0.5)
+    ap.add_argument("--json", default="", help="also write this run's results here")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dc-bench-") as tmp:
+        current = run_benchmarks(args, Path(tmp))
+    current["meta"]["args"] = vars(args)
+    print(f"peak RSS: self {current['peak_rss_mb']['self']} MB, children {current['peak_rss_mb']['children']} MB")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(current, indent=2), encoding="utf-8")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        baseline_path.write_text(json.dumps(current, indent=2), encoding="utf-8")
+        print(f"baseline written: {baseline_path}")
+        return 0
+
+    baseline: Optional[Dict[str, Any]] = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if (baseline or {}).get("meta", {}).get("project") != current["meta"]["project"]:
+        print("warning: baseline was recorded for a different synthetic project; numbers are not comparable")
+    problems = compare(current, baseline or {}, args.tolerance, args.min_delta_ms)
+    if problems:
+        print("REGRESSIONS vs baseline:")
+        for p in problems:
+            print("  " + p)
+        return 1
+    print(f"no regressions vs {baseline_path} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import random
+from pathlib import Path
+from typing import Any, Dict
+
+# Synthetic pytest project for the benchmarks: N modules with M tests each, a share of them
+# failing through a deep call chain, optional chatty output, and one very long source file.
+
+
+def _module_source(i: int, depth: int, filler: int) -> str:
+    lines = [f"# synthetic module {i}", ""]
+    for d in range(depth):
+        nxt = f"return step_{d + 1}(x, trail + [{d}])" if d + 1 < depth else "return check(x, trail)"
+        lines += [f"def step_{d}(x, trail):", f"    {nxt}", "", ""]
+    lines += [
+        "def check(x, trail):",
+        "    if x < 0:",
+        f"        raise ValueError(f'module {i}: negative input {{x}} after {{len(trail)}} steps')",
+        "    return x * 2",
+        "",
+        "",
+    ]
+    for k in range(filler):
+        lines += [f"def helper_{k}(a, b={k}):", "    total = a + b", f"    return total * {k % 7 + 1}", "", ""]
+    return "\n".join(lines) + "\n"
+
+
+def _test_source(i: int, outcomes, output_lines: int) -> str:
+    lines = [f"from pkg.mod_{i} import step_0", ""]
+    for j, fail in enumerate(outcomes):
+        lines.append(f"def test_case_{j}():")
+        if fail and output_lines:
+            lines.append(f"    for n in range({output_lines}):")
+            lines.append(f"        print('chatty output line', n, 'of test {i}.{j}')")
+        lines.append(f"    assert step_0({-1 if fail else j}, []) == {j * 2}")
+        lines += ["", ""]
+    return "\n".join(lines)
+
+
+def _big_source(n_lines: int) -> str:
+    lines = ["# very long generated module", ""]
+    k = 0
+    while len(lines) < n_lines:
+        lines += [
+            f"def generated_{k}(value):",
+            f"    result = value + {k}",
+            "    if result % 3 == 0:",
+            f"        result = generated_{max(0, k - 1)}(result - 1) if {k} else result",
+            "    return result",
+            "",
+        ]
+        k += 1
+    return "\n".join(lines[:n_lines]) + "\n"
+
+
+def generate_project(
+    root: Path,
+    *,
+    modules: int = 20,
+    tests_per_module: int = 10,
+    failure_rate: float = 0.1,
+    output_lines: int = 0,
+    depth: int = 10,
+    big_file_lines: int = 50_000,
+    filler_functions: int = 20,
+    seed: int = 1234,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    (root / "pkg").mkdir(parents=True, exist_ok=True)
+    (root / "tests").mkdir(exist_ok=True)
+    (root / "pkg" / "__init__.py").write_text("", encoding="utf-8")
+    (root / "conftest.py").write_text("", encoding="utf-8")  # puts the project root on sys.path
+
+    failing = 0
+    for i in range(modules):
+        (root / "pkg" / f"mod_{i}.py").write_text(_module_source(i, depth, filler_functions), encoding="utf-8")
+        outcomes = [rng.random() < failure_rate for _ in range(tests_per_module)]
+        failing += sum(outcomes)
+        (root / "tests" / f"test_mod_{i}.py").write_text(_test_source(i, outcomes, output_lines), encoding="utf-8")
+
+    big = root / "pkg" / "big_module.py"
+    if big_file_lines > 0:
+        big.write_text(_big_source(big_file_lines), encoding="utf-8")
+
+    return {
+        "root": str(root),
+        "modules": modules,
+        "tests": modules * tests_per_module,
+        "failing": failing,
+        "big_file": str(big) if big_file_lines > 0 else "",
+        "big_file_lines": big_file_lines,
+        "depth": depth,
+    }
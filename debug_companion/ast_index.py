@@ -0,0 +1,233 @@
+import ast
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.metrics import incr, span
+from debug_companion.path_safety import safe_path
+
+MAX_ENTRIES = 256
+MAX_CALLEES = 20
+
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(b) for b in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    sig = f"{prefix} {node.name}({ast.unparse(node.args)})"
+    if node.returns is not None:
+        sig += f" -> {ast.unparse(node.returns)}"
+    return sig
+
+
+class ScopeIndex:
+    # Nested def/class spans flattened into disjoint line segments, so the innermost scope of
+    # a line is one bisect away.
+
+    def __init__(self, path: str, key: Tuple[int, int, int], tree: ast.Module):
+        self.path = path
+        self.key = key
+        self.tree = tree
+        self.scopes: List[Dict[str, Any]] = []
+        self.nodes: List[ast.AST] = []
+        self.defs: Dict[str, int] = {}  # top-level and method names -> scope index (first wins)
+        self.imports: Dict[str, Tuple[str, str, int]] = {}  # local name -> (module, name, level)
+        self._seg_starts: List[int] = []
+        self._seg_scope: List[int] = []
+        self._collect(tree, "", 0)
+        self._flatten()
+
+    def _collect(self, node: ast.AST, prefix: str, depth: int) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, _SCOPE_NODES):
+                start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                qual = f"{prefix}{child.name}"
+                self.scopes.append(
+                    {
+                        "kind": "class" if isinstance(child, ast.ClassDef) else "function",
+                        "name": child.name,
+                        "qualname": qual,
+                        "start": start,
+                        "end": child.end_lineno or child.lineno,
+                        "depth": depth,
+                    }
+                )
+                self.nodes.append(child)
+                self.defs.setdefault(child.name, len(self.scopes) - 1)
+                self._collect(child, qual + ".", depth + 1)
+            else:
+                if isinstance(child, ast.ImportFrom) and depth == 0:
+                    for alias in child.names:
+                        self.imports[alias.asname or alias.name] = (child.module or "", alias.name, child.level)
+                self._collect(child, prefix, depth)
+
+    def _flatten(self) -> None:
+        order = sorted(range(len(self.scopes)), key=lambda i: (self.scopes[i]["start"], -self.scopes[i]["end"]))
+        stack: List[int] = []
+        starts, owners = self._seg_starts, self._seg_scope
+
+        def emit(line: int, owner: int) -> None:
+            if starts and starts[-1] == line:
+                owners[-1] = owner
+            elif not owners or owners[-1] != owner:
+                starts.append(line)
+                owners.append(owner)
+
+        def close_until(line: int) -> None:
+            while stack and self.scopes[stack[-1]]["end"] < line:
+                done = stack.pop()
+                emit(self.scopes[done]["end"] + 1, stack[-1] if stack else -1)
+
+        emit(1, -1)
+        for i in order:
+            close_until(self.scopes[i]["start"])
+            stack.append(i)
+            emit(self.scopes[i]["start"], i)
+        close_until(10**12)
+
+    def innermost(self, line: int) -> Optional[int]:
+        pos = bisect_right(self._seg_starts, line) - 1
+        if pos < 0:
+            return None
+        owner = self._seg_scope[pos]
+        return None if owner < 0 else owner
+
+    def enclosing(self, line: int) -> Optional[Dict[str, Any]]:
+        idx = self.innermost(line)
+        return None if idx is None else self.scopes[idx]
+
+    def called_names(self, start: int, end: int) -> List[str]:
+        calls: List[Tuple[int, str]] = []
+        for node in ast.walk(self.tree):
+            if not isinstance(node, ast.Call) or not start <= node.lineno <= end:
+                continue
+            func = node.func
+            if isinstance(func, ast.Name):
+                calls.append((node.lineno, func.id))
+            elif isinstance(func, ast.Attribute):
+                calls.append((node.lineno, func.attr))
+        names: List[str] = []
+        for _, name in sorted(calls):
+            if name not in names:
+                names.append(name)
+        return names
+
+
+class ScopeIndexCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, ScopeIndex]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, path: str) -> ScopeIndex:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry.key == key:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry
+                del self._entries[path]
+                self.invalidations += 1
+            self.misses += 1
+
+        with span("ast.parse"):
+            with open(path, "rb") as f:
+                source = f.read()
+            entry = ScopeIndex(path, key, ast.parse(source, filename=path))
+        incr("file.bytes_read", len(source))
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+_CACHE = ScopeIndexCache()
+
+
+def get_scope_cache() -> ScopeIndexCache:
+    return _CACHE
+
+
+def _module_file(index: ScopeIndex, module: str, level: int, root_dir: Path) -> Optional[Path]:
+    here = Path(index.path)
+    if level > 0:
+        if level > len(here.parents):
+            return None
+        bases = [here.parents[level - 1]]
+    else:
+        bases = [here.parent, root_dir]
+    rel = Path(*module.split(".")) if module else None
+    for base in bases:
+        cands = [base / rel.with_suffix(".py"), base / rel / "__init__.py"] if rel else [base / "__init__.py"]
+        for cand in cands:
+            # Same access rules as open_context: under the root or MCP_ALLOWED_ROOTS only.
+            try:
+                checked = safe_path(str(cand), root_dir=root_dir)
+            except ValueError:
+                continue
+            if checked.is_file():
+                return checked
+    return None
+
+
+def callee_signatures(index: ScopeIndex, start: int, end: int, root_dir: Path) -> List[Dict[str, Any]]:
+    # Signatures of functions called from [start, end] that are defined in the same file or
+    # imported with `from x import name` from a module next to it / under root_dir. Modules outside
+    # the root and the allowed roots are skipped.
+    out: List[Dict[str, Any]] = []
+    cache = get_scope_cache()
+    for name in index.called_names(start, end):
+        target: Optional[Tuple[ScopeIndex, int]] = None
+        if name in index.defs:
+            target = (index, index.defs[name])
+        elif name in index.imports:
+            module, orig, level = index.imports[name]
+            mod_path = _module_file(index, module, level, root_dir)
+            if mod_path is not None:
+                try:
+                    other = cache.get(str(mod_path))
+                except (OSError, SyntaxError, ValueError):
+                    other = None
+                if other is not None and orig in other.defs:
+                    target = (other, other.defs[orig])
+        if target is None:
+            continue
+        owner, idx = target
+        scope = owner.scopes[idx]
+        if owner is index and scope["start"] <= start and scope["end"] >= end:
+            continue  # recursion into the scope being shown
+        out.append(
+            {
+                "name": scope["qualname"],
+                "signature": _signature(owner.nodes[idx]),
+                "path": owner.path,
+                "line": owner.nodes[idx].lineno,
+            }
+        )
+        if len(out) >= MAX_CALLEES:
+            break
+    return out
@@ -0,0 +1,10 @@
+import os
+from pathlib import Path
+
+
+def get_cache_dir(sub: str = "") -> Path:
+    raw = (os.environ.get("MCP_CACHE_DIR") or "").strip()
+    base = Path(raw).expanduser() if raw else Path.home() / ".cache" / "debug-companion"
+    p = base / sub if sub else base
+    p.mkdir(parents=True, exist_ok=True)
+    return p
@@ -1,20 +1,41 @@
-import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from debug_companion.ast_index import callee_signatures, get_scope_cache
+from debug_companion.file_cache import get_file_cache
+from debug_companion.fingerprint import cluster_records
+from debug_companion.metrics import incr, span
 from debug_companion.path_safety import safe_path
+from debug_companion.traceback_parser import PathResolver, TracebackParser, iter_file_lines, iter_text_lines, parse_lines
 
 
-def extract_failures_impl(*, pytest_output: str, limit: int, base_dir: str, root_dir: Path) -> Dict[str, Any]:
+def open_context_location(abs_path: Path, root_dir: Path) -> Dict[str, str]:
+    abs_p = abs_path.resolve()
+    root = root_dir.resolve()
+    if abs_p == root or root in abs_p.parents:
+        return {"path_for_open_context": abs_p.relative_to(root).as_posix(), "open_context_base_dir": ""}
+    return {"path_for_open_context": str(abs_p), "open_context_base_dir": ""}
+
+
+CLUSTER_SCAN_RECORDS = 500
+# Lines shown on each side of a focus line, whatever radius is asked for.
+MIN_RADIUS = 5
+MAX_RADIUS = 120
+
+
+def extract_failures_impl(
+    *,
+    pytest_output: str,
+    limit: int,
+    base_dir: str,
+    root_dir: Path,
+    log_path: str = "",
+) -> Dict[str, Any]:
     text = (pytest_output or "")
-    if text.strip() == "":
+    if text.strip() == "" and not log_path.strip():
         return {"ok": False, "error": "pytest_output is empty"}
 
     lim = max(1, min(int(limit), 50))
-    pattern = re.compile(r"(?P<file>[A-Za-z0-9_./\\:\-]+\.py):(?P<line>\d+):")
-
-    failures: List[Dict[str, Any]] = []
-    seen = set()
 
     safe_base: Optional[Path] = None
     if base_dir.strip():
@@ -23,56 +44,46 @@ def extract_failures_impl(*, pytest_output: str, limit: int, base_dir: str, root
         except Exception:
             safe_base = None
 
-    for m in pattern.finditer(text):
-        f_raw = m.group("file")
-        f_norm = f_raw.replace("\\", "/")
-        line = int(m.group("line"))
-        key = (f_norm, line)
-        if key in seen:
-            continue
-        seen.add(key)
+    if log_path.strip():
+        try:
+            log_file = safe_path(log_path, root_dir=root_dir)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        if not log_file.is_file():
+            return {"ok": False, "error": f"file not found: {log_path}"}
+        lines = iter_file_lines(str(log_file))
+    else:
+        lines = iter_text_lines(text)
 
-        item: Dict[str, Any] = {"path": f_norm, "line": line}
+    resolver = PathResolver(safe_base, root_dir, open_context_location)
+    # Records beyond `limit` are parsed too so the clusters count every failing test.
+    parser = TracebackParser(resolver, max_records=max(lim, CLUSTER_SCAN_RECORDS), max_locations=lim)
+    try:
+        with span("parse.tracebacks"):
+            parse_lines(lines, parser)
+    except OSError as e:
+        return {"ok": False, "error": f"failed reading log: {e}"}
+    incr("parse.lines", parser.lines_seen)
+    incr("parse.bytes", parser.bytes_seen)
 
-        resolved_abs: Optional[str] = None
-        try:
-            p = Path(f_raw).expanduser()
-            if p.is_absolute():
-                resolved_abs = str(p.resolve())
-            elif safe_base is not None:
-                resolved_abs = str((safe_base / p).resolve())
-        except Exception:
-            resolved_abs = None
-
-        if resolved_abs:
-            item["resolved_path"] = resolved_abs
-            try:
-                abs_p = Path(resolved_abs).resolve()
-                root = root_dir.resolve()
-                if abs_p == root or root in abs_p.parents:
-                    item["path_for_open_context"] = abs_p.relative_to(root).as_posix()
-                    item["open_context_base_dir"] = ""
-                else:
-                    item["path_for_open_context"] = resolved_abs
-                    item["open_context_base_dir"] = ""
-            except Exception:
-                item["path_for_open_context"] = f_norm
-                item["open_context_base_dir"] = str(safe_base) if safe_base else ""
-        else:
-            item["path_for_open_context"] = f_norm
-            item["open_context_base_dir"] = str(safe_base) if safe_base else ""
+    return {
+        "ok": True,
+        "count": len(parser.locations),
+        "failures": parser.locations,
+        "records": parser.records[:lim],
+        "clusters": cluster_records(parser.records, safe_base).summary(),
+        "stats": {"lines": parser.lines_seen, "bytes": parser.bytes_seen, "unique_paths": len(resolver)},
+    }
 
-        failures.append(item)
-        if len(failures) >= lim:
-            break
 
-    return {"ok": True, "count": len(failures), "failures": failures}
+CONTEXT_MODES = ("lines", "scope")
+MAX_BATCH_LOCATIONS = 200
 
 
-def open_context_impl(*, path: str, line: int, radius: int, base_dir: str, root_dir: Path) -> Dict[str, Any]:
+def _resolve_context_file(path: str, base_dir: str, root_dir: Path) -> Tuple[Optional[Path], str]:
     raw = (path or "").strip()
     if raw == "":
-        return {"ok": False, "error": "path is empty"}
+        return None, "path is empty"
 
     try:
         p = Path(raw).expanduser()
@@ -83,20 +94,59 @@ def open_context_impl(*, path: str, line: int, radius: int, base_dir: str, root_
         else:
             file_path = safe_path(raw, root_dir=root_dir)
     except Exception as e:
-        return {"ok": False, "error": str(e)}
+        return None, str(e)
 
     if not file_path.exists() or not file_path.is_file():
-        return {"ok": False, "error": f"file not found: {path}"}
+        return None, f"file not found: {path}"
+    return file_path, ""
+
+
+def _trim_to_budget(texts: List[str], start: int, focus: int, max_bytes: int) -> Tuple[int, int]:
+    # Grow outward from the focus line, alternating below/above, while the window fits.
+    i = focus - start
+    lo, hi = i, i
+    used = len(texts[i].encode("utf-8")) + 1
+    while True:
+        grew = False
+        for j in (hi + 1, lo - 1):
+            if 0 <= j < len(texts) and not lo <= j <= hi:
+                cost = len(texts[j].encode("utf-8")) + 1
+                if used + cost > max_bytes:
+                    continue
+                used += cost
+                lo, hi = min(lo, j), max(hi, j)
+                grew = True
+        if not grew:
+            return start + lo, start + hi
+
 
-    r = max(5, min(int(radius), 120))
+def open_context_impl(
+    *,
+    path: str,
+    line: int,
+    radius: int,
+    base_dir: str,
+    root_dir: Path,
+    mode: str = "lines",
+    include_callees: bool = False,
+    max_bytes: int = 0,
+) -> Dict[str, Any]:
+    if mode not in CONTEXT_MODES:
+        return {"ok": False, "error": f"unknown mode: {mode!r} (expected one of {', '.join(CONTEXT_MODES)})"}
+
+    file_path, err = _resolve_context_file(path, base_dir, root_dir)
+    if file_path is None:
+        return {"ok": False, "error": err}
+
+    r = max(MIN_RADIUS, min(int(radius), MAX_RADIUS))
 
     try:
-        content = file_path.read_text(encoding="utf-8", errors="replace")
+        index, _ = get_file_cache().get(str(file_path))
+        line_count = index.line_count
     except Exception as e:
         return {"ok": False, "error": f"failed reading file: {e}"}
 
-    lines = content.splitlines()
-    if not lines:
+    if line_count == 0:
         return {"ok": False, "error": "file is empty"}
 
     try:
@@ -104,11 +154,40 @@ def open_context_impl(*, path: str, line: int, radius: int, base_dir: str, root_
     except Exception:
         focus = 1
 
-    focus = max(1, min(focus, len(lines)))
+    focus = max(1, min(focus, line_count))
     start = max(1, focus - r)
-    end = min(len(lines), focus + r)
+    end = min(line_count, focus + r)
+
+    extra: Dict[str, Any] = {}
+    scope_index = None
+    if mode == "scope":
+        try:
+            scope_index = get_scope_cache().get(str(file_path))
+            scope = scope_index.enclosing(focus)
+        except (SyntaxError, ValueError, OSError) as e:
+            scope = None
+            extra["scope_error"] = f"{type(e).__name__}: {e}"
+        extra["scope"] = scope
+        if scope is not None:
+            # Module-level focus keeps the radius window.
+            start, end = scope["start"], min(line_count, scope["end"])
+
+    try:
+        texts = index.window(start, end)
+    except Exception as e:
+        return {"ok": False, "error": f"failed reading file: {e}"}
 
-    window = [{"line": i, "text": lines[i - 1]} for i in range(start, end + 1)]
+    if max_bytes > 0:
+        new_start, new_end = _trim_to_budget(texts, start, focus, int(max_bytes))
+        if (new_start, new_end) != (start, end):
+            texts = texts[new_start - start : new_end - start + 1]
+            start, end = new_start, new_end
+            extra["truncated"] = True
+
+    if include_callees and scope_index is not None:
+        extra["callees"] = callee_signatures(scope_index, start, end, root_dir)
+
+    window = [{"line": i, "text": t} for i, t in zip(range(start, end + 1), texts)]
 
     return {
         "ok": True,
@@ -117,4 +196,78 @@ def open_context_impl(*, path: str, line: int, radius: int, base_dir: str, root_
         "start_line": start,
         "end_line": end,
         "content": window,
+        **extra,
+    }
+
+
+def merge_windows(windows: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+    # (start, end, focus) tuples -> sorted ranges where overlapping or adjacent windows are joined.
+    ranges: List[Dict[str, Any]] = []
+    for start, end, focus in sorted(windows):
+        if ranges and start <= ranges[-1]["end_line"] + 1:
+            last = ranges[-1]
+            last["end_line"] = max(last["end_line"], end)
+            if focus not in last["focus_lines"]:
+                last["focus_lines"].append(focus)
+        else:
+            ranges.append({"start_line": start, "end_line": end, "focus_lines": [focus]})
+    for rng in ranges:
+        rng["focus_lines"].sort()
+    return ranges
+
+
+def open_contexts_impl(*, locations: List[Dict[str, Any]], base_dir: str, root_dir: Path) -> Dict[str, Any]:
+    if not locations:
+        return {"ok": False, "error": "locations is empty"}
+    if len(locations) > MAX_BATCH_LOCATIONS:
+        return {"ok": False, "error": f"too many locations (max {MAX_BATCH_LOCATIONS})"}
+
+    # Group by resolved file so every file is indexed once and its windows can be merged.
+    by_file: Dict[str, List[Tuple[int, int, int]]] = {}
+    mapping: List[Dict[str, Any]] = []
+    indexes: Dict[str, Any] = {}
+    for i, loc in enumerate(locations):
+        path = str(loc.get("path") or "")
+        file_path, err = _resolve_context_file(path, str(loc.get("base_dir") or base_dir), root_dir)
+        if file_path is None:
+            mapping.append({"index": i, "ok": False, "error": err})
+            continue
+        key = str(file_path)
+        try:
+            if key not in indexes:
+                indexes[key] = get_file_cache().get(key)[0]
+            line_count = indexes[key].line_count
+            focus = int(loc.get("line") or 1)
+            r = max(MIN_RADIUS, min(int(loc.get("radius", 25)), MAX_RADIUS))
+        except Exception as e:
+            mapping.append({"index": i, "ok": False, "error": f"failed reading file: {e}"})
+            continue
+        if line_count == 0:
+            mapping.append({"index": i, "ok": False, "error": "file is empty"})
+            continue
+        focus = max(1, min(focus, line_count))
+        by_file.setdefault(key, []).append((max(1, focus - r), min(line_count, focus + r), focus))
+        mapping.append({"index": i, "ok": True, "path": key, "focus_line": focus})
+
+    files: List[Dict[str, Any]] = []
+    lines_returned = 0
+    for key, windows in by_file.items():
+        ranges = merge_windows(windows)
+        try:
+            for rng in ranges:
+                texts = indexes[key].window(rng["start_line"], rng["end_line"])
+                rng["content"] = [{"line": n, "text": t} for n, t in zip(range(rng["start_line"], rng["end_line"] + 1), texts)]
+                lines_returned += len(rng["content"])
+        except Exception as e:
+            files.append({"path": key, "ok": False, "error": f"failed reading file: {e}"})
+            continue
+        files.append({"path": key, "ok": True, "ranges": ranges})
+
+    requested = sum(e - s + 1 for ws in by_file.values() for s, e, _ in ws)
+    return {
+        "ok": True,
+        "files": files,
+        "locations": mapping,
+        "lines_returned": lines_returned,
+        "lines_requested": requested,
     }
@@ -0,0 +1,179 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PLUGIN_MODULE = "debug_companion.pytest_plugin"
+# Keep in sync with pytest_plugin (not imported here so the server does not import pytest).
+REPORT_ENV = "DEBUG_COMPANION_REPORT"
+SELECT_ENV = "DEBUG_COMPANION_SELECT"
+PLAN_ENV = "DEBUG_COMPANION_PLAN"
+OUTPUT_ENV = "DEBUG_COMPANION_OUTPUT"
+CLUSTERS_ENV = "DEBUG_COMPANION_MAX_CLUSTERS"
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+MAX_RECORDS = 500
+
+
+def plugin_args() -> List[str]:
+    return ["-p", PLUGIN_MODULE]
+
+
+def new_report_path() -> str:
+    fd, path = tempfile.mkstemp(prefix="dc-report-", suffix=".jsonl")
+    os.close(fd)
+    return path
+
+
+def plugin_env(env: Dict[str, str], report_path: str) -> Dict[str, str]:
+    # The plugin must be importable from projects outside the server root.
+    out = dict(env)
+    out[REPORT_ENV] = report_path
+    pp = out.get("PYTHONPATH", "")
+    parts = pp.split(os.pathsep) if pp else []
+    if str(PACKAGE_ROOT) not in parts:
+        out["PYTHONPATH"] = os.pathsep.join([str(PACKAGE_ROOT), *parts])
+    return out
+
+
+def read_report(path: str, max_records: int = MAX_RECORDS, event: str = "failure") -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # partial last line of a killed run
+                if rec.get("event") == event and len(records) < max_records:
+                    records.append(rec)
+    except OSError:
+        return []
+    return records
+
+
+def write_selection(node_ids: List[str]) -> str:
+    fd, path = tempfile.mkstemp(prefix="dc-select-", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for nid in node_ids:
+            f.write(nid + "\n")
+    return path
+
+
+class ReportTailer:
+    # Incrementally reads complete JSON lines appended to a report file by a running pytest.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pos = 0
+        self._partial = b""
+
+    def poll(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._pos)
+                data = f.read()
+        except OSError:
+            return []
+        if not data:
+            return []
+        self._pos += len(data)
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        out: List[Dict[str, Any]] = []
+        for raw in lines:
+            if not raw.strip():
+                continue
+            try:
+                out.append(json.loads(raw))
+            except ValueError:
+                continue
+        return out
+
+
+def discard_report(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def is_project_frame(frame_path: str, project_dir: Optional[Path]) -> bool:
+    if "site-packages" in frame_path or "dist-packages" in frame_path:
+        return False
+    if project_dir is None:
+        return True
+    p = Path(frame_path)
+    return project_dir == p or project_dir in p.parents
+
+
+def project_frames(record: Dict[str, Any], project_dir: Optional[Path]) -> List[Dict[str, Any]]:
+    return [fr for fr in record.get("frames") or [] if is_project_frame(str(fr.get("path") or ""), project_dir)]
+
+
+def focus_frame(record: Dict[str, Any], project_dir: Optional[Path]) -> Optional[Dict[str, Any]]:
+    # Innermost frame that belongs to the project; falls back to the innermost frame.
+    frames = record.get("frames") or []
+    for fr in reversed(frames):
+        if is_project_frame(str(fr.get("path") or ""), project_dir):
+            return fr
+    return frames[-1] if frames else None
+
+
+def format_record(record: Dict[str, Any]) -> str:
+    lines = [f"{record.get('nodeid')} ({record.get('when')}) - {record.get('exc_type')}: {record.get('message')}"]
+    for fr in record.get("frames") or []:
+        lines.append(f"  {fr.get('path')}:{fr.get('line')} in {fr.get('function')}")
+    return "\n".join(lines)
+
+
+def failures_from_records(
+    *,
+    records: List[Dict[str, Any]],
+    limit: int,
+    root_dir: Path,
+    project_dir: str,
+) -> Dict[str, Any]:
+    from debug_companion.context_tools import open_context_location  # keeps the server's startup import light
+
+    lim = max(1, min(int(limit), 50))
+    proj: Optional[Path] = None
+    if project_dir.strip():
+        try:
+            proj = Path(project_dir).resolve()
+        except Exception:
+            proj = None
+
+    failures: List[Dict[str, Any]] = []
+    for rec in records:
+        fr = focus_frame(rec, proj)
+        if fr is None:
+            continue
+        abs_path = Path(str(fr["path"]))
+        item: Dict[str, Any] = {
+            "path": abs_path.as_posix(),
+            "line": int(fr.get("line") or 1),
+            "function": fr.get("function"),
+            "resolved_path": str(abs_path),
+            "nodeid": rec.get("nodeid"),
+            "when": rec.get("when"),
+            "exc_type": rec.get("exc_type"),
+            "message": rec.get("message"),
+            "frames": rec.get("frames") or [],
+            "duration": rec.get("duration"),
+            "source": "plugin",
+        }
+        try:
+            item.update(open_context_location(abs_path, root_dir))
+        except Exception:
+            item["path_for_open_context"] = str(abs_path)
+            item["open_context_base_dir"] = ""
+        failures.append(item)
+        if len(failures) >= lim:
+            break
+
+    return {"ok": True, "count": len(failures), "failures": failures, "source": "plugin"}
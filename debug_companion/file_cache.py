@@ -0,0 +1,167 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.metrics import incr, span
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Files below this size are kept in memory; larger ones keep only their line index and serve
+# windows with pread, so a window costs only the bytes in the window.
+INLINE_MAX_BYTES = 64 * 1024
+# Separators str.splitlines() honours besides \n and \r\n. Files containing any of them keep
+# their decoded lines so windows stay identical to read_text().splitlines().
+_EXOTIC_RE = re.compile(rb"[\x0b\x0c\x1c-\x1e]|\r(?!\n)|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+
+class LineIndex:
+    def __init__(self, path: str, st: os.stat_result):
+        self.path = path
+        self.key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self.size = st.st_size
+        self.data: Optional[bytes] = None
+        self.lines: Optional[List[str]] = None
+        self.starts = array("Q")
+        self._build()
+
+    def _build(self) -> None:
+        if self.size == 0:
+            return
+        with open(self.path, "rb") as f:
+            if self.size <= INLINE_MAX_BYTES:
+                buf: Any = f.read()
+                self.size = len(buf)
+                self.data = buf
+            else:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.size = len(buf)
+        try:
+            if _EXOTIC_RE.search(buf):
+                self.lines = bytes(buf).decode("utf-8", errors="replace").splitlines()
+                self.data = None
+                return
+            starts = self.starts
+            starts.append(0)
+            find = buf.find
+            pos = find(b"\n")
+            while pos != -1:
+                starts.append(pos + 1)
+                pos = find(b"\n", pos + 1)
+            if starts[-1] >= len(buf):
+                starts.pop()
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines) if self.lines is not None else len(self.starts)
+
+    @property
+    def nbytes(self) -> int:
+        n = self.starts.itemsize * len(self.starts) + 256
+        if self.data is not None:
+            n += len(self.data)
+        if self.lines is not None:
+            n += sum(len(x) for x in self.lines) + 56 * len(self.lines)
+        return n
+
+    def window(self, start: int, end: int) -> List[str]:
+        # 1-based inclusive line range, already clamped by the caller.
+        if self.lines is not None:
+            return self.lines[start - 1 : end]
+        lo = self.starts[start - 1]
+        hi = self.starts[end] if end < len(self.starts) else self.size
+        if self.data is not None:
+            raw = self.data[lo:hi]
+        else:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                raw = os.pread(fd, hi - lo, lo)
+            finally:
+                os.close(fd)
+        text = raw.decode("utf-8", errors="replace")
+        out = text.split("\n")
+        if text.endswith("\n"):
+            out.pop()
+        return [x[:-1] if x.endswith("\r") else x for x in out]
+
+
+class FileLineCache:
+    # LRU of per-file line indexes, validated by (inode, mtime_ns, size) on every lookup.
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> Tuple[LineIndex, bool]:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry.key == key:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    incr("file_cache.hits")
+                    return entry, True
+                self._drop(path)
+                self.invalidations += 1
+            self.misses += 1
+        incr("file_cache.misses")
+
+        with span("file.index"):
+            entry = LineIndex(path, st)
+        incr("file.bytes_read", entry.size)
+        with self._lock:
+            if path in self._entries:
+                self._drop(path)
+            self._entries[path] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return entry, False
+
+    def _drop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+_CACHE: Optional[FileLineCache] = None
+
+
+def get_file_cache() -> FileLineCache:
+    global _CACHE
+    if _CACHE is None:
+        raw = (os.environ.get("MCP_FILE_CACHE_MAX_MB") or "").strip()
+        _CACHE = FileLineCache(int(float(raw) * 1024 * 1024) if raw else DEFAULT_MAX_BYTES)
+    return _CACHE
@@ -0,0 +1,102 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.failure_records import is_project_frame
+
+# A failure's fingerprint hashes its exception type, its message with numbers and addresses
+# replaced by placeholders (first line only), and its innermost project frame. When a shared
+# helper breaks, every test that goes through it lands in one cluster, so debug_project opens
+# context for and analyzes one representative per cluster instead of one per test.
+
+MAX_MESSAGE_CHARS = 300
+MAX_CLUSTER_MEMBERS = 20
+
+_ADDRESS_RE = re.compile(r"\b0x[0-9a-fA-F]+\b")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_SPACE_RE = re.compile(r"\s+")
+# Text-parsed frames also carry where open_context finds them.
+_LOCATION_KEYS = ("path", "line", "function", "path_for_open_context", "open_context_base_dir")
+
+
+def normalize_message(message: Optional[str]) -> str:
+    first = next((x for x in str(message or "").splitlines() if x.strip()), "")
+    text = _NUMBER_RE.sub("<n>", _ADDRESS_RE.sub("<addr>", first))
+    return _SPACE_RE.sub(" ", text).strip()[:MAX_MESSAGE_CHARS]
+
+
+def _frame_path(fr: Dict[str, Any]) -> str:
+    # Text-parsed frames keep the spelling from the log; resolved_path is the absolute one.
+    return str(fr.get("resolved_path") or fr.get("path") or "")
+
+
+def innermost_frame(record: Dict[str, Any], project_dir: Optional[Path]) -> Optional[Dict[str, Any]]:
+    frames = record.get("frames") or []
+    for fr in reversed(frames):
+        if is_project_frame(_frame_path(fr), project_dir):
+            return fr
+    return frames[-1] if frames else None
+
+
+def fingerprint(record: Dict[str, Any], project_dir: Optional[Path]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    fr = innermost_frame(record, project_dir)
+    where = f"{_frame_path(fr)}:{fr.get('line')}:{fr.get('function') or ''}" if fr else ""
+    key = "\0".join([str(record.get("exc_type") or ""), normalize_message(record.get("message")), where])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16], fr
+
+
+class FailureClusters:
+    # Groups failure records (plugin or text-parsed) by fingerprint, in first-seen order.
+
+    def __init__(self, project_dir: Optional[Path] = None):
+        self.project_dir = project_dir
+        self._clusters: Dict[str, Dict[str, Any]] = {}
+        self.total = 0
+
+    def add(self, record: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        fp, fr = fingerprint(record, self.project_dir)
+        member = str(record.get("nodeid") or record.get("test") or "")
+        self.total += 1
+        cluster = self._clusters.get(fp)
+        if cluster is not None:
+            cluster["count"] += 1
+            if len(cluster["members"]) < MAX_CLUSTER_MEMBERS:
+                cluster["members"].append(member)
+            return cluster, False
+        cluster = {
+            "fingerprint": fp,
+            "count": 1,
+            "exc_type": record.get("exc_type"),
+            "message": normalize_message(record.get("message")),
+            "location": {k: fr[k] for k in _LOCATION_KEYS if fr.get(k) is not None} if fr else None,
+            "representative": member,
+            "members": [member],
+            "record": record,
+        }
+        self._clusters[fp] = cluster
+        return cluster, True
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def representatives(self) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        return [(c["record"], c) for c in self._clusters.values()]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [cluster_view(c) for c in self._clusters.values()]
+
+
+def cluster_view(cluster: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in cluster.items() if k != "record"}
+    out["members"] = list(cluster["members"])
+    if cluster["count"] > len(out["members"]):
+        out["members_omitted"] = cluster["count"] - len(out["members"])
+    return out
+
+
+def cluster_records(records: List[Dict[str, Any]], project_dir: Optional[Path] = None) -> FailureClusters:
+    clusters = FailureClusters(project_dir)
+    for rec in records:
+        clusters.add(rec)
+    return clusters
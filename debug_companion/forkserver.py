@@ -0,0 +1,216 @@
+import importlib
+import json
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+
+# Fork server process: imports pytest (and optional preload modules) once, then forks a
+# fresh child per request so every run starts from the warm interpreter state.
+# Protocol: one JSON object per line on stdin, one JSON reply per line on stdout. While a run is
+# in progress the only request honored is {"op": "kill", "id": <run id>}.
+
+WARM_MODULES = ("pytest", "_pytest.assertion.rewrite", "_pytest.python")
+
+
+def _write(msg: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(msg) + "\n")
+    sys.stdout.flush()
+
+
+class _Requests:
+    # Line reader over stdin that reads only what select() reports, so a kill sent during a run
+    # is seen while the server waits for the child (sys.stdin would buffer it out of reach).
+
+    def __init__(self, fd: int = 0):
+        self.fd = fd
+        self.eof = False
+        self._buf = b""
+
+    def fill(self) -> None:
+        chunk = os.read(self.fd, 65536)
+        if chunk:
+            self._buf += chunk
+        else:
+            self.eof = True
+
+    def has_line(self) -> bool:
+        return b"\n" in self._buf
+
+    def lines(self) -> List[str]:
+        *complete, self._buf = self._buf.split(b"\n")
+        return [x.decode("utf-8", errors="replace").strip() for x in complete]
+
+    def next_line(self) -> Optional[str]:
+        while not self.has_line():
+            if self.eof:
+                return None
+            self.fill()
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line.decode("utf-8", errors="replace").strip()
+
+
+def _module_files(names) -> List[str]:
+    files: List[str] = []
+    for name in names:
+        mod = sys.modules.get(name)
+        f = getattr(mod, "__file__", None) if mod is not None else None
+        if f and os.path.isfile(f):
+            files.append(os.path.abspath(f))
+    return sorted(set(files))
+
+
+def _preload(modules: List[str]) -> Dict[str, Any]:
+    before = set(sys.modules)
+    loaded: List[str] = []
+    errors: Dict[str, str] = {}
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+    new_modules = set(sys.modules) - before
+    return {"preloaded": loaded, "preload_errors": errors, "watch_files": _module_files(new_modules)}
+
+
+def _run_child(req: Dict[str, Any]) -> None:
+    import pytest
+
+    code = 3
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        out = os.open(req["output_path"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(devnull, 0)
+        os.dup2(out, 1)
+        os.dup2(out, 2)
+        os.close(devnull)
+        os.close(out)
+
+        cwd = req["cwd"]
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(req.get("env") or {})
+        if cwd not in sys.path:
+            sys.path.insert(0, cwd)
+        sys.argv = ["pytest", *req["args"]]
+
+        code = int(pytest.main(list(req["args"])))
+    except SystemExit as e:
+        code = int(e.code) if isinstance(e.code, int) else 3
+    except BaseException:
+        traceback.print_exc()
+        code = 3
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code)
+
+
+def _kill(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # The child may not have called setsid() yet.
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _kill_requested(requests: _Requests, run_id: Any) -> bool:
+    for line in requests.lines():
+        try:
+            msg = json.loads(line) if line else {}
+        except ValueError:
+            continue
+        if msg.get("op") == "kill" and msg.get("id") == run_id:
+            return True
+    # A manager that went away cannot collect the result either.
+    return requests.eof
+
+
+def _wait_child(pid: int, timeout: float, requests: _Requests, run_id: Any = None) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    pidfd: Optional[int] = None
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+
+    try:
+        while True:
+            done_pid, status = os.waitpid(pid, os.WNOHANG)
+            if done_pid == pid:
+                return {"exit_code": os.waitstatus_to_exitcode(status), "timed_out": False}
+
+            remaining = deadline - time.monotonic()
+            killed = (requests.has_line() or requests.eof) and _kill_requested(requests, run_id)
+            if remaining <= 0 or killed:
+                _kill(pid)
+                _, status = os.waitpid(pid, 0)
+                return {"exit_code": os.waitstatus_to_exitcode(status), "timed_out": not killed, "killed": killed}
+
+            fds = [requests.fd] + ([pidfd] if pidfd is not None else [])
+            ready, _, _ = select.select(fds, [], [], remaining if pidfd is not None else min(0.01, remaining))
+            if requests.fd in ready:
+                requests.fill()
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def main(argv: List[str]) -> int:
+    os.environ["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+
+    # Warm imports, inherited by every forked child.
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+
+    preload = [m.strip() for m in (argv[0] if argv else "").split(",") if m.strip()]
+    info = _preload(preload)
+    _write({"ready": True, "pid": os.getpid(), **info})
+
+    requests = _Requests()
+    while True:
+        line = requests.next_line()
+        if line is None:
+            break
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            _write({"ok": False, "error": f"bad request: {e}"})
+            continue
+
+        if req.get("op") == "shutdown":
+            break
+        if req.get("op") == "kill":
+            continue  # arrived after its run had already finished
+
+        started = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            _run_child(req)
+
+        res = _wait_child(pid, float(req.get("timeout") or 30), requests, req.get("id"))
+        _write({"ok": True, "pid": pid, "duration": time.monotonic() - started, **res})
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
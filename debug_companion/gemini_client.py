@@ -1,40 +1,152 @@
+import hashlib
 import os
-from typing import Any, Dict, Optional
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 
-try:
-    from google import genai  # pip install google-genai
-except ImportError:  # pragma: no cover
-    genai = None
+from debug_companion.cache_dir import get_cache_dir
+from debug_companion.metrics import incr, span
+from debug_companion.result_cache import ResultCache
 
+# google.genai (pip install google-genai) pulls in a large dependency tree, so it is imported on
+# the first real client creation rather than at module import. False marks a failed import.
+genai: Any = None
 
-def get_gemini_client(logger) -> Optional[Any]:
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_CACHE_TTL_SECONDS = 24 * 3600
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+_ADDR_RE = re.compile(r"0x[0-9a-fA-F]{6,}")
+_DURATION_RE = re.compile(r"\bin \d+(?:\.\d+)?s\b")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+
+_client_lock = threading.Lock()
+_client: Optional[Tuple[str, Any]] = None  # (backend/api key fingerprint, client)
+_response_cache: Optional[ResultCache] = None
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, *, model: str, contents: str) -> _FakeResponse:
+        # Deterministic local stand-in for the Gemini API (GEMINI_BACKEND=fake).
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(contents.encode("utf-8")).hexdigest()[:12]
+        first = next((ln.strip() for ln in contents.splitlines() if ln.strip().startswith(("E ", "FAILED"))), "")
+        return _FakeResponse(f"[fake {model} {digest}] The failure looks like: {first or 'see error message'}")
+
+    def generate_content_stream(self, *, model: str, contents: str) -> Iterator[_FakeResponse]:
+        text = self.generate_content(model=model, contents=contents).text
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            if self.latency > 0 and i:
+                time.sleep(self.latency / 4)
+            yield _FakeResponse(" ".join(words[i : i + 4]) + (" " if i + 4 < len(words) else ""))
+
+
+class FakeGeminiClient:
+    def __init__(self, latency: float = 0.0):
+        self.models = _FakeModels(latency)
+
+
+def _backend() -> str:
+    return (os.environ.get("GEMINI_BACKEND") or "gemini").strip().lower()
+
+
+def _load_genai() -> Optional[Any]:
+    global genai
     if genai is None:
-        return None
+        try:
+            from google import genai as module
+        except ImportError:
+            module = False
+        genai = module
+    return genai or None
 
+
+def _client_fingerprint() -> Optional[str]:
+    # Identifies the configured backend (and API key); None when no usable backend is configured.
+    if _backend() == "fake":
+        return "fake:" + (os.environ.get("GEMINI_FAKE_LATENCY_MS") or "0").strip()
     api_key = (os.environ.get("GEMINI_API_KEY") or "").strip()
-    if not api_key:
+    if not api_key or _load_genai() is None:
         return None
+    return "gemini:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()
 
-    try:
-        return genai.Client(api_key=api_key)
-    except Exception as e:
-        logger.warning("Failed to init Gemini client: %s", e)
+
+def get_gemini_client(logger) -> Optional[Any]:
+    # One client per process (re-created only when the backend or API key changes), so the
+    # HTTP connection pool is reused across calls.
+    global _client
+    fingerprint = _client_fingerprint()
+    if fingerprint is None:
         return None
 
+    with _client_lock:
+        if _client is not None and _client[0] == fingerprint:
+            return _client[1]
+        try:
+            if fingerprint.startswith("fake:"):
+                client: Any = FakeGeminiClient(latency=float(fingerprint.split(":", 1)[1] or 0) / 1000.0)
+            else:
+                client = _load_genai().Client(api_key=(os.environ.get("GEMINI_API_KEY") or "").strip())
+        except Exception as e:
+            logger.warning("Failed to init Gemini client: %s", e)
+            return None
+        _client = (fingerprint, client)
+        return client
+
+
+def reset_gemini_client() -> None:
+    global _client
+    with _client_lock:
+        _client = None
 
-def analyze_error_with_gemini_impl(
-    *,
-    logger,
-    error_message: str,
-    code_context: str,
-) -> Dict[str, Any]:
-    client = get_gemini_client(logger)
-    if client is None:
-        return {"ok": False, "error": "Gemini API Key not configured or client init failed"}
 
-    model_name = (os.environ.get("GEMINI_MODEL") or "gemini-2.5-flash").strip()
+def normalize_prompt(prompt: str) -> str:
+    # Only used for the cache key: run-specific noise (object addresses, timings, whitespace)
+    # must not make an identical failure miss the cache.
+    text = prompt.replace("\r\n", "\n")
+    text = "\n".join(ln.rstrip() for ln in text.split("\n"))
+    text = _ADDR_RE.sub("0x?", text)
+    text = _DURATION_RE.sub("in ?s", text)
+    return _BLANK_RUN_RE.sub("\n\n", text).strip()
 
-    prompt = f"""
+
+def prompt_cache_key(model_name: str, prompt: str, backend: str = "") -> str:
+    # backend is the client fingerprint, so answers from one backend (e.g. fake) or API key are
+    # never served for another.
+    raw = f"{backend}\0{model_name}\0{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_ttl() -> float:
+    raw = (os.environ.get("GEMINI_CACHE_TTL_SECONDS") or "").strip()
+    return float(raw) if raw else float(DEFAULT_CACHE_TTL_SECONDS)
+
+
+def get_response_cache() -> ResultCache:
+    global _response_cache
+    directory = get_cache_dir("llm")
+    if _response_cache is None or _response_cache.directory != directory:
+        raw = (os.environ.get("GEMINI_CACHE_MAX_MB") or "").strip()
+        max_bytes = int(float(raw) * 1024 * 1024) if raw else DEFAULT_CACHE_MAX_BYTES
+        _response_cache = ResultCache(directory, max_bytes=max_bytes)
+    return _response_cache
+
+
+def build_prompt(error_message: str, code_context: str) -> str:
+    return f"""
 I have a Python test failure.
 
 Error message:
@@ -46,11 +158,82 @@ Code context:
 Please explain why this error is happening and suggest a fix.
 """.strip()
 
+
+def _lookup(backend: str, model_name: str, prompt: str) -> Tuple[str, float, Optional[Dict[str, Any]]]:
+    ttl = _cache_ttl()
+    key = prompt_cache_key(model_name, prompt, backend)
+    if ttl > 0:
+        entry = get_response_cache().get(key)
+        if entry is not None:
+            age = time.time() - float(entry.get("stored_at") or 0)
+            if age <= ttl:
+                cached = dict(entry.get("result") or {})
+                cached["cache"] = {"key": key[:16], "hit": True, "age_seconds": round(age, 3)}
+                return key, ttl, cached
+    return key, ttl, None
+
+
+def _store(key: str, ttl: float, res: Dict[str, Any]) -> Dict[str, Any]:
+    if ttl > 0:
+        try:
+            get_response_cache().put(key, res)
+        except OSError:
+            pass
+    return {**res, "cache": {"key": key[:16], "hit": False}}
+
+
+def analyze_error_with_gemini_impl(
+    *,
+    logger,
+    error_message: str,
+    code_context: str,
+    on_chunk: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    # With on_chunk, the response is generated in streaming mode and every text chunk is passed
+    # to on_chunk as it arrives; the assembled text is still returned at the end.
+    model_name = (os.environ.get("GEMINI_MODEL") or DEFAULT_MODEL).strip()
+    prompt = build_prompt(error_message, code_context)
+
+    fingerprint = _client_fingerprint()
+    if fingerprint is None:
+        return {"ok": False, "error": "Gemini API Key not configured or client init failed"}
+
+    key, ttl, cached = _lookup(fingerprint, model_name, prompt)
+    incr("llm.cache_hits" if cached is not None else "llm.cache_misses")
+    if cached is not None:
+        if on_chunk is not None and cached.get("analysis"):
+            on_chunk(cached["analysis"])
+        return cached
+
+    client = get_gemini_client(logger)
+    if client is None:
+        return {"ok": False, "error": "Gemini API Key not configured or client init failed"}
+
+    incr("llm.calls")
     try:
+        with span("llm.generate_stream" if on_chunk is not None else "llm.generate"):
+            text = _generate(client, model_name, prompt, on_chunk)
+    except Exception as e:
+        incr("llm.errors")
+        return {"ok": False, "error": str(e), "cache": {"key": key[:16], "hit": False}}
+
+    res: Dict[str, Any] = {"ok": True, "analysis": text, "model": model_name}
+    if on_chunk is not None:
+        res["streamed"] = True
+    return _store(key, ttl, res)
+
+
+def _generate(client: Any, model_name: str, prompt: str, on_chunk: Optional[Callable[[str], None]]) -> str:
+    if on_chunk is None:
         response = client.models.generate_content(
             model=model_name,
             contents=prompt,
         )
-        return {"ok": True, "analysis": response.text}
-    except Exception as e:
-        return {"ok": False, "error": str(e)}
+        return response.text
+    parts = []
+    for chunk in client.models.generate_content_stream(model=model_name, contents=prompt):
+        piece = getattr(chunk, "text", None) or ""
+        if piece:
+            parts.append(piece)
+            on_chunk(piece)
+    return "".join(parts)
@@ -0,0 +1,352 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.cache_dir import get_cache_dir
+from debug_companion.metrics import incr, span
+
+# Every run's per-test outcomes and durations go to <cache>/history/history.sqlite3: one row per
+# test per run (the newest MAX_RUNS runs of each project are kept) plus a per-test aggregate
+# (run/failure/flip counts, moving-average duration) that ordering, time budgets, sharding and
+# the run_history tool read. Runs only enqueue their results; one writer thread stores
+# whatever has queued up in a single transaction.
+
+DB_NAME = "history.sqlite3"
+MAX_RUNS = 200
+# Weight of the newest observation in the moving-average duration.
+ALPHA = 0.5
+DEFAULT_TEST_SECONDS = 0.1
+DEFAULT_OVERHEAD_SECONDS = 1.0
+OVERHEAD_RUNS = 5
+FLUSH_SECONDS = 2.0
+
+# Ordering classes, most valuable first: failed in its last run, flipped between pass and
+# fail before, never run, everything else. Within a class the fastest test goes first.
+FAILED, FLAKY, NEW, STABLE = 0, 1, 2, 3
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    target TEXT,
+    finished REAL NOT NULL,
+    wall_seconds REAL,
+    test_seconds REAL NOT NULL,
+    tests INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    exit_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_project ON runs (project, id);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (run_id, nodeid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tests (
+    project TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    flips INTEGER NOT NULL,
+    last_outcome TEXT NOT NULL,
+    last_run INTEGER NOT NULL,
+    avg_duration REAL NOT NULL,
+    max_duration REAL NOT NULL,
+    PRIMARY KEY (project, nodeid)
+) WITHOUT ROWID;
+"""
+
+# Skipped runs say nothing about a test's duration or stability.
+_UPSERT = """
+INSERT INTO tests (project, nodeid, runs, failures, flips, last_outcome, last_run, avg_duration, max_duration)
+VALUES (:project, :nodeid, 1, :failed, 0, :outcome, :run_id, :duration, :duration)
+ON CONFLICT (project, nodeid) DO UPDATE SET
+    runs = runs + 1,
+    failures = failures + excluded.failures,
+    flips = flips + (excluded.last_outcome IN ('passed', 'failed') AND last_outcome IN ('passed', 'failed')
+                     AND excluded.last_outcome != last_outcome),
+    last_outcome = CASE WHEN excluded.last_outcome = 'skipped' THEN last_outcome ELSE excluded.last_outcome END,
+    last_run = excluded.last_run,
+    avg_duration = CASE WHEN excluded.last_outcome = 'skipped' THEN avg_duration
+                        ELSE :alpha * excluded.avg_duration + (1 - :alpha) * avg_duration END,
+    max_duration = MAX(max_duration, excluded.max_duration)
+"""
+
+
+def history_path() -> Path:
+    return get_cache_dir("history") / DB_NAME
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=10)
+    conn.executescript(_SCHEMA)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _write_batch(conn: sqlite3.Connection, batch: List[Dict[str, Any]]) -> int:
+    rows = 0
+    with conn:
+        for run in batch:
+            tests = run["tests"]
+            cur = conn.execute(
+                "INSERT INTO runs (project, target, finished, wall_seconds, test_seconds, tests, failed, exit_code)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run["project"],
+                    run["target"],
+                    run["finished"],
+                    run["wall_seconds"],
+                    sum(t["duration"] for t in tests),
+                    len(tests),
+                    sum(1 for t in tests if t["outcome"] == "failed"),
+                    run["exit_code"],
+                ),
+            )
+            run_id = cur.lastrowid
+            conn.executemany(
+                "INSERT OR REPLACE INTO results (run_id, nodeid, outcome, duration) VALUES (?, ?, ?, ?)",
+                [(run_id, t["nodeid"], t["outcome"], t["duration"]) for t in tests],
+            )
+            conn.executemany(
+                _UPSERT,
+                [
+                    {
+                        "project": run["project"],
+                        "nodeid": t["nodeid"],
+                        "failed": int(t["outcome"] == "failed"),
+                        "outcome": t["outcome"],
+                        "run_id": run_id,
+                        "duration": t["duration"],
+                        "alpha": ALPHA,
+                    }
+                    for t in tests
+                ],
+            )
+            rows += len(tests)
+        for project in {run["project"] for run in batch}:
+            _prune(conn, project)
+    return rows
+
+
+def _prune(conn: sqlite3.Connection, project: str) -> None:
+    row = conn.execute(
+        "SELECT id FROM runs WHERE project = ? ORDER BY id DESC LIMIT 1 OFFSET ?", (project, MAX_RUNS - 1)
+    ).fetchone()
+    if row is None:
+        return
+    oldest = row[0]
+    conn.execute("DELETE FROM results WHERE run_id IN (SELECT id FROM runs WHERE project = ? AND id < ?)", (project, oldest))
+    conn.execute("DELETE FROM runs WHERE project = ? AND id < ?", (project, oldest))
+    # Tests that did not run in any kept run (renamed or deleted) drop out of the aggregate too.
+    conn.execute("DELETE FROM tests WHERE project = ? AND last_run < ?", (project, oldest))
+
+
+class _Writer:
+    # One daemon thread drains the queue; everything queued at that point is one transaction.
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.errors = 0
+
+    def submit(self, path: Path, run: Dict[str, Any]) -> None:
+        self._ensure_thread()
+        self._queue.put((str(path), run))
+
+    def flush(self, timeout: float = FLUSH_SECONDS) -> bool:
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(("", done))
+        return done.wait(timeout)
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="test-history", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_path: Dict[str, List[Dict[str, Any]]] = {}
+            waiters: List[threading.Event] = []
+            for path, item in items:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    by_path.setdefault(path, []).append(item)
+            for path, batch in by_path.items():
+                try:
+                    with span("history.write"):
+                        conn = _connect(Path(path))
+                        try:
+                            incr("history.rows", _write_batch(conn, batch))
+                        finally:
+                            conn.close()
+                    self.batches += 1
+                except (sqlite3.Error, OSError):
+                    self.errors += 1
+            for ev in waiters:
+                ev.set()
+
+
+_WRITER = _Writer()
+atexit.register(_WRITER.flush)
+
+
+def record_run(
+    project_dir: str,
+    tests: List[Dict[str, Any]],
+    *,
+    target: str = "",
+    exit_code: Optional[int] = None,
+    wall_seconds: Optional[float] = None,
+) -> None:
+    clean = [
+        {"nodeid": str(t["nodeid"]), "outcome": str(t.get("outcome") or "passed"), "duration": float(t.get("duration") or 0.0)}
+        for t in tests
+        if t.get("nodeid")
+    ]
+    if not clean:
+        return
+    _WRITER.submit(
+        history_path(),
+        {
+            "project": project_dir,
+            "target": target,
+            "finished": time.time(),
+            "wall_seconds": wall_seconds,
+            "exit_code": exit_code,
+            "tests": clean,
+        },
+    )
+
+
+def flush(timeout: float = FLUSH_SECONDS) -> bool:
+    return _WRITER.flush(timeout)
+
+
+def _query(sql: str, args: Tuple[Any, ...]) -> List[sqlite3.Row]:
+    # Readers first wait for queued writes so a run is visible to the next call.
+    flush()
+    path = history_path()
+    if not path.exists():
+        return []
+    conn = _connect(path)
+    try:
+        conn.row_factory = sqlite3.Row
+        return conn.execute(sql, args).fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+
+
+def load_durations(project_dir: str) -> Dict[str, float]:
+    rows = _query("SELECT nodeid, avg_duration FROM tests WHERE project = ?", (project_dir,))
+    return {r["nodeid"]: float(r["avg_duration"]) for r in rows}
+
+
+def _test_classes(project_dir: str) -> Dict[str, Tuple[int, float]]:
+    rows = _query("SELECT nodeid, last_outcome, flips, avg_duration FROM tests WHERE project = ?", (project_dir,))
+    out: Dict[str, Tuple[int, float]] = {}
+    for r in rows:
+        cls = FAILED if r["last_outcome"] == "failed" else FLAKY if r["flips"] else STABLE
+        out[r["nodeid"]] = (cls, round(float(r["avg_duration"]), 6))
+    return out
+
+
+def startup_overhead(project_dir: str) -> float:
+    # Wall time of recent runs not spent in tests: interpreter start, imports, collection.
+    rows = _query(
+        "SELECT wall_seconds - test_seconds AS overhead FROM runs"
+        " WHERE project = ? AND wall_seconds IS NOT NULL ORDER BY id DESC LIMIT ?",
+        (project_dir, OVERHEAD_RUNS),
+    )
+    values = [max(0.0, float(r["overhead"])) for r in rows]
+    return statistics.median(values) if values else DEFAULT_OVERHEAD_SECONDS
+
+
+def write_plan(project_dir: str, *, budget_seconds: float = 0.0) -> Tuple[str, Dict[str, Any]]:
+    # Plan file for the pytest plugin: per-test class and expected duration, the duration of
+    # tests without history, and how many test seconds fit in the budget (0 = order only).
+    tests = _test_classes(project_dir)
+    known = [d for _, d in tests.values()]
+    default = statistics.median(known) if known else DEFAULT_TEST_SECONDS
+    info: Dict[str, Any] = {"known_tests": len(tests), "default_seconds": round(default, 6)}
+    budget = 0.0
+    if budget_seconds > 0:
+        overhead = startup_overhead(project_dir)
+        # A budget smaller than the overhead still runs the single most valuable test.
+        budget = max(1e-6, float(budget_seconds) - overhead)
+        info.update({"budget_seconds": float(budget_seconds), "overhead_seconds": round(overhead, 3)})
+    fd, path = tempfile.mkstemp(prefix="dc-plan-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"budget": budget, "default": default, "new": NEW, "tests": tests}, f)
+    return path, info
+
+
+def _summary_row(r: sqlite3.Row) -> Dict[str, Any]:
+    runs = int(r["runs"])
+    return {
+        "nodeid": r["nodeid"],
+        "runs": runs,
+        "failures": int(r["failures"]),
+        "flips": int(r["flips"]),
+        "flip_rate": round(int(r["flips"]) / (runs - 1), 3) if runs > 1 else 0.0,
+        "last_outcome": r["last_outcome"],
+        "avg_seconds": round(float(r["avg_duration"]), 4),
+        "max_seconds": round(float(r["max_duration"]), 4),
+    }
+
+
+def history_summary(project_dir: str, limit: int = 10) -> Dict[str, Any]:
+    limit = max(1, min(int(limit), 200))
+    cols = "nodeid, runs, failures, flips, last_outcome, avg_duration, max_duration"
+    slowest = _query(f"SELECT {cols} FROM tests WHERE project = ? ORDER BY avg_duration DESC LIMIT ?", (project_dir, limit))
+    # Flakiest: most pass<->fail flips relative to the runs they had a chance to flip in.
+    flakiest = _query(
+        f"SELECT {cols} FROM tests WHERE project = ? AND flips > 0"
+        " ORDER BY CAST(flips AS REAL) / MAX(runs - 1, 1) DESC, flips DESC, runs DESC LIMIT ?",
+        (project_dir, limit),
+    )
+    failing = _query(
+        f"SELECT {cols} FROM tests WHERE project = ? AND last_outcome = 'failed' ORDER BY avg_duration LIMIT ?",
+        (project_dir, limit),
+    )
+    runs = _query(
+        "SELECT id, target, finished, wall_seconds, test_seconds, tests, failed, exit_code FROM runs"
+        " WHERE project = ? ORDER BY id DESC LIMIT ?",
+        (project_dir, min(limit, 20)),
+    )
+    counts = _query("SELECT COUNT(*) AS tests FROM tests WHERE project = ?", (project_dir,))
+    return {
+        "ok": True,
+        "project": project_dir,
+        "tests": int(counts[0]["tests"]) if counts else 0,
+        "recent_runs": [dict(r) for r in runs],
+        "slowest": [_summary_row(r) for r in slowest],
+        "flakiest": [_summary_row(r) for r in flakiest],
+        "failing": [_summary_row(r) for r in failing],
+    }
+
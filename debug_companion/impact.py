@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from debug_companion.cache_dir import get_cache_dir
+from debug_companion.failure_records import SELECT_ENV, discard_report, read_report, write_selection
+from debug_companion.pytest_runner import MAX_TEST_EVENTS, execute_run_async, finish_run, prepare_run
+from debug_companion.result_cache import CONFIG_NAMES, SKIP_DIRS
+from debug_companion.sharding import collect_node_ids
+
+COVERAGE_ENV = "DEBUG_COMPANION_COVERAGE"  # keep in sync with pytest_plugin.COVERAGE_ENV
+MODES = ("mtime", "git")
+MAX_REPORTED_TESTS = 200
+MAX_REASONS_PER_TEST = 5
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+# Map file layout: {"tests": {nodeid: {relpath: [lines]}}, "files": {relpath: [mtime_ns, size]}}
+
+
+def _map_path(project_dir: str, target: str) -> Path:
+    digest = hashlib.sha1(f"{project_dir}\0{target}".encode("utf-8")).hexdigest()[:16]
+    return get_cache_dir("impact") / f"{digest}.json"
+
+
+def load_coverage_map(project_dir: str, target: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_map_path(project_dir, target), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_coverage_map(project_dir: str, target: str, cov_map: Dict[str, Any]) -> None:
+    path = _map_path(project_dir, target)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cov_map, f)
+    os.replace(tmp, path)
+
+
+def snapshot_files(project_dir: str) -> Dict[str, List[int]]:
+    out: Dict[str, List[int]] = {}
+    root = Path(project_dir)
+    for dirpath, dirnames, filenames in os.walk(project_dir):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".")]
+        for name in filenames:
+            if not (name.endswith(".py") or name in CONFIG_NAMES):
+                continue
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            out[Path(full).relative_to(root).as_posix()] = [st.st_mtime_ns, st.st_size]
+    return out
+
+
+def changed_by_mtime(project_dir: str, cov_map: Dict[str, Any]) -> Dict[str, Optional[Set[int]]]:
+    # File-level granularity: value None means "the whole file changed".
+    old = cov_map.get("files") or {}
+    new = snapshot_files(project_dir)
+    changed: Dict[str, Optional[Set[int]]] = {}
+    for rel, key in new.items():
+        if old.get(rel) != key:
+            changed[rel] = None
+    for rel in old:
+        if rel not in new:
+            changed[rel] = None
+    return changed
+
+
+def parse_git_diff(diff_text: str) -> Dict[str, Optional[Set[int]]]:
+    # Old-side line numbers, which is what the recorded coverage map refers to.
+    changed: Dict[str, Optional[Set[int]]] = {}
+    current: Optional[str] = None
+    for line in diff_text.splitlines():
+        if line.startswith("--- "):
+            old = line[4:].strip()
+            current = old[2:] if old.startswith("a/") else None
+        elif line.startswith("+++ "):
+            new = line[4:].strip()
+            if current is None and new.startswith("b/"):
+                changed[new[2:]] = None  # new file
+                current = None
+            elif current is not None:
+                changed.setdefault(current, set())
+        elif current is not None and line.startswith("@@"):
+            m = _HUNK_RE.match(line)
+            if not m:
+                continue
+            start = int(m.group(1))
+            count = int(m.group(2)) if m.group(2) is not None else 1
+            lines = changed.setdefault(current, set())
+            if lines is None:
+                continue
+            if count == 0:
+                # Pure insertion after `start`: the neighbouring lines are the closest covered code.
+                lines.update({start, start + 1})
+            else:
+                lines.update(range(start, start + count))
+    return changed
+
+
+def changed_by_git(project_dir: str) -> Tuple[Dict[str, Optional[Set[int]]], str]:
+    try:
+        diff = subprocess.run(
+            ["git", "diff", "-U0", "--no-color", "--relative", "HEAD", "--", "."],
+            cwd=project_dir,
+            capture_output=True,
+            text=True,
+            timeout=30,
+            stdin=subprocess.DEVNULL,
+        )
+        untracked = subprocess.run(
+            ["git", "ls-files", "--others", "--exclude-standard"],
+            cwd=project_dir,
+            capture_output=True,
+            text=True,
+            timeout=30,
+            stdin=subprocess.DEVNULL,
+        )
+    except Exception as e:
+        return {}, f"git failed: {e}"
+    if diff.returncode != 0:
+        return {}, f"git diff failed: {(diff.stderr or '').strip()}"
+
+    changed = parse_git_diff(diff.stdout or "")
+    for rel in (untracked.stdout or "").splitlines():
+        rel = rel.strip()
+        if rel.endswith(".py") or Path(rel).name in CONFIG_NAMES:
+            changed[rel] = None
+    return {k: v for k, v in changed.items() if k.endswith(".py") or Path(k).name in CONFIG_NAMES}, ""
+
+
+def select_tests(
+    cov_map: Dict[str, Any],
+    changed: Dict[str, Optional[Set[int]]],
+    collected: List[str],
+) -> Tuple[List[str], Dict[str, List[str]], bool]:
+    # Returns (selected node ids in collection order, reasons per node id, full_run flag).
+    tests: Dict[str, Dict[str, List[int]]] = cov_map.get("tests") or {}
+    reasons: Dict[str, List[str]] = {}
+
+    def add(nid: str, why: str) -> None:
+        r = reasons.setdefault(nid, [])
+        if len(r) < MAX_REASONS_PER_TEST:
+            r.append(why)
+
+    for rel in changed:
+        if Path(rel).name in CONFIG_NAMES:
+            return list(collected), {nid: [f"{rel} (config changed)"] for nid in collected}, True
+
+    for rel, lines in changed.items():
+        covered_anywhere: Set[int] = set()
+        for nid, files in tests.items():
+            covered = files.get(rel)
+            if not covered:
+                continue
+            covered_anywhere.update(covered)
+            if lines is None:
+                add(nid, f"{rel} (file changed)")
+                continue
+            hit = sorted(lines.intersection(covered))
+            if hit:
+                add(nid, f"{rel}:{hit[0]}" + (f" (+{len(hit) - 1} lines)" if len(hit) > 1 else ""))
+
+        # Changed lines no test executed (module-level code, new code): fall back to every
+        # test that touches the file at all.
+        if lines is not None and lines - covered_anywhere:
+            for nid, files in tests.items():
+                if files.get(rel):
+                    add(nid, f"{rel} (uncovered lines changed)")
+
+    known = set(tests)
+    for nid in collected:
+        if nid not in known:
+            add(nid, "new test (not in coverage map)")
+
+    selected = [nid for nid in collected if nid in reasons]
+    return selected, {nid: reasons[nid] for nid in selected}, False
+
+
+def merge_coverage(
+    cov_map: Optional[Dict[str, Any]],
+    new_tests: Dict[str, Dict[str, List[int]]],
+    ran: List[str],
+    collected: List[str],
+) -> Dict[str, Any]:
+    tests: Dict[str, Any] = dict((cov_map or {}).get("tests") or {})
+    for nid in ran:
+        tests[nid] = new_tests.get(nid, {})
+    alive = set(collected)
+    return {"tests": {nid: v for nid, v in tests.items() if nid in alive}}
+
+
+async def run_impacted_pytest_async_impl(
+    *,
+    target: str,
+    root_dir: Path,
+    default_target: str,
+    max_output_lines: int,
+    timeout_seconds: int,
+    logger,
+    mode: str,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    maxfail: int = 1,
+    full_lists: bool = False,
+) -> Dict[str, Any]:
+    # full_lists=True reports every selected test and adds the collected node ids (watch mode
+    # merges results across runs with them); otherwise the lists are capped for the response.
+    mode = (mode or "").strip().lower()
+    if mode not in MODES:
+        return {"ok": False, "error": f"unknown impact mode: {mode!r} (expected one of {', '.join(MODES)})"}
+
+    base = prepare_run(
+        target=target,
+        root_dir=root_dir,
+        default_target=default_target,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+    )
+    if not base["ok"]:
+        return base
+    discard_report(base["report_path"])
+    project_dir = base["cwd"]
+
+    started = time.monotonic()
+    collected, err = await collect_node_ids(base, logger)
+    if err:
+        return {"ok": False, "error": err, "target": base["target"], "cmd": base["cmd"], "cwd": project_dir}
+
+    map_target = str(base["target_path"])
+    cov_map = load_coverage_map(project_dir, map_target)
+    changed: Dict[str, Optional[Set[int]]] = {}
+    if cov_map is None:
+        selected, reasons, full_run = list(collected), {}, True
+        why_full = "no coverage map yet"
+    else:
+        if mode == "git":
+            changed, git_err = await asyncio.to_thread(changed_by_git, project_dir)
+            if git_err:
+                return {"ok": False, "error": git_err, "target": base["target"], "cwd": project_dir}
+        else:
+            changed = await asyncio.to_thread(changed_by_mtime, project_dir, cov_map)
+        selected, reasons, full_run = select_tests(cov_map, changed, collected)
+        why_full = "config changed" if full_run else ""
+
+    reported = selected if full_lists else selected[:MAX_REPORTED_TESTS]
+    impact: Dict[str, Any] = {
+        "mode": mode,
+        "full_run": full_run,
+        "changed_files": sorted(changed)[:MAX_REPORTED_TESTS],
+        "collected": len(collected),
+        "selected_count": len(selected),
+        "selected": reported,
+        "reasons": {nid: reasons[nid] for nid in reported if nid in reasons},
+    }
+    if full_lists:
+        impact["collected_ids"] = list(collected)
+    if why_full:
+        impact["full_run_reason"] = why_full
+
+    if not selected:
+        return {
+            "ok": True,
+            "target": base["target"],
+            "exit_code": 0,
+            "msg": "No tests affected by the changes",
+            "cmd": base["cmd"],
+            "output_tail": "",
+            "output_line_count": 0,
+            "cwd": project_dir,
+            "failure_records": [],
+            "impact": impact,
+        }
+
+    select_path = write_selection(selected)
+    cov_path = f"{select_path}.coverage.json"
+    remaining = max(1, int(base["timeout_seconds"] - (time.monotonic() - started)))
+    run = prepare_run(
+        target=target,
+        root_dir=root_dir,
+        default_target=default_target,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+        maxfail=maxfail,
+        extra_env={SELECT_ENV: select_path, COVERAGE_ENV: cov_path},
+    )
+    run["timeout_seconds"] = remaining
+    try:
+        res = finish_run(run, await execute_run_async(run, logger, False, on_progress))
+        ran = [t["nodeid"] for t in read_report(run["report_path"], max_records=MAX_TEST_EVENTS, event="test")]
+        try:
+            with open(cov_path, "r", encoding="utf-8") as f:
+                new_tests = json.load(f).get("tests") or {}
+        except (OSError, ValueError):
+            new_tests = {}
+    finally:
+        discard_report(run["report_path"])
+        discard_report(select_path)
+        discard_report(cov_path)
+
+    if ran:
+        merged = merge_coverage(cov_map, new_tests, ran, collected)
+        # Only move the change baseline forward once every selected test actually ran
+        # (e.g. not cut short by --maxfail); otherwise the same tests are picked again next time.
+        complete = set(selected).issubset(ran)
+        merged["files"] = (
+            await asyncio.to_thread(snapshot_files, project_dir) if complete else (cov_map or {}).get("files") or {}
+        )
+        try:
+            await asyncio.to_thread(save_coverage_map, project_dir, map_target, merged)
+        except OSError:
+            pass
+        impact["map_updated"] = True
+        impact["baseline_advanced"] = complete
+
+    res["impact"] = impact
+    return res
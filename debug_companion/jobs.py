@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from debug_companion.metrics import incr
+
+# Background runs: start_run returns a job id at once, poll_run / cancel_run act on it later.
+# At most MCP_MAX_JOBS jobs run at a time (default 2); jobs and direct tool calls on the same
+# target are serialized by a per-target lock; a request identical to a queued or running job
+# (same kind, target and arguments) is attached to that job instead of starting another run.
+
+DEFAULT_MAX_JOBS = 2
+MAX_FINISHED_JOBS = 200
+MAX_JOB_MESSAGES = 50
+MAX_POLL_WAIT_SECONDS = 60.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+JobFactory = Callable[["Job"], Awaitable[Dict[str, Any]]]
+
+# Target locks held by the current task (and the tasks it spawns), so nested tool calls on the
+# same target, e.g. debug_project -> run_pytest, do not wait on their own lock.
+_HELD: ContextVar[FrozenSet[str]] = ContextVar("debug_companion_held_targets", default=frozenset())
+
+
+def _max_jobs_from_env() -> int:
+    try:
+        return max(1, int(os.environ.get("MCP_MAX_JOBS") or DEFAULT_MAX_JOBS))
+    except ValueError:
+        return DEFAULT_MAX_JOBS
+
+
+def job_key(kind: str, target_key: str, args: Dict[str, Any]) -> str:
+    return json.dumps([kind, target_key, args], sort_keys=True, default=str)
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, target_key: str, args: Dict[str, Any], key: str):
+        self.id = job_id
+        self.kind = kind
+        self.target_key = target_key
+        self.args = args
+        self.key = key
+        self.state = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.requests = 1
+        self.progress: Optional[float] = None
+        self.messages: deque = deque(maxlen=MAX_JOB_MESSAGES)
+        self.result: Optional[Dict[str, Any]] = None
+        self.error = ""
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    async def report_progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None) -> None:
+        # Same signature as mcp Context.report_progress, so a job can stand in for the request
+        # context of the tool it runs.
+        self.progress = progress
+        if message:
+            self.messages.append(message)
+
+    def view(self, include_result: bool = True) -> Dict[str, Any]:
+        now = time.time()
+        out: Dict[str, Any] = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "args": self.args,
+            "requests": self.requests,
+            "queued_seconds": round((self.started or now) - self.created, 3),
+        }
+        if self.started is not None:
+            out["run_seconds"] = round((self.finished or now) - self.started, 3)
+        if self.progress is not None:
+            out["progress"] = self.progress
+        if self.messages:
+            out["message"] = self.messages[-1]
+        if self.error:
+            out["error"] = self.error
+        if include_result and self.result is not None:
+            out["result"] = self.result
+        return out
+
+
+class JobScheduler:
+    def __init__(self, max_jobs: int = DEFAULT_MAX_JOBS):
+        self.max_jobs = max(1, int(max_jobs))
+        self._slots = asyncio.Semaphore(self.max_jobs)
+        # target_key -> (lock, callers holding or waiting for it); dropped when the count hits 0.
+        self._target_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}  # job_key -> queued/running job
+        self._ids = itertools.count(1)
+        self.coalesced = 0
+
+    @asynccontextmanager
+    async def target_lock(self, target_key: str):
+        held = _HELD.get()
+        if target_key in held:
+            yield
+            return
+        lock, users = self._target_locks.get(target_key) or (asyncio.Lock(), 0)
+        self._target_locks[target_key] = (lock, users + 1)
+        try:
+            async with lock:
+                token = _HELD.set(held | {target_key})
+                try:
+                    yield
+                finally:
+                    _HELD.reset(token)
+        finally:
+            lock, users = self._target_locks[target_key]
+            if users > 1:
+                self._target_locks[target_key] = (lock, users - 1)
+            else:
+                del self._target_locks[target_key]
+
+    def submit(self, kind: str, target_key: str, args: Dict[str, Any], factory: JobFactory) -> Tuple[Job, bool]:
+        key = job_key(kind, target_key, args)
+        job = self._active.get(key)
+        if job is not None:
+            job.requests += 1
+            self.coalesced += 1
+            incr("jobs.coalesced")
+            return job, True
+
+        job = Job(f"run-{next(self._ids)}", kind, target_key, args, key)
+        self._jobs[job.id] = job
+        self._active[key] = job
+        job.task = asyncio.ensure_future(self._run(job, factory))
+        job.task.add_done_callback(lambda task: self._finish(job, task))
+        incr("jobs.started")
+        self._evict()
+        return job, False
+
+    async def _run(self, job: Job, factory: JobFactory) -> None:
+        try:
+            # The target lock is taken before a global slot, so a job waiting for its target
+            # does not keep a job on another target from running.
+            async with self.target_lock(job.target_key):
+                async with self._slots:
+                    job.state = RUNNING
+                    job.started = time.time()
+                    job.result = await factory(job)
+            job.state = DONE
+        except Exception as e:
+            job.state = FAILED
+            job.error = f"{type(e).__name__}: {e}"
+
+    def _finish(self, job: Job, task: "asyncio.Task[None]") -> None:
+        # Runs even for a task cancelled before its first step, when _run's body never started.
+        if task.cancelled():
+            job.state = CANCELLED
+            job.error = job.error or "cancelled"
+        job.finished = time.time()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.state in ACTIVE_STATES and job.task is not None:
+            job.error = "cancelled by request"
+            job.task.cancel()
+            # A cancelled job no longer absorbs identical requests, even before its task unwinds.
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> None:
+        if job.task is None or job.task.done() or timeout <= 0:
+            return
+        await asyncio.wait({job.task}, timeout=min(timeout, MAX_POLL_WAIT_SECONDS))
+
+    def jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self._jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"max_jobs": self.max_jobs, "jobs": len(self._jobs), "states": states, "coalesced": self.coalesced}
+
+    def _evict(self) -> None:
+        finished = [j for j in self._jobs.values() if j.state not in ACTIVE_STATES]
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_job_scheduler() -> JobScheduler:
+    # asyncio locks belong to one event loop; the server has a single loop, tests start a new
+    # one per asyncio.run().
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler_loop is not loop:
+        _scheduler = JobScheduler(_max_jobs_from_env())
+        _scheduler_loop = loop
+    return _scheduler
@@ -0,0 +1,230 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+# Process-wide spans (duration histograms) and counters. MCP_METRICS=0 turns recording off:
+# span() then hands out one shared no-op object and incr() returns after a flag check.
+# MCP_METRICS_PROM_FILE names a Prometheus text-format file rewritten at most every
+# MCP_METRICS_PROM_INTERVAL seconds (default 10) and on every `metrics` tool call.
+
+# Upper bounds in seconds; the last bucket is +Inf.
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+DEFAULT_PROM_INTERVAL_SECONDS = 10.0
+PROM_PREFIX = "debug_companion"
+
+
+def _env_enabled() -> bool:
+    return (os.environ.get("MCP_METRICS") or "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation, clamped to the observed range.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.total * 1000, 3),
+            "min_ms": round(self.min * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "started", "epoch")
+
+    def __init__(self, registry: "Registry", name: str):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.epoch = self.registry.epoch
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.registry.observe(self.name, time.perf_counter() - self.started, epoch=self.epoch)
+
+
+class Registry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._started = time.time()
+        self._prom_written = 0.0
+        # Bumped by reset(); a span that started before a reset (e.g. the metrics tool call
+        # doing the reset) is not recorded after it.
+        self.epoch = 0
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float, epoch: Optional[int] = None) -> None:
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            hist = self._spans.get(name)
+            if hist is None:
+                hist = self._spans[name] = Histogram()
+            hist.observe(seconds)
+        self._maybe_export()
+
+    def incr(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._started = time.time()
+            self.epoch += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = {name: h.summary() for name, h in sorted(self._spans.items())}
+            counters = dict(sorted(self._counters.items()))
+        return {
+            "enabled": self.enabled,
+            "since": round(self._started, 3),
+            "spans": spans,
+            "counters": counters,
+        }
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            spans = [(name, h.counts[:], h.count, h.total) for name, h in sorted(self._spans.items())]
+            counters = sorted(self._counters.items())
+        metric = f"{PROM_PREFIX}_span_seconds"
+        lines.append(f"# HELP {metric} Duration of instrumented stages.")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, counts, count, total in spans:
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{span="{name}"}} {count}')
+        for name, value in counters:
+            prom = f"{PROM_PREFIX}_{name.replace('.', '_').replace('-', '_')}_total"
+            lines.append(f"# TYPE {prom} counter")
+            lines.append(f"{prom} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Optional[str] = None) -> Optional[str]:
+        path = path or (os.environ.get("MCP_METRICS_PROM_FILE") or "").strip()
+        if not path:
+            return None
+        self._prom_written = time.monotonic()
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, path)
+        except OSError:
+            return None
+        return path
+
+    def _maybe_export(self) -> None:
+        raw = os.environ.get("MCP_METRICS_PROM_FILE")
+        if not raw:
+            return
+        interval = float(os.environ.get("MCP_METRICS_PROM_INTERVAL") or DEFAULT_PROM_INTERVAL_SECONDS)
+        if time.monotonic() - self._prom_written >= interval:
+            self.export(raw.strip())
+
+
+_REGISTRY = Registry(enabled=_env_enabled())
+
+
+def get_registry() -> Registry:
+    return _REGISTRY
+
+
+def span(name: str):
+    return _REGISTRY.span(name)
+
+
+def incr(name: str, value: float = 1) -> None:
+    _REGISTRY.incr(name, value)
+
+
+def timed(name: str):
+    # Span around every call of the decorated (sync or async) function; keeps its signature,
+    # so it can sit under @mcp.tool().
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _REGISTRY.span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _REGISTRY.span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
@@ -1,6 +1,205 @@
-from typing import Any, Dict
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
+from debug_companion.failure_records import failures_from_records, format_record, project_frames
+from debug_companion.fingerprint import FailureClusters, cluster_view
+from debug_companion.metrics import span
+from debug_companion.prompt_builder import build_analysis_inputs
+
+
+# Call-chain frames opened while the LLM call is in flight (async pipeline only).
+MAX_FRAME_CONTEXTS = 8
+FRAME_CONTEXT_RADIUS = 5  # the smallest window open_contexts serves (context_tools.MIN_RADIUS)
+# Failures whose context + analysis run at the same time when failure_limit > 1.
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# Other tests of the same cluster named in the prompt.
+PROMPT_CLUSTER_MEMBERS = 5
+
+
+def _context_text(ctx_res: Dict[str, Any]) -> str:
+    content = ctx_res.get("content") or []
+    return "\n".join([f'{x.get("line")}: {x.get("text")}' for x in content])
+
+
+def _context_args(first: Dict[str, Any], radius: int) -> Dict[str, Any]:
+    ctx_path = (first.get("path_for_open_context") or first.get("path") or "").strip()
+    ctx_base = (first.get("open_context_base_dir") or "").strip()
+    return {"path": ctx_path, "line": int(first.get("line", 1)), "radius": radius, "base_dir": ctx_base}
+
+
+def _project_path(project_dir: str) -> Optional[Path]:
+    try:
+        return Path(project_dir).resolve() if project_dir.strip() else None
+    except Exception:
+        return None
+
+
+def _records_failures(test_res: Dict[str, Any], failure_limit: int, root_dir: Path) -> Dict[str, Any]:
+    # Structured records from the pytest plugin: no text parsing, independent of output_tail length.
+    # Records are clustered by fingerprint first; failure_limit counts clusters, not tests.
+    records = test_res.get("failure_records") or []
+    if not records:
+        return {"ok": False, "count": 0, "failures": []}
+    project_dir = test_res.get("cwd") or ""
+    clusters = FailureClusters(_project_path(project_dir))
+    for rec in records:
+        clusters.add(rec)
+    failures: List[Dict[str, Any]] = []
+    for rec, cluster in clusters.representatives():
+        if len(failures) >= max(1, int(failure_limit)):
+            break
+        fres = failures_from_records(records=[rec], limit=1, root_dir=root_dir, project_dir=project_dir)
+        for failure in fres["failures"]:
+            failure["cluster"] = cluster_view(cluster)
+            failures.append(failure)
+    return {"ok": True, "count": len(failures), "failures": failures, "source": "plugin", "clusters": clusters.summary()}
+
+
+def _text_failures(fails_res: Dict[str, Any], failure_limit: int) -> List[Dict[str, Any]]:
+    # extract_failures output: one location per cluster (its innermost project frame) when the
+    # parser grouped the tracebacks, otherwise the first file:line hits in output order.
+    limit = max(1, int(failure_limit))
+    failures: List[Dict[str, Any]] = []
+    for cluster in fails_res.get("clusters") or []:
+        if cluster.get("location") and len(failures) < limit:
+            failures.append({
+                **cluster["location"],
+                "nodeid": cluster.get("representative"),
+                "exc_type": cluster.get("exc_type"),
+                "message": cluster.get("message"),
+                "cluster": cluster,
+            })
+    return failures or fails_res["failures"][:limit]
+
+
+def _frame_locations(first: Dict[str, Any], pytest_cwd: str) -> List[Dict[str, Any]]:
+    if first.get("source") != "plugin":
+        return []
+    proj = _project_path(pytest_cwd)
+    focus = (first.get("resolved_path"), int(first.get("line") or 0))
+    out: List[Dict[str, Any]] = []
+    for fr in reversed(project_frames(first, proj)):
+        if (str(fr.get("path")), int(fr.get("line") or 0)) == focus:
+            continue
+        out.append({"path": str(fr.get("path")), "line": int(fr.get("line") or 1), "radius": FRAME_CONTEXT_RADIUS})
+        if len(out) >= MAX_FRAME_CONTEXTS:
+            break
+    return out
+
+
+def _cluster_note(failure: Dict[str, Any]) -> str:
+    cluster = failure.get("cluster") or {}
+    others = [m for m in cluster.get("members") or [] if m != failure.get("nodeid")]
+    if int(cluster.get("count") or 1) <= 1 or not others:
+        return ""
+    shown = ", ".join(others[:PROMPT_CLUSTER_MEMBERS])
+    more = int(cluster["count"]) - 1 - min(len(others), PROMPT_CLUSTER_MEMBERS)
+    return f"\n\nThe same failure occurs in {int(cluster['count']) - 1} other test(s): {shown}" + (f" and {more} more" if more > 0 else "")
+
+
+def _error_message(failure: Dict[str, Any], output_tail: str) -> str:
+    if failure.get("source") != "plugin":
+        return output_tail + _cluster_note(failure)
+    note = _cluster_note(failure)
+    return format_record(failure) + note + ("\n\npytest output (tail):\n" + output_tail if output_tail else "")
+
+
+def _analysis_args(
+    first: Dict[str, Any], output_tail: str, ctx_res: Dict[str, Any], token_budget: int
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    with span("prompt.build"):
+        error_message, code_context, stats = build_analysis_inputs(
+            error_message=_error_message(first, output_tail),
+            code_context=_context_text(ctx_res),
+            token_budget=token_budget,
+            focus_line=ctx_res.get("focus_line"),
+        )
+    return {"error_message": error_message, "code_context": code_context}, stats
+
+
+def _open_context_failed(first: Dict[str, Any], ctx_args: Dict[str, Any], ctx_res: Dict[str, Any], pytest_cwd: str) -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "stage": "open_context",
+        "msg": "Got failure location but could not open file context",
+        "failure": first,
+        "context": ctx_res,
+        "debug_info": {"used_path": ctx_args["path"], "used_base_dir": ctx_args["base_dir"], "pytest_cwd": pytest_cwd},
+    }
+
+
+def _not_finished(failure: Dict[str, Any], cancelled: bool) -> Dict[str, Any]:
+    return {
+        "ok": False,
+        "stage": "deadline",
+        "error": "deadline exceeded before analysis finished" + (" (cancelled)" if cancelled else ""),
+        "failure": failure,
+    }
+
+
+def _fanout_result(
+    test_res: Dict[str, Any],
+    results: List[Dict[str, Any]],
+    stats: Dict[str, Any],
+    clusters: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    # Top-level fields describe the first failure (the single-failure response shape); every
+    # processed failure is listed under "failures" when there is more than one. "clusters" lists
+    # every fingerprint seen, analyzed or not, with its member tests.
+    first = results[0]
+    out: Dict[str, Any] = {"ok": True, "stage": first["stage"], "pytest": test_res}
+    out.update({k: v for k, v in first.items() if k not in ("ok", "stage")})
+    if len(results) > 1:
+        out["failures"] = [{"index": i, **r} for i, r in enumerate(results)]
+    grouped = 0
+    if clusters:
+        out["clusters"] = clusters
+        grouped = sum(int(c["count"]) for c in clusters)
+        stats = {**stats, "clusters": len(clusters), "clustered_failures": grouped}
+    if len(results) > 1 or stats.get("deadline_seconds") or grouped > 1:
+        out["fanout"] = stats
+    return out
+
+
+def _clamp_concurrency(concurrency: int, n: int) -> int:
+    return max(1, min(int(concurrency or 1), MAX_CONCURRENCY, n))
+
+
+def _remaining(started: float, deadline_seconds: float) -> Optional[float]:
+    # The deadline counts from the start of debug_project (pytest included); 0 = none.
+    if not deadline_seconds or deadline_seconds <= 0:
+        return None
+    return max(0.0, deadline_seconds - (time.monotonic() - started))
+
+
+def _run_failure(
+    failure: Dict[str, Any],
+    *,
+    open_context_fn,
+    analyze_fn,
+    radius: int,
+    output_tail: str,
+    pytest_cwd: str,
+    token_budget: int,
+    stop: Optional[threading.Event] = None,
+) -> Dict[str, Any]:
+    ctx_args = _context_args(failure, radius)
+    ctx_res = open_context_fn(**ctx_args)
+    if not ctx_res.get("ok"):
+        return _open_context_failed(failure, ctx_args, ctx_res, pytest_cwd)
+    if stop is not None and stop.is_set():
+        return _not_finished(failure, True)
+
+    analysis_args, prompt_stats = _analysis_args(failure, output_tail, ctx_res, token_budget)
+    gem_res = analyze_fn(**analysis_args)
+    return {"ok": True, "stage": "done", "failure": failure, "context": ctx_res, "gemini": gem_res, "prompt": prompt_stats}
+
 
 def debug_project_impl(
     *,
@@ -14,7 +213,14 @@ def debug_project_impl(
     timeout_seconds: int,
     failure_limit: int,
     radius: int,
+    token_budget: int = 0,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline_seconds: float = 0,
 ) -> Dict[str, Any]:
+    started = time.monotonic()
+    if deadline_seconds and deadline_seconds > 0:
+        # A blocking run cannot be interrupted, so its own timeout is held to the deadline.
+        timeout_seconds = min(int(timeout_seconds), max(1, math.ceil(deadline_seconds)))
     test_res = run_pytest_fn(
         target=target,
         max_output_lines=max_output_lines,
@@ -30,7 +236,9 @@ def debug_project_impl(
     if exit_code == 0:
         return {"ok": True, "stage": "done", "msg": "All tests passed", "pytest": test_res}
 
-    fails_res = extract_failures_fn(pytest_output=output_tail, limit=failure_limit, base_dir=pytest_cwd)
+    fails_res = _records_failures(test_res, failure_limit, root_dir)
+    if fails_res.get("count", 0) == 0:
+        fails_res = extract_failures_fn(pytest_output=output_tail, limit=failure_limit, base_dir=pytest_cwd)
     if not fails_res.get("ok") or fails_res.get("count", 0) == 0:
         return {
             "ok": True,
@@ -40,34 +248,257 @@ def debug_project_impl(
             "extract": fails_res,
         }
 
-    first = fails_res["failures"][0]
-    line_no = int(first.get("line", 1))
+    failures = _text_failures(fails_res, failure_limit) if fails_res.get("source") != "plugin" else fails_res["failures"]
+    workers = _clamp_concurrency(concurrency, len(failures))
+    stop = threading.Event()
+    job = dict(
+        stop=stop,
+        open_context_fn=open_context_fn,
+        analyze_fn=analyze_fn,
+        radius=radius,
+        output_tail=output_tail,
+        pytest_cwd=pytest_cwd,
+        token_budget=token_budget,
+    )
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(failures)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="debug-project")
+    futures = {pool.submit(_run_failure, f, **job): i for i, f in enumerate(failures)}
+    try:
+        wait(futures, timeout=_remaining(started, deadline_seconds))
+    finally:
+        # Queued failures are dropped and running ones give up before their LLM call. A call
+        # already in flight cannot be interrupted; it is counted in "still_running" and its
+        # thread exits when the call returns.
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
 
-    ctx_path = (first.get("path_for_open_context") or first.get("path") or "").strip()
-    ctx_base = (first.get("open_context_base_dir") or "").strip()
+    expired = False
+    still_running = 0
+    for fut, i in futures.items():
+        if not fut.done():
+            still_running += 1
+        if not fut.done() or fut.cancelled():
+            expired = True
+            results[i] = _not_finished(failures[i], fut.cancelled())
+        elif fut.exception() is not None:
+            results[i] = {"ok": False, "stage": "error", "error": str(fut.exception()), "failure": failures[i]}
+        else:
+            results[i] = fut.result()
 
-    ctx_res = open_context_fn(path=ctx_path, line=line_no, radius=radius, base_dir=ctx_base)
+    stats = {
+        "failures": len(failures),
+        "concurrency": workers,
+        "deadline_seconds": deadline_seconds,
+        "deadline_expired": expired,
+        "still_running": still_running,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+    return _fanout_result(test_res, [r for r in results if r is not None], stats, fails_res.get("clusters"))
+
+
+async def _run_failure_async(
+    failure: Dict[str, Any],
+    *,
+    open_context_fn,
+    analyze_fn,
+    open_contexts_fn,
+    radius: int,
+    output_tail: str,
+    pytest_cwd: str,
+    token_budget: int,
+) -> Dict[str, Any]:
+    ctx_args = _context_args(failure, radius)
+    ctx_res = await open_context_fn(**ctx_args)
     if not ctx_res.get("ok"):
-        return {
-            "ok": True,
-            "stage": "open_context",
-            "msg": "Got failure location but could not open file context",
-            "pytest": test_res,
-            "failure": first,
-            "context": ctx_res,
-            "debug_info": {"used_path": ctx_path, "used_base_dir": ctx_base, "pytest_cwd": pytest_cwd},
-        }
+        return _open_context_failed(failure, ctx_args, ctx_res, pytest_cwd)
 
-    content = ctx_res.get("content") or []
-    context_text = "\n".join([f'{x.get("line")}: {x.get("text")}' for x in content])
+    analysis_args, prompt_stats = _analysis_args(failure, output_tail, ctx_res, token_budget)
+    gem_task = asyncio.ensure_future(analyze_fn(**analysis_args))
+    frames_res: Optional[Dict[str, Any]] = None
+    try:
+        await asyncio.sleep(0)  # let the LLM request go out first
+        locations = _frame_locations(failure, pytest_cwd) if open_contexts_fn is not None else []
+        if locations:
+            try:
+                frames_res = await open_contexts_fn(locations=locations, base_dir="")
+            except Exception as e:
+                frames_res = {"ok": False, "error": str(e)}
+        gem_res = await gem_task
+    finally:
+        if not gem_task.done():
+            gem_task.cancel()
 
-    gem_res = analyze_fn(error_message=output_tail, code_context=context_text)
+    out = {"ok": True, "stage": "done", "failure": failure, "context": ctx_res, "gemini": gem_res, "prompt": prompt_stats}
+    if frames_res is not None:
+        out["frames_context"] = frames_res
+    return out
 
-    return {
-        "ok": True,
-        "stage": "done",
-        "pytest": test_res,
-        "failure": first,
-        "context": ctx_res,
-        "gemini": gem_res,
+
+async def debug_project_async_impl(
+    *,
+    target: str,
+    root_dir: Path,
+    run_pytest_fn,
+    extract_failures_fn,
+    open_context_fn,
+    analyze_fn,
+    max_output_lines: int,
+    timeout_seconds: int,
+    failure_limit: int,
+    radius: int,
+    token_budget: int = 0,
+    open_contexts_fn=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline_seconds: float = 0,
+    pipeline: bool = False,
+) -> Dict[str, Any]:
+    # Same pipeline as debug_project_impl, but every *_fn is a coroutine function so the
+    # server event loop stays free while pytest or the LLM is running. Per failure, the LLM
+    # call runs as a task while the rest of the call chain (open_contexts_fn) is opened.
+    # With pipeline=True, run_pytest_fn also gets on_record: failures reported by the plugin
+    # while pytest is still running go straight to context + analysis, so the first diagnosis
+    # does not wait for the end of the suite. Runs that do not stream records (shards, impact,
+    # cache hits) fall back to processing failures after the run.
+    started = time.monotonic()
+    limit = max(1, int(failure_limit))
+    sem = asyncio.Semaphore(_clamp_concurrency(concurrency, limit))
+    failures: List[Dict[str, Any]] = []
+    tasks: List["asyncio.Future[Dict[str, Any]]"] = []
+    live = {"project_dir": "", "first_started": None}
+    live_clusters = FailureClusters()
+
+    def start(failure: Dict[str, Any], pytest_cwd: str, output_tail: str) -> None:
+        async def one() -> Dict[str, Any]:
+            async with sem:
+                return await _run_failure_async(
+                    failure,
+                    open_context_fn=open_context_fn,
+                    analyze_fn=analyze_fn,
+                    open_contexts_fn=open_contexts_fn,
+                    radius=radius,
+                    output_tail=output_tail,
+                    pytest_cwd=pytest_cwd,
+                    token_budget=token_budget,
+                )
+
+        failures.append(failure)
+        tasks.append(asyncio.ensure_future(one()))
+
+    async def on_record(rec: Dict[str, Any]) -> None:
+        event = rec.get("event")
+        if event == "start":
+            live["project_dir"] = str(rec.get("invocation_dir") or "")
+            live_clusters.project_dir = _project_path(live["project_dir"])
+        elif event == "failure":
+            # Only the first failure of each cluster is analyzed; later ones just join it.
+            cluster, is_new = live_clusters.add(rec)
+            if not is_new or len(tasks) >= limit:
+                return
+            fres = failures_from_records(records=[rec], limit=1, root_dir=root_dir, project_dir=live["project_dir"])
+            for failure in fres["failures"]:
+                if live["first_started"] is None:
+                    live["first_started"] = round(time.monotonic() - started, 3)
+                failure["cluster"] = cluster_view(cluster)
+                start(failure, live["project_dir"], "")
+
+    def cancel_all() -> None:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+    async def drain() -> None:
+        cancel_all()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    pytest_expired = False
+    try:
+        run_kw = {"on_record": on_record} if pipeline else {}
+        # Cancelling the run on the deadline kills pytest (wait_for awaits the kill).
+        test_res = await asyncio.wait_for(
+            run_pytest_fn(
+                target=target,
+                max_output_lines=max_output_lines,
+                timeout_seconds=timeout_seconds,
+                **run_kw,
+            ),
+            _remaining(started, deadline_seconds),
+        )
+    except asyncio.TimeoutError:
+        pytest_expired = True
+        test_res = {"ok": False, "error": f"deadline exceeded while pytest was running ({deadline_seconds}s)"}
+    except BaseException:
+        cancel_all()
+        raise
+    pytest_seconds = round(time.monotonic() - started, 3)
+    streamed = len(tasks)
+
+    # Failures streamed before the deadline still make up a partial result below.
+    if not test_res.get("ok") and not (pytest_expired and streamed):
+        await drain()
+        return {"ok": False, "stage": "run_pytest", "details": test_res}
+
+    exit_code = int(test_res.get("exit_code", 1))
+    output_tail = (test_res.get("output_tail") or "")
+    pytest_cwd = (test_res.get("cwd") or "").strip()
+
+    if exit_code == 0:
+        await drain()
+        return {"ok": True, "stage": "done", "msg": "All tests passed", "pytest": test_res}
+
+    clusters = live_clusters.summary() if streamed else None
+    if not tasks:
+        fails_res = _records_failures(test_res, limit, root_dir)
+        if fails_res.get("count", 0) == 0:
+            fails_res = await extract_failures_fn(pytest_output=output_tail, limit=failure_limit, base_dir=pytest_cwd)
+        if not fails_res.get("ok") or fails_res.get("count", 0) == 0:
+            return {
+                "ok": True,
+                "stage": "extract_failures",
+                "msg": "Tests failed but could not parse a file:line location from output_tail",
+                "pytest": test_res,
+                "extract": fails_res,
+            }
+        clusters = fails_res.get("clusters")
+        plugin = fails_res.get("source") == "plugin"
+        for failure in fails_res["failures"][:limit] if plugin else _text_failures(fails_res, limit):
+            start(failure, pytest_cwd, output_tail)
+
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=_remaining(started, deadline_seconds))
+    finally:
+        cancel_all()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results: List[Dict[str, Any]] = []
+    for failure, t in zip(failures, tasks):
+        if t in pending:
+            results.append(_not_finished(failure, True))
+        elif t.exception() is not None:
+            results.append({"ok": False, "stage": "error", "error": str(t.exception()), "failure": failure})
+        else:
+            results.append(t.result())
+
+    stats = {
+        "failures": len(failures),
+        "concurrency": _clamp_concurrency(concurrency, limit),
+        "deadline_seconds": deadline_seconds,
+        "deadline_expired": bool(pending) or pytest_expired,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
     }
+    if streamed:
+        # Members that failed after their cluster's analysis had started.
+        views = {c["fingerprint"]: c for c in clusters or []}
+        for failure in failures:
+            fp = (failure.get("cluster") or {}).get("fingerprint")
+            if fp in views:
+                failure["cluster"] = views[fp]
+    out = _fanout_result(test_res, results, stats, clusters)
+    if streamed:
+        out["pipeline"] = {
+            "started_during_run": streamed,
+            "first_started_seconds": live["first_started"],
+            "pytest_seconds": pytest_seconds,
+        }
+    return out
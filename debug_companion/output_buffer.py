@@ -0,0 +1,142 @@
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+DEFAULT_MAX_LINE_CHARS = 4000
+
+# `pytest -q` progress lines, e.g. "..F.s    [ 40%]"
+_PROGRESS_RE = re.compile(r"^(?P<marks>[.FEsxX]+)\s*(?:\[\s*(?P<pct>\d+)%\])?\s*$")
+_PARTIAL_RE = re.compile(r"^[.FEsxX]+$")
+
+_MARKS = {".": "passed", "F": "failed", "E": "errors", "s": "skipped", "x": "xfailed", "X": "xpassed"}
+
+
+class LineRingBuffer:
+    # Keeps only the last `max_lines` lines of a byte stream fed in arbitrary chunks.
+    # Memory is bounded by max_lines * max_line_chars no matter how much output arrives.
+
+    def __init__(self, max_lines: int, max_line_chars: int = DEFAULT_MAX_LINE_CHARS):
+        self.max_lines = max(1, int(max_lines))
+        self.max_line_chars = max(80, int(max_line_chars))
+        self._tail: deque = deque(maxlen=self.max_lines)
+        self._partial = bytearray()
+        self._partial_truncated = False
+        self.line_count = 0
+        self.bytes_seen = 0
+
+    def _decode(self, raw: bytes, truncated: bool) -> str:
+        text = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if truncated:
+            text += " ...[truncated]"
+        return text
+
+    def _push(self, raw: bytes, truncated: bool, out: List[str]) -> None:
+        line = self._decode(raw, truncated)
+        self._tail.append(line)
+        self.line_count += 1
+        out.append(line)
+
+    def feed(self, data: bytes) -> List[str]:
+        # Returns the lines completed by this chunk (each already capped to max_line_chars).
+        new_lines: List[str] = []
+        if not data:
+            return new_lines
+        self.bytes_seen += len(data)
+        cap = self.max_line_chars * 4  # utf-8 worst case
+
+        start = 0
+        while True:
+            nl = data.find(b"\n", start)
+            if nl < 0:
+                break
+            piece = data[start:nl]
+            if self._partial or self._partial_truncated:
+                room = cap - len(self._partial)
+                if room > 0:
+                    self._partial += piece[:room]
+                truncated = self._partial_truncated or len(piece) > room
+                self._push(bytes(self._partial), truncated, new_lines)
+                self._partial.clear()
+                self._partial_truncated = False
+            else:
+                self._push(piece[:cap], len(piece) > cap, new_lines)
+            start = nl + 1
+
+        rest = data[start:]
+        if rest:
+            room = cap - len(self._partial)
+            if room > 0:
+                self._partial += rest[:room]
+            if len(rest) > room:
+                self._partial_truncated = True
+        return new_lines
+
+    def close(self) -> List[str]:
+        new_lines: List[str] = []
+        if self._partial or self._partial_truncated:
+            self._push(bytes(self._partial), self._partial_truncated, new_lines)
+            self._partial.clear()
+            self._partial_truncated = False
+        return new_lines
+
+    def partial_text(self) -> str:
+        return self._partial.decode("utf-8", errors="replace")
+
+    def lines(self) -> List[str]:
+        return [line[: self.max_line_chars] for line in self._tail]
+
+    def text(self) -> str:
+        return "\n".join(self.lines())
+
+
+class PytestProgress:
+    # Counts outcomes from `pytest -q` progress markers as lines stream in.
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {v: 0 for v in set(_MARKS.values())}
+        self.percent: Optional[int] = None
+        self._in_report = False
+        # Marks printed on the current, not yet newline-terminated progress row.
+        self._partial: Dict[str, int] = {}
+
+    def feed_partial(self, text: str) -> bool:
+        if self._in_report:
+            return False
+        s = text.strip()
+        counts: Dict[str, int] = {}
+        if _PARTIAL_RE.match(s):
+            for ch in s:
+                counts[_MARKS[ch]] = counts.get(_MARKS[ch], 0) + 1
+        changed = counts != self._partial
+        self._partial = counts
+        return changed
+
+    def feed_line(self, line: str) -> bool:
+        # Returns True when the counts or percentage changed.
+        if self._in_report:
+            return False
+        self._partial = {}
+        s = line.strip()
+        if s.startswith("=") or s.startswith("_"):
+            # Past the progress section ("== FAILURES ==", "__ test_x __", summary).
+            self._in_report = True
+            return False
+        m = _PROGRESS_RE.match(s)
+        if not m:
+            return False
+        for ch in m.group("marks"):
+            self.counts[_MARKS[ch]] += 1
+        if m.group("pct") is not None:
+            self.percent = int(m.group("pct"))
+        return True
+
+    def _current(self) -> Dict[str, int]:
+        return {k: v + self._partial.get(k, 0) for k, v in self.counts.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        counts = self._current()
+        return {"done": sum(counts.values()), "percent": self.percent, **{k: v for k, v in counts.items() if v}}
+
+    def message(self) -> str:
+        parts = [f"{v} {k}" for k, v in sorted(self._current().items()) if v]
+        return ", ".join(parts) if parts else "running"
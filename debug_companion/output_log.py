@@ -0,0 +1,306 @@
+import json
+import mmap
+import os
+import re
+import secrets
+import time
+from array import array
+from bisect import bisect_right
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.cache_dir import get_cache_dir
+from debug_companion.metrics import incr
+from debug_companion.output_buffer import DEFAULT_MAX_LINE_CHARS
+
+# The complete output of every run is streamed to <cache>/output/<run_id>.log (at most
+# MCP_OUTPUT_LOG_MAX_MB per run, default 256, 0 = off) while a sparse index records the byte offset
+# of every INDEX_STRIDE-th line. read_range/grep_log then serve line ranges and regex matches through
+# mmap, touching only the pages they need. The newest MAX_KEPT_LOGS logs are kept.
+
+DEFAULT_MAX_MB = 256
+INDEX_STRIDE = 256
+MAX_KEPT_LOGS = 20
+MAX_RANGE_LINES = 2000
+MAX_GREP_MATCHES = 500
+MAX_CONTEXT_LINES = 10
+
+_RUN_ID_RE = re.compile(r"^[0-9A-Za-z-]{1,64}$")
+_NEWLINE = re.compile(b"\n")
+
+
+def _max_bytes_from_env() -> int:
+    raw = (os.environ.get("MCP_OUTPUT_LOG_MAX_MB") or "").strip()
+    try:
+        return int(float(raw) * 1024 * 1024) if raw else DEFAULT_MAX_MB * 1024 * 1024
+    except ValueError:
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+
+def _log_dir() -> Path:
+    return get_cache_dir("output")
+
+
+def _paths(run_id: str, directory: Optional[Path] = None) -> Tuple[Path, Path, Path]:
+    d = directory or _log_dir()
+    return d / f"{run_id}.log", d / f"{run_id}.idx", d / f"{run_id}.json"
+
+
+class OutputLog:
+    # Writer side: fed raw output chunks as they arrive; the index is built on the way.
+
+    def __init__(self, max_bytes: Optional[int] = None, directory: Optional[Path] = None):
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(4)}"
+        self.directory = directory or _log_dir()
+        self.path, self.idx_path, self.meta_path = _paths(self.run_id, self.directory)
+        self.max_bytes = _max_bytes_from_env() if max_bytes is None else max(0, int(max_bytes))
+        self.bytes = 0
+        self.bytes_seen = 0
+        self.newlines = 0
+        self.truncated = False
+        self.offsets = array("Q", [0])
+        self._next = INDEX_STRIDE
+        self._ends_with_newline = True
+        self._f = open(self.path, "wb")
+
+    def _index(self, data: bytes) -> None:
+        n = data.count(b"\n")
+        if self.newlines + n < self._next:
+            self.newlines += n
+            return
+        # The (self._next - self.newlines)-th newline of this chunk starts the next indexed line,
+        # and so does every INDEX_STRIDE-th newline after it.
+        for m in islice(_NEWLINE.finditer(data), self._next - self.newlines - 1, None, INDEX_STRIDE):
+            self.offsets.append(self.bytes + m.end())
+        self.newlines += n
+        self._next = (self.newlines // INDEX_STRIDE + 1) * INDEX_STRIDE
+
+    def feed(self, data: bytes) -> None:
+        if not data:
+            return
+        self.bytes_seen += len(data)
+        if self.truncated:
+            return
+        room = self.max_bytes - self.bytes
+        if len(data) > room:
+            data = data[: max(0, room)]
+            self.truncated = True
+        if not data:
+            return
+        self._index(data)
+        self._f.write(data)
+        self.bytes += len(data)
+        self._ends_with_newline = data.endswith(b"\n")
+
+    def adopt(self, src: str) -> None:
+        # Takes over a file somebody else wrote (the warm pool's output file).
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                self.feed(chunk)
+
+    def close(self) -> Dict[str, Any]:
+        if not self._f.closed:
+            self._f.close()
+            with open(self.idx_path, "wb") as f:
+                self.offsets.tofile(f)
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump(self.info(), f)
+            incr("output_log.bytes", self.bytes)
+            prune_logs(self.directory)
+        return self.info()
+
+    def info(self) -> Dict[str, Any]:
+        lines = self.newlines + (0 if self._ends_with_newline or not self.bytes else 1)
+        out: Dict[str, Any] = {"run_id": self.run_id, "lines": lines, "bytes": self.bytes, "truncated": self.truncated}
+        if self.truncated:
+            out["bytes_dropped"] = self.bytes_seen - self.bytes
+        return out
+
+    def discard(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        for p in (self.path, self.idx_path, self.meta_path):
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
+
+
+def open_output_log(max_bytes: Optional[int] = None) -> Optional[OutputLog]:
+    limit = _max_bytes_from_env() if max_bytes is None else max_bytes
+    if limit <= 0:
+        return None
+    try:
+        return OutputLog(max_bytes=limit)
+    except OSError:
+        return None
+
+
+def prune_logs(directory: Optional[Path] = None, keep: int = MAX_KEPT_LOGS) -> int:
+    d = directory or _log_dir()
+    metas = []
+    for e in os.scandir(d):
+        if e.name.endswith(".json"):
+            try:
+                metas.append((e.stat().st_mtime, e.name[: -len(".json")]))
+            except OSError:
+                continue
+    removed = 0
+    for _, run_id in sorted(metas, reverse=True)[max(0, keep) :]:
+        for p in _paths(run_id, d):
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
+        removed += 1
+    return removed
+
+
+def keep_log(run_id: str) -> bool:
+    # Whether a log named in a cached result still exists; touching its meta file moves it to
+    # the back of the pruning order, since the result now points at it again.
+    if not _RUN_ID_RE.match(run_id or ""):
+        return False
+    paths = _paths(run_id)
+    if not all(p.is_file() for p in paths):
+        return False
+    try:
+        os.utime(paths[2])
+    except OSError:
+        return False
+    return True
+
+
+class _Reader:
+    def __init__(self, run_id: str):
+        if not _RUN_ID_RE.match(run_id or ""):
+            raise ValueError(f"invalid run_id: {run_id!r}")
+        self.path, idx_path, meta_path = _paths(run_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self.offsets = array("Q")
+            with open(idx_path, "rb") as f:
+                self.offsets.frombytes(f.read())
+            self.size = os.path.getsize(self.path)
+        except (OSError, ValueError):
+            raise ValueError(f"unknown or expired run_id: {run_id}")
+        self.lines = int(self.meta.get("lines") or 0)
+        self._f = open(self.path, "rb")
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+        self._f.close()
+
+    def line_start(self, index: int) -> int:
+        # Byte offset of 0-based line `index`: nearest indexed line, then at most INDEX_STRIDE finds.
+        k = min(index // INDEX_STRIDE, len(self.offsets) - 1)
+        pos = self.offsets[k]
+        for _ in range(index - k * INDEX_STRIDE):
+            nl = self.mm.find(b"\n", pos)
+            if nl < 0:
+                return self.size
+            pos = nl + 1
+        return pos
+
+    def line_at(self, pos: int) -> Tuple[int, int]:
+        # (0-based line number, end offset) of the line starting at `pos`.
+        k = bisect_right(self.offsets, pos) - 1
+        number = k * INDEX_STRIDE + self.mm[self.offsets[k] : pos].count(b"\n")
+        end = self.mm.find(b"\n", pos)
+        return number, self.size if end < 0 else end
+
+    def text(self, start: int, end: int) -> str:
+        raw = self.mm[start : min(end, start + DEFAULT_MAX_LINE_CHARS * 4)]
+        text = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if len(text) > DEFAULT_MAX_LINE_CHARS or end - start > len(raw):
+            text = text[:DEFAULT_MAX_LINE_CHARS] + " ...[truncated]"
+        return text
+
+    def lines_from(self, index: int, count: int) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        if self.mm is None:
+            return out
+        pos = self.line_start(index)
+        while len(out) < count and pos < self.size:
+            end = self.mm.find(b"\n", pos)
+            end = self.size if end < 0 else end
+            out.append({"line": index + 1, "text": self.text(pos, end)})
+            index += 1
+            pos = end + 1
+        return out
+
+
+def _log_info(reader: _Reader) -> Dict[str, Any]:
+    return {k: reader.meta.get(k) for k in ("run_id", "lines", "bytes", "truncated")}
+
+
+def read_range(run_id: str, start_line: int = 1, count: int = 200) -> Dict[str, Any]:
+    # start_line is 1-based; 0 or negative counts from the end (-99 = the last 100 lines).
+    try:
+        reader = _Reader(run_id)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    try:
+        count = max(1, min(int(count), MAX_RANGE_LINES))
+        start = int(start_line)
+        if start <= 0:
+            start = max(1, reader.lines + start)
+        lines = reader.lines_from(start - 1, count)
+        return {
+            "ok": True,
+            **_log_info(reader),
+            "start_line": start,
+            "content": lines,
+            "next_line": start + len(lines) if start + len(lines) <= reader.lines else None,
+        }
+    finally:
+        reader.close()
+
+
+def grep_log(
+    run_id: str,
+    pattern: str,
+    *,
+    ignore_case: bool = False,
+    max_matches: int = 50,
+    context: int = 0,
+    start_line: int = 1,
+) -> Dict[str, Any]:
+    try:
+        rx = re.compile(pattern.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    except re.error as e:
+        return {"ok": False, "error": f"invalid pattern: {e}"}
+    try:
+        reader = _Reader(run_id)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    try:
+        max_matches = max(1, min(int(max_matches), MAX_GREP_MATCHES))
+        context = max(0, min(int(context), MAX_CONTEXT_LINES))
+        matches: List[Dict[str, Any]] = []
+        next_line: Optional[int] = None
+        if reader.mm is not None:
+            pos = reader.line_start(max(0, int(start_line) - 1))
+            while pos < reader.size:
+                m = rx.search(reader.mm, pos)
+                if m is None:
+                    break
+                line_pos = reader.mm.rfind(b"\n", 0, m.start()) + 1
+                number, end = reader.line_at(line_pos)
+                if len(matches) >= max_matches:
+                    next_line = number + 1
+                    break
+                hit: Dict[str, Any] = {"line": number + 1, "text": reader.text(line_pos, end)}
+                if context:
+                    first = max(0, number - context)
+                    hit["before"] = reader.lines_from(first, number - first)
+                    hit["after"] = reader.lines_from(number + 1, context)
+                matches.append(hit)
+                pos = max(end + 1, m.end() + (m.end() == m.start()))  # one hit per line
+        return {"ok": True, **_log_info(reader), "pattern": pattern, "matches": matches, "next_line": next_line}
+    finally:
+        reader.close()
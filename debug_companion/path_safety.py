@@ -1,6 +1,15 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.metrics import incr, span
+
+RESOLVE_CACHE_SIZE = 4096
+RESOLVE_CACHE_TTL_SECONDS = 2.0
+_END = object()
 
 
 def _split_allowed_roots(raw: str) -> List[str]:
@@ -23,27 +32,129 @@ def _parse_allowed_roots(raw: str) -> List[Path]:
     return roots
 
 
+class AllowList:
+    # Prefix trie over the parts of the resolved allowed roots: a membership test walks the
+    # candidate's parts once instead of comparing against every root.
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.roots = _parse_allowed_roots(raw)
+        self._trie: Dict[Any, Any] = {}
+        for root in self.roots:
+            node = self._trie
+            for part in root.parts:
+                node = node.setdefault(part, {})
+            node[_END] = True
+
+    def __bool__(self) -> bool:
+        return bool(self.roots)
+
+    def contains(self, resolved: Path) -> bool:
+        node = self._trie
+        for part in resolved.parts:
+            node = node.get(part)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+_ALLOWLIST: Optional[AllowList] = None
+
+
+def _get_allowlist() -> AllowList:
+    # Rebuilt only when MCP_ALLOWED_ROOTS changes.
+    global _ALLOWLIST
+    raw = os.environ.get("MCP_ALLOWED_ROOTS", "")
+    current = _ALLOWLIST
+    if current is None or current.raw != raw:
+        current = AllowList(raw)
+        _ALLOWLIST = current
+    return current
+
+
 def _get_allowed_roots() -> List[Path]:
-    return _parse_allowed_roots(os.environ.get("MCP_ALLOWED_ROOTS", ""))
+    return _get_allowlist().roots
 
 
-def _is_relative_to(path: Path, root: Path) -> bool:
-    try:
-        return path == root or path.is_relative_to(root)
-    except Exception:
+def _stamp(p: Path) -> Optional[Tuple[str, int, int]]:
+    # (path, st_dev, st_ino) of p or of its nearest existing ancestor, following symlinks: if any
+    # component is later replaced by a symlink, the stat lands on another inode (or another
+    # ancestor starts to exist) and the stamp changes.
+    for q in (p, *p.parents):
         try:
-            path.relative_to(root)
-            return True
-        except Exception:
-            return False
+            st = os.stat(q)
+        except OSError:
+            continue
+        return str(q), st.st_dev, st.st_ino
+    return None
+
+
+class ResolveCache:
+    # Bounded LRU of Path.resolve() results. Only symlink-free resolutions are kept (the result
+    # equals the lexically normalized input), and every hit is revalidated with one stat against
+    # the stamp taken when it was stored, so a directory swapped for a symlink is noticed at once.
+
+    def __init__(self, max_entries: int = RESOLVE_CACHE_SIZE, ttl: float = RESOLVE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Path, float, Optional[Tuple[str, int, int]]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def resolve(self, p: Path) -> Path:
+        key = str(p)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+        if hit is not None and now - hit[1] <= self.ttl:
+            if _stamp(hit[0]) == hit[2]:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self.hits += 1
+                incr("path.resolve_cache_hits")
+                return hit[0]
+            with self._lock:
+                self.invalidations += 1
+        with self._lock:
+            self._entries.pop(key, None)
+            self.misses += 1
+        incr("path.resolve_cache_misses")
+
+        with span("path.resolve"):
+            resolved = p.resolve()
+        if p.is_absolute() and str(resolved) == os.path.normpath(key):
+            stamp = _stamp(resolved)
+            with self._lock:
+                self._entries[key] = (resolved, now, stamp)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return resolved
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
+
+
+_RESOLVE_CACHE = ResolveCache()
+
+
+def get_resolve_cache() -> ResolveCache:
+    return _RESOLVE_CACHE
 
 
-def _is_within_allowed_roots(p: Path, allowed_roots: List[Path]) -> bool:
-    rp = p.resolve()
-    for root in allowed_roots:
-        if _is_relative_to(rp, root):
-            return True
-    return False
+def _within(resolved: Path, root: Path) -> bool:
+    root_parts = root.parts
+    return resolved.parts[: len(root_parts)] == root_parts
 
 
 def safe_path(user_path: str, root_dir: Path) -> Path:
@@ -51,25 +162,26 @@ def safe_path(user_path: str, root_dir: Path) -> Path:
     if s == "":
         raise ValueError("path is empty")
 
+    resolve = _RESOLVE_CACHE.resolve
     p = Path(s).expanduser()
-    root = root_dir.resolve()
+    root = resolve(root_dir if root_dir.is_absolute() else Path.cwd() / root_dir)
 
     if not p.is_absolute():
-        resolved = (root_dir / p).resolve()
-        if resolved != root and root not in resolved.parents:
+        resolved = resolve(root / p)
+        if not _within(resolved, root):
             raise ValueError("path escapes root directory")
         return resolved
 
-    resolved = p.resolve()
+    resolved = resolve(p)
 
-    if resolved == root or root in resolved.parents:
+    if _within(resolved, root):
         return resolved
 
-    allowed_roots = _get_allowed_roots()
-    if not allowed_roots:
+    allowlist = _get_allowlist()
+    if not allowlist:
         raise ValueError("absolute paths are disabled (set MCP_ALLOWED_ROOTS)")
 
-    if not _is_within_allowed_roots(resolved, allowed_roots):
+    if not allowlist.contains(resolved):
         raise ValueError("path is outside allowed roots")
 
     return resolved
@@ -0,0 +1,161 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4
+# Share of the budget the error text may take before the code context gets the rest.
+ERROR_SHARE = 0.5
+
+_PROGRESS_RE = re.compile(r"^[.FEsxX]+\s*(?:\[\s*\d+%\])?$")
+_PASSED_RE = re.compile(r"(?:^|\s)PASSED(?:\s|$)|^PASSED ")
+# `=== FAILURES ===`-style banners and `_ _ _` frame separators; section headers naming a test
+# and the final `=== 1 failed in 0.1s ===` line (it has digits) are kept.
+_BANNER_RE = re.compile(r"^={3,}[^0-9]*={3,}$|^(?:_ )+_?$")
+_FRAME_RE = re.compile(r"^\s*(?:File \"[^\"]+\", line \d+|[^\s:][^:]*\.py:\d+:)")
+_SUMMARY_RE = re.compile(r"^(?:FAILED|ERROR) |^E\s|^\S[^:]*\.py:\d+: \w+(?:Error|Exception|Exit)\b|^[\w.]+(?:Error|Exception): ")
+_CONTEXT_LINE_RE = re.compile(r"^(\d+): ")
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough, tokenizer-free estimate (~4 characters per token for code and English).
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clean_error_text(text: str) -> Tuple[List[str], Dict[str, int]]:
+    # Drops pytest progress/passing lines, banners, blank runs and repeated frames/lines.
+    kept: List[str] = []
+    dropped = {"progress": 0, "passed": 0, "banner": 0, "duplicate": 0, "blank": 0}
+    seen_frames = set()
+    prev = None
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if prev == "":
+                dropped["blank"] += 1
+                continue
+            kept.append("")
+            prev = ""
+            continue
+        if _PROGRESS_RE.match(stripped):
+            dropped["progress"] += 1
+            continue
+        if _PASSED_RE.search(stripped):
+            dropped["passed"] += 1
+            continue
+        if _BANNER_RE.match(stripped):
+            dropped["banner"] += 1
+            continue
+        if _FRAME_RE.match(line):
+            key = stripped
+            if key in seen_frames:
+                dropped["duplicate"] += 1
+                continue
+            seen_frames.add(key)
+        elif stripped == prev:
+            dropped["duplicate"] += 1
+            continue
+        kept.append(line.rstrip())
+        prev = stripped
+    while kept and kept[-1] == "":
+        kept.pop()
+    return kept, dropped
+
+
+def _fit_error(lines: List[str], budget_chars: int) -> Tuple[str, bool]:
+    text = "\n".join(lines)
+    if len(text) <= budget_chars:
+        return text, False
+    # Failure summary lines (E lines, exception lines, FAILED/ERROR, final file:line: Exc) first,
+    # then the rest of the output from the end, which is closest to the failure.
+    summary_idx = [i for i, ln in enumerate(lines) if _SUMMARY_RE.match(ln.strip())]
+    chosen = set()
+    used = 0
+    for i in summary_idx + list(range(len(lines) - 1, -1, -1)):
+        if i in chosen:
+            continue
+        cost = len(lines[i]) + 1
+        if used + cost > budget_chars:
+            if i in summary_idx:
+                continue
+            break
+        chosen.add(i)
+        used += cost
+    out: List[str] = []
+    last = -1
+    for i in sorted(chosen):
+        if i != last + 1:
+            out.append("...")
+        out.append(lines[i])
+        last = i
+    if last != len(lines) - 1:
+        out.append("...")
+    return "\n".join(out), True
+
+
+def _fit_code(code_context: str, focus_line: Optional[int], budget_chars: int) -> Tuple[str, bool]:
+    if len(code_context) <= budget_chars:
+        return code_context, False
+    lines = code_context.splitlines()
+    numbers: List[Optional[int]] = []
+    for ln in lines:
+        m = _CONTEXT_LINE_RE.match(ln)
+        numbers.append(int(m.group(1)) if m else None)
+    if focus_line is not None and focus_line in numbers:
+        center = numbers.index(focus_line)
+    else:
+        center = len(lines) // 2
+    # Closest lines to the failure first.
+    order = sorted(range(len(lines)), key=lambda i: (abs(i - center), i))
+    chosen = set()
+    used = 0
+    for i in order:
+        cost = len(lines[i]) + 1
+        if used + cost > budget_chars:
+            break
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        chosen.add(center)
+    idx = sorted(chosen)
+    out = lines[idx[0] : idx[-1] + 1]
+    if idx[0] > 0:
+        out.insert(0, "...")
+    if idx[-1] < len(lines) - 1:
+        out.append("...")
+    return "\n".join(out), True
+
+
+def build_analysis_inputs(
+    *,
+    error_message: str,
+    code_context: str,
+    token_budget: int,
+    focus_line: Optional[int] = None,
+) -> Tuple[str, str, Dict[str, Any]]:
+    before = estimate_tokens(error_message or "") + estimate_tokens(code_context or "")
+    if token_budget <= 0:
+        return error_message, code_context, {"token_budget": 0, "tokens_before": before, "tokens_after": before}
+
+    lines, dropped = clean_error_text(error_message)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    error_text = "\n".join(lines)
+    code_room = max(0, budget_chars - len(error_text))
+    if len(code_context or "") > code_room:
+        # Both parts do not fit: split the budget, giving unused room of either side to the other.
+        error_cap = max(int(budget_chars * ERROR_SHARE), budget_chars - len(code_context or ""))
+        error_text, error_trimmed = _fit_error(lines, error_cap)
+        code_text, code_trimmed = _fit_code(code_context or "", focus_line, max(0, budget_chars - len(error_text)))
+    else:
+        error_trimmed = code_trimmed = False
+        code_text = code_context
+
+    after = estimate_tokens(error_text) + estimate_tokens(code_text or "")
+    stats = {
+        "token_budget": token_budget,
+        "tokens_before": before,
+        "tokens_after": after,
+        "dropped_lines": {k: v for k, v in dropped.items() if v},
+        "error_trimmed": error_trimmed,
+        "code_trimmed": code_trimmed,
+    }
+    return error_text, code_text, stats
@@ -0,0 +1,281 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import _pytest
+import pluggy
+import pytest
+
+# Loaded explicitly with `-p debug_companion.pytest_plugin` (autoload is disabled for runs).
+# Writes one JSON object per line to the file named by DEBUG_COMPANION_REPORT, restricts
+# the run to the node ids listed in DEBUG_COMPANION_SELECT, orders (and, with a time budget,
+# selects) tests by the history plan in DEBUG_COMPANION_PLAN, records a per-test line
+# coverage map to DEBUG_COMPANION_COVERAGE, sends the console output to the file named by
+# DEBUG_COMPANION_OUTPUT, and ends the session once DEBUG_COMPANION_MAX_CLUSTERS distinct failure
+# clusters are known when those are set.
+
+REPORT_ENV = "DEBUG_COMPANION_REPORT"
+SELECT_ENV = "DEBUG_COMPANION_SELECT"
+PLAN_ENV = "DEBUG_COMPANION_PLAN"
+COVERAGE_ENV = "DEBUG_COMPANION_COVERAGE"
+OUTPUT_ENV = "DEBUG_COMPANION_OUTPUT"
+CLUSTERS_ENV = "DEBUG_COMPANION_MAX_CLUSTERS"
+MAX_MESSAGE_CHARS = 2000
+MAX_FRAMES = 60
+MAX_PLAN_IDS = 50
+
+_INTERNAL_DIRS = tuple(
+    os.path.dirname(os.path.abspath(m.__file__)) + os.sep
+    for m in (pytest, _pytest, pluggy)
+)
+
+_out = None
+_cov = None
+_clusters = None
+_max_clusters = 0
+_session_started = 0.0
+# nodeid -> [outcome, summed duration of setup/call/teardown]
+_tests: Dict[str, List[Any]] = {}
+
+
+def _redirect_output(path: str) -> None:
+    # Runs at import (-p plugins load before pytest sets up capturing), so everything pytest
+    # prints goes to the file instead of a pipe the server would hold in memory. Removed from
+    # the environment so pytest runs started by the tests do not write there too.
+    os.environ.pop(OUTPUT_ENV, None)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+
+if os.environ.get(OUTPUT_ENV, "").strip():
+    _redirect_output(os.environ[OUTPUT_ENV].strip())
+
+
+def _write(record: Dict[str, Any]) -> None:
+    if _out is None:
+        return
+    _out.write(json.dumps(record, default=str) + "\n")
+    _out.flush()
+
+
+def _is_hidden(entry) -> bool:
+    try:
+        return bool(entry.frame.f_locals.get("__tracebackhide__"))
+    except Exception:
+        return False
+
+
+def _frames(excinfo) -> List[Dict[str, Any]]:
+    frames: List[Dict[str, Any]] = []
+    for entry in excinfo.traceback:
+        path = str(entry.path)
+        if path.startswith(_INTERNAL_DIRS) or _is_hidden(entry):
+            continue
+        frames.append({"path": path, "line": entry.lineno + 1, "function": entry.name})
+    return frames[-MAX_FRAMES:]
+
+
+def _message(excinfo) -> str:
+    try:
+        msg = str(excinfo.value)
+    except Exception as e:
+        msg = f"<unprintable exception: {e}>"
+    return msg[:MAX_MESSAGE_CHARS]
+
+
+def pytest_configure(config) -> None:
+    global _out, _cov, _clusters, _max_clusters, _session_started
+    path = os.environ.get(REPORT_ENV, "").strip()
+    if path and _out is None:
+        _out = open(path, "a", encoding="utf-8")
+        _write({"event": "start", "invocation_dir": str(config.invocation_params.dir)})
+    if os.environ.get(COVERAGE_ENV, "").strip() and _cov is None:
+        _cov = _start_coverage(str(config.invocation_params.dir))
+    _max_clusters = int(os.environ.get(CLUSTERS_ENV, "").strip() or 0)
+    if _max_clusters > 0:
+        from debug_companion.fingerprint import FailureClusters
+
+        _clusters = FailureClusters(Path(config.invocation_params.dir).resolve())
+    _session_started = time.monotonic()
+
+
+def _start_coverage(root: str):
+    try:
+        import coverage
+    except ImportError:
+        return None  # no map is written, so every test counts as new next time
+    cov = coverage.Coverage(data_file=None, source=[root], config_file=False)
+    cov.start()
+    return cov
+
+
+def _write_coverage_map(path: str, root: str) -> None:
+    data = _cov.get_data()
+    tests: Dict[str, Dict[str, List[int]]] = {}
+    for filename in data.measured_files():
+        rel = os.path.relpath(filename, root).replace(os.sep, "/")
+        if rel.startswith("../"):
+            continue
+        for lineno, contexts in data.contexts_by_lineno(filename).items():
+            for ctx in contexts:
+                if ctx:
+                    tests.setdefault(ctx, {}).setdefault(rel, []).append(lineno)
+    for files in tests.values():
+        for lines in files.values():
+            lines.sort()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"root": root, "tests": tests}, f)
+    os.replace(tmp, path)
+
+
+def pytest_unconfigure(config) -> None:
+    global _out, _cov, _clusters
+    _clusters = None
+    if _cov is not None:
+        _cov.stop()
+        _write_coverage_map(os.environ[COVERAGE_ENV], str(config.invocation_params.dir))
+        _cov = None
+    if _out is not None:
+        _out.close()
+        _out = None
+
+
+def pytest_collection_modifyitems(session, config, items) -> None:
+    path = os.environ.get(SELECT_ENV, "").strip()
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            wanted = {line.rstrip("\n") for line in f if line.strip()}
+        selected = [it for it in items if it.nodeid in wanted]
+        deselected = [it for it in items if it.nodeid not in wanted]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+    path = os.environ.get(PLAN_ENV, "").strip()
+    if path:
+        _apply_plan(path, config, items)
+
+
+def _apply_plan(path: str, config, items) -> None:
+    # Stable sort by (class, expected duration): last failures first, then flaky, new and the
+    # rest, fastest first within each. With a budget, tests are taken in that order while
+    # their expected durations still fit; at least one test always runs.
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    tests = plan.get("tests") or {}
+    default = [int(plan.get("new", 2)), float(plan.get("default") or 0.0)]
+    keys = {it.nodeid: tuple(tests.get(it.nodeid) or default) for it in items}
+    ordered = sorted(items, key=lambda it: keys[it.nodeid])
+    budget = float(plan.get("budget") or 0.0)
+    selected, deselected, used = ordered, [], 0.0
+    if budget > 0:
+        selected = []
+        for it in ordered:
+            cost = float(keys[it.nodeid][1])
+            if not selected or used + cost <= budget:
+                selected.append(it)
+                used += cost
+            else:
+                deselected.append(it)
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+    else:
+        used = sum(float(keys[it.nodeid][1]) for it in ordered)
+    items[:] = selected
+    _write(
+        {
+            "event": "plan",
+            "selected": len(selected),
+            "deselected": len(deselected),
+            "deselected_ids": [it.nodeid for it in deselected[:MAX_PLAN_IDS]],
+            "first": [it.nodeid for it in selected[:MAX_PLAN_IDS]],
+            "estimated_seconds": round(used, 3),
+        }
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    # Lines executed during setup/call/teardown are attributed to the test's node id.
+    if _cov is not None:
+        _cov.switch_context(item.nodeid)
+    yield
+    if _cov is not None:
+        _cov.switch_context("")
+
+
+def pytest_runtest_logreport(report) -> None:
+    entry = _tests.setdefault(report.nodeid, ["passed", 0.0])
+    entry[1] += float(getattr(report, "duration", 0.0) or 0.0)
+    if report.failed:
+        entry[0] = "failed"
+    elif report.skipped and entry[0] == "passed":
+        entry[0] = "skipped"
+    if report.when == "teardown":
+        _tests.pop(report.nodeid, None)
+        _write({"event": "test", "nodeid": report.nodeid, "outcome": entry[0], "duration": round(entry[1], 6)})
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    rep = outcome.get_result()
+    if not rep.failed or call.excinfo is None:
+        return
+    record = {
+        "event": "failure",
+        "nodeid": item.nodeid,
+        "when": call.when,
+        "exc_type": call.excinfo.typename,
+        "message": _message(call.excinfo),
+        "frames": _frames(call.excinfo),
+        "duration": round(float(call.duration), 6),
+    }
+    _write(record)
+    # Like --maxfail, but counting failure clusters: the session ends after this test's teardown,
+    # so the FAILURES and summary sections are still printed.
+    if _clusters is not None:
+        _clusters.add(record)
+        if len(_clusters) >= _max_clusters:
+            item.session.shouldfail = f"stopping after {len(_clusters)} failure clusters"
+
+
+def pytest_collectreport(report) -> None:
+    if not report.failed:
+        return
+    crash = getattr(report.longrepr, "reprcrash", None)
+    frames: List[Dict[str, Any]] = []
+    if crash is not None:
+        frames.append({"path": str(crash.path), "line": int(crash.lineno), "function": "<module>"})
+    text = str(report.longrepr)
+    err_lines = [ln[1:].strip() for ln in text.splitlines() if ln.startswith("E ")]
+    first: Optional[str] = err_lines[-1] if err_lines else None
+    exc_type, _, msg = (first or "").partition(":")
+    _write(
+        {
+            "event": "failure",
+            "nodeid": report.nodeid,
+            "when": "collect",
+            "exc_type": exc_type.strip() if first and msg else "CollectError",
+            "message": (msg.strip() if first and msg else text)[-MAX_MESSAGE_CHARS:],
+            "frames": frames,
+            "duration": 0.0,
+        }
+    )
+
+
+def pytest_sessionfinish(session, exitstatus) -> None:
+    _write(
+        {
+            "event": "session",
+            "exit_code": int(exitstatus),
+            "duration": round(time.monotonic() - _session_started, 6),
+        }
+    )
@@ -1,21 +1,63 @@
+import asyncio
 import os
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Any, Callable, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
+from debug_companion.history import record_run, write_plan
+from debug_companion.metrics import incr, span
+from debug_companion.failure_records import (
+    CLUSTERS_ENV,
+    OUTPUT_ENV,
+    PLAN_ENV,
+    ReportTailer,
+    discard_report,
+    new_report_path,
+    plugin_args,
+    plugin_env,
+    read_report,
+)
+from debug_companion.output_buffer import LineRingBuffer, PytestProgress
+from debug_companion.output_log import OutputLog, open_output_log
 from debug_companion.path_safety import safe_path
+from debug_companion.result_cache import cached_result, run_cache_key, store_result
+from debug_companion.worker_pool import get_warm_pool, tail_file_lines, warm_pool_supported
 
+MIN_TIMEOUT_SECONDS = 5
+MAX_TIMEOUT_SECONDS = 300
+MAX_OUTPUT_LINES = 2000
+PROGRESS_INTERVAL_SECONDS = 0.25
+REPORT_POLL_SECONDS = 0.05
+MAX_TEST_EVENTS = 200_000
 
-def run_pytest_impl(
+OnRecord = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def project_dir_for(tgt_path: Path, root_dir: Path) -> str:
+    # pytest runs from the server root for targets under it, else from the target's directory.
+    root = root_dir.resolve()
+    tp = tgt_path.resolve()
+    if tp == root or root in tp.parents:
+        return str(root)
+    return str(tp if tp.is_dir() else tp.parent)
+
+
+def prepare_run(
     *,
     target: str,
     root_dir: Path,
     default_target: str,
     max_output_lines: int,
     timeout_seconds: int,
-    logger,
-    subprocess_run: Callable[..., Any],  # <-- NEW
+    maxfail: int = 1,
+    extra_args: Optional[List[str]] = None,
+    extra_env: Optional[Dict[str, str]] = None,
+    max_timeout_seconds: int = MAX_TIMEOUT_SECONDS,
 ) -> Dict[str, Any]:
     tgt = (target or "").strip() or default_target
 
@@ -27,54 +69,204 @@ def run_pytest_impl(
     if not tgt_path.exists():
         return {"ok": False, "error": f"target not found: {tgt}"}
 
-    max_output_lines = max(1, min(int(max_output_lines), 2000))
-    timeout_seconds = max(5, min(int(timeout_seconds), 300))
+    max_output_lines = max(1, min(int(max_output_lines), MAX_OUTPUT_LINES))
+    timeout_seconds = max(MIN_TIMEOUT_SECONDS, min(int(timeout_seconds), int(max_timeout_seconds)))
 
-    cmd = [sys.executable, "-m", "pytest", "-q", "--maxfail=1", str(tgt_path)]
+    cmd = [sys.executable, "-m", "pytest", "-q"]
+    if maxfail > 0:
+        cmd.append(f"--maxfail={int(maxfail)}")
+    cmd.extend([*plugin_args(), *(extra_args or []), str(tgt_path)])
 
-    env = dict(os.environ)
+    # Structured failure records are written by our plugin to a side-channel file, independent
+    # of how much console output is kept.
+    report_path = new_report_path()
+    env = plugin_env(dict(os.environ), report_path)
     env["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"
+    env.update(extra_env or {})
+
+    project_cwd = project_dir_for(tgt_path, root_dir)
+
+    return {
+        "ok": True,
+        "started": time.monotonic(),
+        "target": tgt,
+        "target_path": tgt_path,
+        "cmd": cmd,
+        "env": env,
+        "cwd": project_cwd,
+        "report_path": report_path,
+        "max_output_lines": max_output_lines,
+        "timeout_seconds": timeout_seconds,
+    }
+
+
+def _run_warm(
+    run: Dict[str, Any],
+    logger,
+    stop: Optional[threading.Event] = None,
+    on_start: Optional[Callable[[str], Any]] = None,
+) -> Dict[str, Any]:
+    cmd = run["cmd"]
+    log = open_output_log()
+    try:
+        with span("pytest.warm_run"):
+            res = get_warm_pool().run(
+                args=cmd[3:],
+                cwd=run["cwd"],
+                env=run["env"],
+                timeout=run["timeout_seconds"],
+                max_output_lines=run["max_output_lines"],
+                on_output=log.adopt if log is not None else None,
+                on_start=on_start,
+                stop=stop,
+            )
+    except Exception as e:
+        if log is not None:
+            log.discard()
+        logger.warning("Warm pool failed, falling back to a cold run: %s", e)
+        return {"ok": False, "warm_error": str(e)}
+
+    base = {
+        "cmd": cmd,
+        "target": run["target"],
+        "output_tail": res["output_tail"],
+        "output_line_count": res["output_line_count"],
+        "python": sys.executable,
+        "cwd": run["cwd"],
+        "runner": "warm",
+        "worker_pid": res["worker_pid"],
+    }
+    if log is not None:
+        base["output_log"] = log.close()
+    if res["timed_out"]:
+        return {"ok": False, "error": f"pytest timed out ({run['timeout_seconds']}s)", **base}
+    if res["killed"]:
+        base["stopped"] = True
+    return {"ok": True, "exit_code": res["exit_code"], **base}
+
+
+def attach_plan(run: Dict[str, Any], *, prioritize: bool, time_budget_seconds: float) -> None:
+    # Orders the run by test history (last failures first, then fastest first) and, with a time
+    # budget (capped at the run's timeout), runs only the most valuable tests that fit.
+    if not prioritize and time_budget_seconds <= 0:
+        return
+    budget = min(float(time_budget_seconds), float(run["timeout_seconds"])) if time_budget_seconds > 0 else 0.0
+    path, info = write_plan(run["cwd"], budget_seconds=budget)
+    run["env"][PLAN_ENV] = path
+    run["plan_path"] = path
+    run["plan_info"] = info
 
-    root = root_dir.resolve()
-    tp = tgt_path.resolve()
-    if tp == root or root in tp.parents:
-        project_cwd = str(root)
-    else:
-        project_cwd = str(tp if tp.is_dir() else tp.parent)
+
+def finish_run(run: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    with span("pytest.read_report"):
+        res["failure_records"] = read_report(run["report_path"])
+        tests = read_report(run["report_path"], max_records=MAX_TEST_EVENTS, event="test")
+        plan = read_report(run["report_path"], max_records=1, event="plan") if run.get("plan_path") else []
+    if run.get("plan_path"):
+        res["plan"] = {**run["plan_info"], **{k: v for k, v in (plan[0] if plan else {}).items() if k != "event"}}
+    # Queued for the history writer thread; the run does not wait for the database.
+    record_run(
+        run["cwd"],
+        tests,
+        target=run["target"],
+        exit_code=res.get("exit_code"),
+        wall_seconds=round(time.monotonic() - run["started"], 6),
+    )
+    return res
+
+
+def discard_run_files(run: Dict[str, Any]) -> None:
+    discard_report(run["report_path"])
+    if run.get("plan_path"):
+        discard_report(run["plan_path"])
+
+
+def run_pytest_impl(
+    *,
+    target: str,
+    root_dir: Path,
+    default_target: str,
+    max_output_lines: int,
+    timeout_seconds: int,
+    logger,
+    subprocess_run: Callable[..., Any],  # <-- NEW
+    warm: bool = False,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    run = prepare_run(
+        target=target,
+        root_dir=root_dir,
+        default_target=default_target,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+    )
+    if not run["ok"]:
+        return run
+
+    try:
+        if use_cache:
+            key, info = run_cache_key(run, extra=[run["max_output_lines"]])
+            hit = cached_result(key, info)
+            if hit is not None:
+                logger.info("Result cache hit: %s", info["key"])
+                return hit
+        res = finish_run(run, _run_sync(run, logger, subprocess_run, warm))
+        return store_result(key, info, res) if use_cache else res
+    finally:
+        discard_report(run["report_path"])
+
+
+def _run_sync(run: Dict[str, Any], logger, subprocess_run: Callable[..., Any], warm: bool) -> Dict[str, Any]:
+    tgt = run["target"]
+    cmd = run["cmd"]
+    env = run["env"]
+    project_cwd = run["cwd"]
+    max_output_lines = run["max_output_lines"]
+    timeout_seconds = run["timeout_seconds"]
 
     logger.info("Running: %s", " ".join(cmd))
     logger.info("CWD: %s", project_cwd)
 
+    warm_error = ""
+    if warm and warm_pool_supported():
+        res = _run_warm(run, logger)
+        if "warm_error" not in res:
+            return res
+        warm_error = res["warm_error"]
+    elif warm:
+        warm_error = "warm pool requires os.fork"
+
+    incr("pytest.subprocesses")
+    # The plugin sends pytest's console output to out_path while it runs; the pipes only carry
+    # what was printed before the plugin loaded (the subprocess_run seam stays subprocess.run).
+    fd, out_path = tempfile.mkstemp(prefix="dc-pytest-", suffix=".log")
+    os.close(fd)
     try:
-        proc = subprocess_run(
-            cmd,
-            cwd=project_cwd,
-            capture_output=True,
-            text=True,
-            timeout=timeout_seconds,
-            env=env,
-            stdin=subprocess.DEVNULL,
-        )
+        with span("pytest.subprocess"):
+            proc = subprocess_run(
+                cmd,
+                cwd=project_cwd,
+                capture_output=True,
+                text=True,
+                timeout=timeout_seconds,
+                env={**env, OUTPUT_ENV: out_path},
+                stdin=subprocess.DEVNULL,
+            )
     except subprocess.TimeoutExpired as e:
         stdout = getattr(e, "stdout", None)
         if stdout is None:
             stdout = getattr(e, "output", "")
-        stderr = getattr(e, "stderr", "") or ""
-        out = (stdout or "") + ("\n" + stderr if stderr else "")
-
-        lines = out.splitlines()
-        tail = lines[-max_output_lines:]
         return {
             "ok": False,
             "error": f"pytest timed out ({timeout_seconds}s)",
             "cmd": cmd,
             "target": tgt,
-            "output_tail": "\n".join(tail),
-            "output_line_count": len(lines),
+            **_collect_output(_text(stdout, getattr(e, "stderr", "")), out_path, max_output_lines),
             "python": sys.executable,
             "cwd": project_cwd,
         }
     except Exception as e:
+        discard_report(out_path)
         return {
             "ok": False,
             "error": f"failed to run pytest: {e}",
@@ -84,19 +276,346 @@ def run_pytest_impl(
             "cwd": project_cwd,
         }
 
-    output = (getattr(proc, "stdout", "") or "") + (
-        "\n" + getattr(proc, "stderr", "") if getattr(proc, "stderr", "") else ""
-    )
-    lines = output.splitlines()
-    tail = lines[-max_output_lines:]
-
-    return {
+    res = {
         "ok": True,
         "target": tgt,
         "exit_code": int(getattr(proc, "returncode", 0)),
         "cmd": cmd,
-        "output_tail": "\n".join(tail),
-        "output_line_count": len(lines),
+        **_collect_output(_text(getattr(proc, "stdout", ""), getattr(proc, "stderr", "")), out_path, max_output_lines),
+        "python": sys.executable,
+        "cwd": project_cwd,
+    }
+    if warm_error:
+        res["warm_error"] = warm_error
+    return res
+
+
+def _text(stdout: Any, stderr: Any) -> str:
+    if isinstance(stdout, bytes):
+        stdout = stdout.decode("utf-8", errors="replace")
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", errors="replace")
+    return (stdout or "") + ("\n" + stderr if stderr else "")
+
+
+def _collect_output(piped: str, out_path: str, max_output_lines: int) -> Dict[str, Any]:
+    # Output tail, line count and on-disk log of a sync run: the (short) piped text, then the
+    # output file, which is read in chunks and removed.
+    lines = piped.splitlines()
+    file_tail: List[str] = []
+    count = 0
+    log = open_output_log()
+    try:
+        if log is not None and piped:
+            log.feed(piped.encode("utf-8", errors="replace") + (b"" if piped.endswith("\n") else b"\n"))
+        if os.path.getsize(out_path):
+            file_tail, count = tail_file_lines(out_path, max_output_lines)
+            if log is not None:
+                log.adopt(out_path)
+    except OSError:
+        pass
+    finally:
+        discard_report(out_path)
+    out: Dict[str, Any] = {
+        "output_tail": "\n".join((lines + file_tail)[-max_output_lines:]),
+        "output_line_count": len(lines) + count,
+    }
+    if log is not None:
+        out["output_log"] = log.close()
+    return out
+
+
+def _kill_process_tree(proc: "asyncio.subprocess.Process") -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        if sys.platform != "win32":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _stream_output(
+    stream: Any,
+    buf: LineRingBuffer,
+    progress: PytestProgress,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]],
+    log: Optional[OutputLog] = None,
+) -> None:
+    if stream is None:
+        return
+    last_sent = 0.0
+    pending = False
+    while True:
+        chunk = await stream.read(65536)
+        if log is not None:
+            log.feed(chunk)
+        lines = buf.feed(chunk) if chunk else buf.close()
+        for line in lines:
+            pending = progress.feed_line(line) or pending
+        pending = progress.feed_partial(buf.partial_text()) or pending
+        if on_progress is not None and pending:
+            now = time.monotonic()
+            if not chunk or now - last_sent >= PROGRESS_INTERVAL_SECONDS:
+                last_sent = now
+                pending = False
+                try:
+                    await on_progress({**progress.snapshot(), "message": progress.message()})
+                except Exception:
+                    pass
+        if not chunk:
+            return
+
+
+async def run_pytest_async_impl(
+    *,
+    target: str,
+    root_dir: Path,
+    default_target: str,
+    max_output_lines: int,
+    timeout_seconds: int,
+    logger,
+    warm: bool = False,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    use_cache: bool = False,
+    maxfail: int = 1,
+    max_clusters: int = 0,
+    on_record: Optional[OnRecord] = None,
+    max_timeout_seconds: int = MAX_TIMEOUT_SECONDS,
+    prioritize: bool = False,
+    time_budget_seconds: float = 0,
+) -> Dict[str, Any]:
+    # max_clusters > 0 makes the plugin end the session (as --maxfail does) once that many
+    # distinct failure clusters are known.
+    run = prepare_run(
+        target=target,
+        root_dir=root_dir,
+        default_target=default_target,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+        maxfail=maxfail,
+        extra_env={CLUSTERS_ENV: str(int(max_clusters))} if max_clusters > 0 else None,
+        max_timeout_seconds=max_timeout_seconds,
+    )
+    if not run["ok"]:
+        return run
+
+    try:
+        await asyncio.to_thread(attach_plan, run, prioritize=prioritize, time_budget_seconds=time_budget_seconds)
+        if use_cache:
+            extra = [run["max_output_lines"], prioritize, time_budget_seconds, max_clusters]
+            key, info = await asyncio.to_thread(run_cache_key, run, extra)
+            hit = cached_result(key, info)
+            if hit is not None:
+                logger.info("Result cache hit: %s", info["key"])
+                return hit
+        res = finish_run(run, await execute_run_async(run, logger, warm, on_progress, on_record=on_record))
+        return store_result(key, info, res) if use_cache else res
+    finally:
+        discard_run_files(run)
+
+
+async def _tail_report(run: Dict[str, Any], on_record: OnRecord, done: asyncio.Event) -> None:
+    tailer = ReportTailer(run["report_path"])
+    while True:
+        finished = done.is_set()
+        for rec in tailer.poll():
+            await on_record(rec)
+        if finished:
+            return
+        try:
+            await asyncio.wait_for(done.wait(), REPORT_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+class _FollowFile:
+    # Async reader over the output file a warm run's child writes, for _stream_output. It
+    # returns b"" only once the run is over and everything written has been read.
+
+    def __init__(self):
+        self.done = False
+        self._f = None
+
+    def open(self, path: str) -> None:
+        self._f = open(path, "rb")
+
+    async def read(self, n: int) -> bytes:
+        while True:
+            chunk = self._f.read(n) if self._f is not None else b""
+            if chunk or self.done:
+                return chunk
+            await asyncio.sleep(REPORT_POLL_SECONDS)
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+
+
+async def _execute_warm(
+    run: Dict[str, Any],
+    logger,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]],
+    stop: Optional[asyncio.Event],
+    on_record: Optional[OnRecord],
+) -> Dict[str, Any]:
+    # The fork server enforces the timeout itself; the thread only waits for its reply. `stop`
+    # and cancellation set `halt`, which makes the thread ask the fork server to kill the run.
+    halt = threading.Event()
+    output = _FollowFile()
+    progress = PytestProgress()
+    finished = asyncio.Event()
+    tail_task = asyncio.ensure_future(_tail_report(run, on_record, finished)) if on_record else None
+    follow = asyncio.ensure_future(_stream_output(output, LineRingBuffer(run["max_output_lines"]), progress, on_progress))
+    warm_run = asyncio.ensure_future(asyncio.to_thread(_run_warm, run, logger, halt, output.open))
+    stop_wait = asyncio.ensure_future(stop.wait()) if stop is not None else None
+
+    try:
+        waiters = [warm_run] + ([stop_wait] if stop_wait is not None else [])
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        if not warm_run.done():
+            halt.set()
+        res = await warm_run
+    except asyncio.CancelledError:
+        logger.info("warm pytest run cancelled, killing it")
+        halt.set()
+        await asyncio.wait([warm_run])
+        follow.cancel()
+        if tail_task is not None:
+            tail_task.cancel()
+        output.close()
+        raise
+    finally:
+        if stop_wait is not None:
+            stop_wait.cancel()
+        output.done = True
+        finished.set()
+
+    await follow
+    if tail_task is not None:
+        await tail_task  # drains records written before the run ended
+    output.close()
+    if "warm_error" not in res:
+        res["progress"] = progress.snapshot()
+    return res
+
+
+async def execute_run_async(
+    run: Dict[str, Any],
+    logger,
+    warm: bool,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]],
+    stop: Optional[asyncio.Event] = None,
+    on_record: Optional[OnRecord] = None,
+) -> Dict[str, Any]:
+    # `stop` kills the run early (result gets "stopped": True); `on_record` receives plugin
+    # records while pytest is still running.
+    tgt = run["target"]
+    cmd = run["cmd"]
+    project_cwd = run["cwd"]
+    max_output_lines = run["max_output_lines"]
+    timeout_seconds = run["timeout_seconds"]
+
+    logger.info("Running: %s", " ".join(cmd))
+    logger.info("CWD: %s", project_cwd)
+
+    warm_error = ""
+    if warm and warm_pool_supported():
+        res = await _execute_warm(run, logger, on_progress, stop, on_record)
+        if "warm_error" not in res:
+            return res
+        warm_error = res["warm_error"]
+    elif warm:
+        warm_error = "warm pool requires os.fork"
+
+    incr("pytest.subprocesses")
+    try:
+        with span("pytest.spawn"):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                cwd=project_cwd,
+                env=run["env"],
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=(sys.platform != "win32"),
+            )
+    except Exception as e:
+        return {
+            "ok": False,
+            "error": f"failed to run pytest: {e}",
+            "cmd": cmd,
+            "target": tgt,
+            "python": sys.executable,
+            "cwd": project_cwd,
+        }
+
+    # stdout and stderr are merged and streamed into a bounded ring buffer, so memory stays
+    # O(max_output_lines) however chatty the suite is.
+    buf = LineRingBuffer(max_output_lines)
+    progress = PytestProgress()
+    # The complete output goes to an on-disk log with a line index (read back by run_id).
+    log = open_output_log()
+
+    async def communicate() -> None:
+        with span("pytest.execute"):
+            await _stream_output(proc.stdout, buf, progress, on_progress, log)
+            await proc.wait()
+
+    finished = asyncio.Event()
+    tail_task = asyncio.ensure_future(_tail_report(run, on_record, finished)) if on_record else None
+    comm = asyncio.ensure_future(communicate())
+    stop_wait = asyncio.ensure_future(stop.wait()) if stop is not None else None
+
+    timed_out = False
+    stopped = False
+    try:
+        waiters = [comm] + ([stop_wait] if stop_wait is not None else [])
+        await asyncio.wait(waiters, timeout=timeout_seconds, return_when=asyncio.FIRST_COMPLETED)
+        if not comm.done():
+            if stop is not None and stop.is_set():
+                stopped = True
+            else:
+                timed_out = True
+            _kill_process_tree(proc)
+            await proc.wait()
+            comm.cancel()
+    except asyncio.CancelledError:
+        logger.info("pytest run cancelled, killing pid %s", proc.pid)
+        _kill_process_tree(proc)
+        await proc.wait()
+        comm.cancel()
+        if tail_task is not None:
+            tail_task.cancel()
+        raise
+    finally:
+        if stop_wait is not None:
+            stop_wait.cancel()
+        finished.set()
+        log_info = log.close() if log is not None else None
+
+    if tail_task is not None:
+        await tail_task  # drains records written before the process exited
+
+    buf.close()
+
+    base = {
+        "target": tgt,
+        "cmd": cmd,
+        "output_tail": buf.text(),
+        "output_line_count": buf.line_count,
+        "progress": progress.snapshot(),
         "python": sys.executable,
         "cwd": project_cwd,
     }
+    if warm_error:
+        base["warm_error"] = warm_error
+    if log_info is not None:
+        base["output_log"] = log_info
+    if timed_out:
+        return {"ok": False, "error": f"pytest timed out ({timeout_seconds}s)", **base}
+    if stopped:
+        base["stopped"] = True
+    return {"ok": True, "exit_code": int(proc.returncode or 0), **base}
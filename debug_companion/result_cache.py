@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from debug_companion.cache_dir import get_cache_dir
+from debug_companion.metrics import incr
+from debug_companion.output_log import keep_log
+
+# Files that can change a pytest result besides the .py sources.
+CONFIG_NAMES = {"pyproject.toml", "pytest.ini", "setup.cfg", "tox.ini", "conftest.py"}
+SKIP_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+    ".pytest_cache",
+    ".mypy_cache",
+    ".ruff_cache",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    "node_modules",
+    "site-packages",
+    "build",
+    "dist",
+}
+MAX_MEMO_ENTRIES = 200_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _wanted(name: str) -> bool:
+    return name.endswith(".py") or name in CONFIG_NAMES
+
+
+class TreeHasher:
+    # Merkle-style hash of a project tree. File digests are memoized by (inode, mtime_ns, size),
+    # so an unchanged tree costs one stat per file and no reads. The lock only guards the memo;
+    # concurrent walks may both hash a changed file.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memo: Dict[str, Tuple[int, int, int, str]] = {}
+        self.files_hashed = 0
+
+    def _file_digest(self, path: str, st: os.stat_result) -> str:
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._memo.get(path)
+        if hit is not None and hit[:3] == key:
+            return hit[3]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self.files_hashed += 1
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            self._memo[path] = (*key, digest)
+        return digest
+
+    def _dir_digest(self, path: str) -> Optional[str]:
+        entries: List[Tuple[str, str, str]] = []
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return None
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if e.name in SKIP_DIRS or e.name.startswith("."):
+                            continue
+                        sub = self._dir_digest(e.path)
+                        if sub is not None:
+                            entries.append((e.name, "d", sub))
+                    elif e.is_file() and _wanted(e.name):
+                        entries.append((e.name, "f", self._file_digest(e.path, e.stat())))
+                except OSError:
+                    continue
+        if not entries:
+            return None
+        h = hashlib.sha256()
+        for name, kind, digest in sorted(entries):
+            h.update(f"{name}\0{kind}\0{digest}\n".encode("utf-8", errors="surrogateescape"))
+        return h.hexdigest()
+
+    def tree_hash(self, root: Path) -> str:
+        return self._dir_digest(str(root)) or hashlib.sha256(b"").hexdigest()
+
+
+class ResultCache:
+    # One JSON file per key; least recently used files are evicted once the directory
+    # grows past max_bytes.
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(p)  # LRU touch
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        p = self._path(key)
+        tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stored_at": time.time(), "result": result}, f, default=str)
+        os.replace(tmp, p)
+        self.evict()
+
+    def evict(self) -> int:
+        files = []
+        total = 0
+        for e in os.scandir(self.directory):
+            if not e.name.endswith(".json"):
+                continue
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, e.path))
+            total += st.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+_HASHER = TreeHasher()
+_CACHE: Optional[ResultCache] = None
+
+
+def get_tree_hasher() -> TreeHasher:
+    return _HASHER
+
+
+def get_result_cache() -> ResultCache:
+    global _CACHE
+    directory = get_cache_dir("results")
+    if _CACHE is None or _CACHE.directory != directory:
+        raw = (os.environ.get("MCP_RESULT_CACHE_MAX_MB") or "").strip()
+        max_bytes = int(float(raw) * 1024 * 1024) if raw else DEFAULT_MAX_BYTES
+        _CACHE = ResultCache(directory, max_bytes=max_bytes)
+    return _CACHE
+
+
+def run_cache_key(run: Dict[str, Any], extra: Optional[List[Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    started = time.perf_counter()
+    # pytest runs from cwd with cwd on sys.path, so a target can import anything below it: the
+    # whole cwd tree is hashed, not just the target's project.
+    tree = get_tree_hasher().tree_hash(Path(run["cwd"]))
+    payload = {
+        "tree": tree,
+        "python": sys.executable,
+        "args": run["cmd"][3:],
+        "cwd": run["cwd"],
+        "extra": extra or [],
+    }
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return key, {"key": key[:16], "tree_hash": tree[:16], "hash_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+
+def cached_result(key: str, info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    entry = get_result_cache().get(key)
+    if entry is None:
+        incr("result_cache.misses")
+        return None
+    incr("result_cache.hits")
+    res = dict(entry.get("result") or {})
+    # The full output of the original run may have been pruned since.
+    log = res.get("output_log")
+    if isinstance(log, dict) and not keep_log(str(log.get("run_id") or "")):
+        del res["output_log"]
+    res["cache"] = {**info, "hit": True, "stored_at": entry.get("stored_at")}
+    return res
+
+
+def store_result(key: str, info: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    # Only completed runs are cached; timeouts, stopped runs and spawn errors are retried next time.
+    if res.get("ok") and "exit_code" in res and not res.get("stopped"):
+        try:
+            get_result_cache().put(key, res)
+        except OSError:
+            pass
+    res["cache"] = {**info, "hit": False}
+    return res
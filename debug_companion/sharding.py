@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from debug_companion.history import load_durations
+from debug_companion.failure_records import SELECT_ENV, discard_report, write_selection
+from debug_companion.result_cache import cached_result, run_cache_key, store_result
+from debug_companion.pytest_runner import (
+    MAX_TIMEOUT_SECONDS,
+    execute_run_async,
+    finish_run,
+    prepare_run,
+    run_pytest_async_impl,
+)
+
+MAX_SHARDS = 64
+DEFAULT_TEST_SECONDS = 0.1
+
+
+def resolve_shard_count(shards: int) -> int:
+    cpus = os.cpu_count() or 1
+    n = int(shards)
+    if n <= 0:
+        n = cpus
+    return max(1, min(n, cpus, MAX_SHARDS))
+
+
+def split_shards(node_ids: List[str], n: int, durations: Dict[str, float]) -> List[List[str]]:
+    # Longest-processing-time-first greedy split; tests without history get the median duration.
+    known = [durations[nid] for nid in node_ids if nid in durations]
+    default = statistics.median(known) if known else DEFAULT_TEST_SECONDS
+
+    heap: List[Tuple[float, int]] = [(0.0, i) for i in range(max(1, n))]
+    buckets: List[List[str]] = [[] for _ in range(max(1, n))]
+    for nid in sorted(node_ids, key=lambda x: -durations.get(x, default)):
+        load, idx = heapq.heappop(heap)
+        buckets[idx].append(nid)
+        heapq.heappush(heap, (load + durations.get(nid, default), idx))
+
+    # Within a shard, keep collection order so module/class fixtures are set up once.
+    pos = {nid: i for i, nid in enumerate(node_ids)}
+    return [sorted(b, key=pos.__getitem__) for b in buckets if b]
+
+
+async def collect_node_ids(run: Dict[str, Any], logger) -> Tuple[List[str], str]:
+    cmd = [sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider", str(run["target_path"])]
+    logger.info("Collecting: %s", " ".join(cmd))
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=run["cwd"],
+        env=run["env"],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), run["timeout_seconds"])
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        proc.kill()
+        await proc.wait()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return [], f"pytest collection timed out ({run['timeout_seconds']}s)"
+
+    text = out.decode("utf-8", errors="replace")
+    ids = [ln.strip() for ln in text.splitlines() if "::" in ln and not ln[:1].isspace()]
+    if proc.returncode not in (0, 5):
+        tail = "\n".join(text.splitlines()[-20:])
+        return ids, f"pytest collection failed (exit {proc.returncode}):\n{tail}"
+    return ids, ""
+
+
+def merge_exit_codes(codes: List[int]) -> int:
+    if not codes:
+        return 5
+    if 1 in codes:
+        return 1
+    if all(c in (0, 5) for c in codes):
+        return 0 if 0 in codes else 5
+    return max(codes)
+
+
+async def run_sharded_pytest_async_impl(
+    *,
+    target: str,
+    root_dir: Path,
+    default_target: str,
+    max_output_lines: int,
+    timeout_seconds: int,
+    logger,
+    shards: int,
+    fail_fast: bool = True,
+    on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    base = prepare_run(
+        target=target,
+        root_dir=root_dir,
+        default_target=default_target,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+    )
+    if not base["ok"]:
+        return base
+    discard_report(base["report_path"])
+
+    n = resolve_shard_count(shards)
+    if use_cache:
+        key, info = await asyncio.to_thread(run_cache_key, base, ["shards", n, fail_fast, base["max_output_lines"]])
+        hit = cached_result(key, info)
+        if hit is not None:
+            return hit
+        res = await run_sharded_pytest_async_impl(
+            target=target,
+            root_dir=root_dir,
+            default_target=default_target,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            logger=logger,
+            shards=shards,
+            fail_fast=fail_fast,
+            on_progress=on_progress,
+        )
+        return store_result(key, info, res)
+
+    started = time.monotonic()
+    node_ids, err = await collect_node_ids(base, logger)
+    if err:
+        return {
+            "ok": False,
+            "error": err,
+            "target": base["target"],
+            "cmd": base["cmd"],
+            "python": sys.executable,
+            "cwd": base["cwd"],
+        }
+
+    if n <= 1 or len(node_ids) <= 1:
+        return await run_pytest_async_impl(
+            target=target,
+            root_dir=root_dir,
+            default_target=default_target,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            logger=logger,
+            on_progress=on_progress,
+            maxfail=1 if fail_fast else 0,
+        )
+
+    buckets = split_shards(node_ids, n, await asyncio.to_thread(load_durations, base["cwd"]))
+    per_shard_lines = max(1, base["max_output_lines"] // len(buckets))
+    # Collection already used part of the budget.
+    remaining = max(1, int(base["timeout_seconds"] - (time.monotonic() - started)))
+
+    runs: List[Dict[str, Any]] = []
+    try:
+        for bucket in buckets:
+            select_path = write_selection(bucket)
+            run = prepare_run(
+                target=target,
+                root_dir=root_dir,
+                default_target=default_target,
+                max_output_lines=per_shard_lines,
+                timeout_seconds=min(remaining, MAX_TIMEOUT_SECONDS),
+                maxfail=1 if fail_fast else 0,
+                extra_args=["-p", "no:cacheprovider"],
+                extra_env={SELECT_ENV: select_path},
+            )
+            run["select_path"] = select_path
+            runs.append(run)
+
+        # Each shard has its own stop event, set when *another* shard reports a failure, so the
+        # failing shard itself finishes normally (its own --maxfail=1 ends it).
+        stops = [asyncio.Event() for _ in runs] if fail_fast else []
+        snapshots: List[Dict[str, Any]] = [{} for _ in runs]
+
+        def shard_on_record(i: int):
+            async def on_record(rec: Dict[str, Any]) -> None:
+                if rec.get("event") == "failure":
+                    for j, ev in enumerate(stops):
+                        if j != i:
+                            ev.set()
+
+            return on_record
+
+        def shard_progress(i: int):
+            if on_progress is None:
+                return None
+
+            async def report(p: Dict[str, Any]) -> None:
+                snapshots[i] = p
+                await on_progress(_merge_progress(snapshots))
+
+            return report
+
+        results = await asyncio.gather(
+            *(
+                execute_run_async(
+                    run,
+                    logger,
+                    False,
+                    shard_progress(i),
+                    stop=stops[i] if stops else None,
+                    on_record=shard_on_record(i) if stops else None,
+                )
+                for i, run in enumerate(runs)
+            )
+        )
+        results = [finish_run(run, res) for run, res in zip(runs, results)]
+    finally:
+        for run in runs:
+            discard_report(run["report_path"])
+            discard_report(run["select_path"])
+
+    return _merge_results(base, buckets, results, fail_fast, len(node_ids))
+
+
+def _merge_progress(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {"done": 0, "percent": None}
+    for snap in snapshots:
+        for k, v in snap.items():
+            if k in ("percent", "message"):
+                continue
+            merged[k] = merged.get(k, 0) + int(v or 0)
+    parts = [f"{v} {k}" for k, v in sorted(merged.items()) if k not in ("done", "percent") and v]
+    merged["message"] = ", ".join(parts) if parts else "running"
+    return merged
+
+
+def _merge_results(
+    base: Dict[str, Any],
+    buckets: List[List[str]],
+    results: List[Dict[str, Any]],
+    fail_fast: bool,
+    collected: int,
+) -> Dict[str, Any]:
+    tails: List[str] = []
+    records: List[Dict[str, Any]] = []
+    details: List[Dict[str, Any]] = []
+    codes: List[int] = []
+    errors: List[str] = []
+    line_count = 0
+
+    for i, (bucket, res) in enumerate(zip(buckets, results)):
+        stopped = bool(res.get("stopped"))
+        code = res.get("exit_code")
+        if not res.get("ok"):
+            errors.append(f"shard {i}: {res.get('error')}")
+        elif not stopped:
+            codes.append(int(code))
+        detail = {"index": i, "tests": len(bucket), "exit_code": code, "stopped": stopped, "cmd": res.get("cmd")}
+        if res.get("output_log"):
+            detail["output_log"] = res["output_log"]
+        details.append(detail)
+        tails.append(f"--- shard {i + 1}/{len(buckets)} ({len(bucket)} tests, exit {code}{', stopped' if stopped else ''}) ---")
+        tails.append(res.get("output_tail") or "")
+        records.extend(res.get("failure_records") or [])
+        line_count += int(res.get("output_line_count") or 0)
+
+    exit_code = merge_exit_codes(codes)
+    if records and exit_code in (0, 5):
+        exit_code = 1  # a stopped shard recorded a failure before it was killed
+
+    out: Dict[str, Any] = {
+        "ok": not errors,
+        "target": base["target"],
+        "exit_code": exit_code,
+        "cmd": base["cmd"],
+        "output_tail": "\n".join(tails),
+        "output_line_count": line_count,
+        "python": sys.executable,
+        "cwd": base["cwd"],
+        "failure_records": records,
+        "sharding": {"shards": len(buckets), "fail_fast": fail_fast, "collected": collected, "details": details},
+    }
+    if errors:
+        out["error"] = "; ".join(errors)
+    return out
@@ -0,0 +1,258 @@
+import re
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+
+# `file.py:LINE:` anywhere in a line (pytest long/short tracebacks, summary locations).
+FILE_LINE_RE = re.compile(r"(?P<file>[A-Za-z0-9_./\\:\-]+\.py):(?P<line>\d+):")
+# Location line that ends a pytest frame: `path.py:12: in func`, `path.py:12: ExcType` or `path.py:12: `.
+_PYTEST_FRAME_RE = re.compile(r"^(?P<file>[^\s:][^:]*\.py):(?P<line>\d+):(?: in (?P<func>\S+)| (?P<exc>[A-Za-z_][\w.]*))?\s*$")
+_NATIVE_FRAME_RE = re.compile(r'^\s*File "(?P<file>[^"]+)", line (?P<line>\d+)(?:, in (?P<func>\S+))?')
+_SECTION_RE = re.compile(r"^_{3,} (?P<name>.+?) _{3,}$")
+_SUBSECTION_RE = re.compile(r"^(?:_ )+_?\s*$")
+_BANNER_RE = re.compile(r"^={3,} ?(?P<title>.*?) ?={3,}$")
+_SUMMARY_RE = re.compile(r"^(?P<kind>FAILED|ERROR) (?P<nodeid>\S+)(?: - (?P<msg>.*))?$")
+_EXC_LINE_RE = re.compile(r"^(?P<type>[A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning|Failed|Skipped)):?(?: (?P<msg>.*))?$")
+
+# A line outside any record can only change state if it starts with one of these
+# (banner, section header, `Traceback`, indented native `File "..."`).
+_STRUCTURE_FIRST_CHARS = "=_T \t"
+
+MAX_FRAMES = 60
+MAX_E_LINES = 20
+MAX_MESSAGE_CHARS = 2000
+READ_CHUNK = 1 << 20
+MAX_LINE_BYTES = 4 * READ_CHUNK
+
+
+class PathResolver:
+    # Memoizes `file.py` -> resolved absolute path / open_context location, one filesystem
+    # resolution per unique spelling instead of one per occurrence.
+
+    def __init__(self, safe_base: Optional[Path], root_dir: Path, location_fn):
+        self.safe_base = safe_base
+        self.root_dir = root_dir
+        self.location_fn = location_fn
+        self._memo: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._memo)
+
+    def resolve(self, f_raw: str) -> Dict[str, Any]:
+        hit = self._memo.get(f_raw)
+        if hit is not None:
+            return hit
+        f_norm = f_raw.replace("\\", "/")
+        info: Dict[str, Any] = {}
+        resolved_abs: Optional[str] = None
+        try:
+            p = Path(f_raw).expanduser()
+            if p.is_absolute():
+                resolved_abs = str(p.resolve())
+            elif self.safe_base is not None:
+                resolved_abs = str((self.safe_base / p).resolve())
+        except Exception:
+            resolved_abs = None
+
+        fallback = {"path_for_open_context": f_norm, "open_context_base_dir": str(self.safe_base) if self.safe_base else ""}
+        if resolved_abs:
+            info["resolved_path"] = resolved_abs
+            try:
+                info.update(self.location_fn(Path(resolved_abs), self.root_dir))
+            except Exception:
+                info.update(fallback)
+        else:
+            info.update(fallback)
+        self._memo[f_raw] = info
+        return info
+
+
+class TracebackParser:
+    # Single pass over pytest (or plain Python) output. Keeps only the record being built plus
+    # at most `max_records` finished ones, so memory does not grow with the size of the log.
+
+    def __init__(self, resolver: PathResolver, max_records: int = 50, max_locations: int = 50):
+        self.resolver = resolver
+        self.max_records = max_records
+        self.max_locations = max_locations
+        self.records: List[Dict[str, Any]] = []
+        self.locations: List[Dict[str, Any]] = []
+        self._seen: set = set()
+        self._current: Optional[Dict[str, Any]] = None
+        self._frames: Deque[Dict[str, Any]] = deque(maxlen=MAX_FRAMES)
+        self._e_lines: List[str] = []
+        self._in_summary = False
+        self.lines_seen = 0
+        self.bytes_seen = 0
+
+    def _frame(self, f_raw: str, line: int, func: Optional[str]) -> Dict[str, Any]:
+        fr: Dict[str, Any] = {"path": f_raw.replace("\\", "/"), "line": line}
+        if func:
+            fr["function"] = func
+        fr.update(self.resolver.resolve(f_raw))
+        return fr
+
+    def _start(self, test: Optional[str]) -> None:
+        self._finish()
+        self._current = {"test": test, "nodeid": None, "exc_type": None, "message": None}
+
+    def _finish(self) -> None:
+        cur = self._current
+        if cur is None:
+            return
+        self._current = None
+        frames = list(self._frames)
+        self._frames.clear()
+        e_lines, self._e_lines = self._e_lines, []
+        if not frames and not e_lines and cur.get("exc_type") is None:
+            return
+        if cur.get("message") is None and e_lines:
+            first = e_lines[0]
+            m = _EXC_LINE_RE.match(first)
+            if m and (cur.get("exc_type") in (None, m.group("type"))):
+                cur["exc_type"] = m.group("type")
+                rest = [m.group("msg") or ""] + e_lines[1:]
+            else:
+                if cur.get("exc_type") is None and first.startswith("assert "):
+                    cur["exc_type"] = "AssertionError"  # --tb=short omits the final `file:line: Type` line
+                rest = e_lines
+            cur["message"] = "\n".join(x for x in rest if x)[:MAX_MESSAGE_CHARS]
+        cur["frames"] = frames
+        if len(self.records) < self.max_records:
+            self.records.append(cur)
+
+    def _add_location(self, f_raw: str, line: int) -> None:
+        if len(self.locations) >= self.max_locations:
+            return
+        f_norm = f_raw.replace("\\", "/")
+        key = (f_norm, line)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        item: Dict[str, Any] = {"path": f_norm, "line": line}
+        item.update(self.resolver.resolve(f_raw))
+        self.locations.append(item)
+
+    def feed(self, line: str) -> None:
+        self.lines_seen += 1
+        self.bytes_seen += len(line) + 1
+
+        # Cheap substring test first: most lines of a big log are progress dots or captured
+        # output, and the file:line regex backtracks badly over long runs of `.`.
+        has_loc = ".py:" in line
+        if has_loc and len(self.locations) < self.max_locations:
+            for m in FILE_LINE_RE.finditer(line):
+                self._add_location(m.group("file"), int(m.group("line")))
+        elif self._current is None and not self._in_summary and line[:1] not in _STRUCTURE_FIRST_CHARS:
+            return
+
+        m = _BANNER_RE.match(line)
+        if m:
+            self._finish()
+            self._in_summary = "short test summary" in m.group("title")
+            return
+
+        if self._in_summary:
+            m = _SUMMARY_RE.match(line)
+            if m:
+                self._attach_summary(m.group("nodeid"), m.group("msg"))
+            return
+
+        m = _SECTION_RE.match(line)
+        if m and not _SUBSECTION_RE.match(line):
+            self._start(m.group("name").strip())
+            return
+
+        if line.startswith("E ") or line == "E":
+            if self._current is not None and len(self._e_lines) < MAX_E_LINES:
+                self._e_lines.append(line[1:].strip())
+            return
+
+        m = _PYTEST_FRAME_RE.match(line) if has_loc else None
+        if m and self._current is not None:
+            self._frames.append(self._frame(m.group("file"), int(m.group("line")), m.group("func")))
+            if m.group("exc"):
+                self._current["exc_type"] = m.group("exc")
+            return
+
+        if line.startswith("Traceback (most recent call last):"):
+            if self._current is None or self._frames:
+                self._start(self._current.get("test") if self._current else None)
+            return
+
+        m = _NATIVE_FRAME_RE.match(line)
+        if m:
+            if self._current is None:
+                self._start(None)
+            self._frames.append(self._frame(m.group("file"), int(m.group("line")), m.group("func")))
+            return
+
+        if self._current is not None and self._frames and not line.startswith(" "):
+            m = _EXC_LINE_RE.match(line.strip())
+            if m and self._current.get("exc_type") is None:
+                self._current["exc_type"] = m.group("type")
+                self._current["message"] = (m.group("msg") or "")[:MAX_MESSAGE_CHARS]
+
+    def _attach_summary(self, nodeid: str, msg: Optional[str]) -> None:
+        tail = nodeid.split("::", 1)[-1].replace("::", ".")
+        for rec in self.records:
+            test = rec.get("test") or ""
+            if rec.get("nodeid") is None and (test == tail or test.endswith(" " + tail)):
+                rec["nodeid"] = nodeid
+                return
+        if len(self.records) < self.max_records:
+            exc_type, message = None, msg
+            if msg:
+                m = _EXC_LINE_RE.match(msg)
+                if m:
+                    exc_type, message = m.group("type"), m.group("msg")
+            self.records.append({"test": tail, "nodeid": nodeid, "exc_type": exc_type, "message": message, "frames": []})
+
+    def close(self) -> None:
+        self._finish()
+
+
+def iter_text_lines(text: str) -> Iterator[str]:
+    # Like splitlines() but lazy.
+    start = 0
+    n = len(text)
+    while start < n:
+        end = text.find("\n", start)
+        if end == -1:
+            yield text[start:].rstrip("\r")
+            return
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+
+def iter_file_lines(path: str) -> Iterator[str]:
+    # Decodes whole chunks (cut at the last newline, so no UTF-8 sequence is split) rather than
+    # line by line.
+    with open(path, "rb") as f:
+        partial = b""
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            chunk = partial + chunk
+            cut = chunk.rfind(b"\n")
+            if cut == -1:
+                partial = chunk
+                if len(partial) > MAX_LINE_BYTES:
+                    # Keep memory bounded on a log without newlines; the rest reads as a new line.
+                    yield partial[:MAX_LINE_BYTES].decode("utf-8", errors="replace")
+                    partial = b""
+                continue
+            partial = chunk[cut + 1 :]
+            for line in chunk[:cut].decode("utf-8", errors="replace").split("\n"):
+                yield line[:-1] if line.endswith("\r") else line
+        if partial:
+            yield partial.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def parse_lines(lines: Iterable[str], parser: TracebackParser) -> TracebackParser:
+    for line in lines:
+        parser.feed(line)
+    parser.close()
+    return parser
+
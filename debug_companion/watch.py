@@ -0,0 +1,453 @@
+import asyncio
+import ctypes
+import errno
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from debug_companion.impact import snapshot_files
+from debug_companion.metrics import incr, span
+from debug_companion.result_cache import CONFIG_NAMES, SKIP_DIRS, get_tree_hasher
+
+# Watch mode: a target's project directory is monitored (inotify on Linux, mtime polling
+# elsewhere or when inotify is unavailable); after a debounce the affected tests are rerun in the
+# background and the merged failures are kept as an in-memory snapshot, tagged with the tree hash
+# they were produced from. debug_project(use_snapshot=True) serves that snapshot while the tree
+# hash still matches.
+
+DEFAULT_DEBOUNCE_SECONDS = 0.3
+DEFAULT_POLL_SECONDS = 1.0
+MAX_STATUS_NODEIDS = 50
+BACKENDS = ("auto", "inotify", "poll")
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")
+ALL_CHANGED = "*"  # the watch lost track of events (queue overflow); treat everything as changed
+
+RunFn = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+def _wanted(name: str) -> bool:
+    return name.endswith(".py") or name in CONFIG_NAMES
+
+
+def _skipped_dir(name: str) -> bool:
+    return name in SKIP_DIRS or name.startswith(".")
+
+
+_libc: Optional[Any] = None
+
+
+def _inotify_libc() -> Optional[Any]:
+    global _libc
+    if _libc is None:
+        lib: Any = False
+        if sys.platform.startswith("linux"):
+            try:
+                candidate = ctypes.CDLL(None, use_errno=True)
+                if hasattr(candidate, "inotify_init1"):
+                    lib = candidate
+            except OSError:
+                pass
+        _libc = lib
+    return _libc or None
+
+
+def inotify_supported() -> bool:
+    return _inotify_libc() is not None
+
+
+class InotifySource:
+    # One inotify descriptor with a watch per (non-skipped) directory; directories created later
+    # are added as their events arrive.
+    backend = "inotify"
+
+    def __init__(self, root: str):
+        lib = _inotify_libc()
+        if lib is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.lib = lib
+        self.root = root
+        self.fd = lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, str] = {}
+        # Directories that hold relevant files, so a removed or renamed scratch directory (e.g.
+        # pytest's cache staging dir) does not count as a change.
+        self.code_dirs: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_dir(self, path: str) -> None:
+        wd = self.lib.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return  # removed again before we got to it
+            raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+        self.dirs[wd] = path
+
+    def _add_tree(self, top: str) -> List[str]:
+        # Returns the relevant files already present (created before the watch existed).
+        found: List[str] = []
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not _skipped_dir(d)]
+            self._add_dir(dirpath)
+            files = [os.path.join(dirpath, n) for n in filenames if _wanted(n)]
+            if files:
+                self.code_dirs.add(dirpath)
+            found.extend(files)
+        return found
+
+    def _held_code(self, path: str) -> bool:
+        prefix = path + os.sep
+        return any(d == path or d.startswith(prefix) for d in self.code_dirs)
+
+    def _rel(self, path: str) -> str:
+        return Path(os.path.relpath(path, self.root)).as_posix()
+
+    def read_changes(self) -> Set[str]:
+        changed: Set[str] = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                changed.add(ALL_CHANGED)
+                break
+            if not buf:
+                break
+            off = 0
+            while off + _EVENT.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+                raw = buf[off + _EVENT.size : off + _EVENT.size + length].split(b"\0", 1)[0]
+                off += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(ALL_CHANGED)
+                    continue
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                parent = self.dirs.get(wd)
+                if parent is None:
+                    continue
+                if not raw:
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF) and self._held_code(parent):
+                        changed.add(self._rel(parent))
+                    continue
+                name = os.fsdecode(raw)
+                path = os.path.join(parent, name)
+                if mask & IN_ISDIR:
+                    if _skipped_dir(name):
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            changed.update(self._rel(p) for p in self._add_tree(path))
+                        except OSError:
+                            changed.add(ALL_CHANGED)
+                    elif self._held_code(path):
+                        changed.add(self._rel(path))
+                        self.code_dirs = {d for d in self.code_dirs if d != path and not d.startswith(path + os.sep)}
+                elif _wanted(name):
+                    self.code_dirs.add(parent)
+                    changed.add(self._rel(path))
+        return changed
+
+    def start(self, loop: asyncio.AbstractEventLoop, on_changes: Callable[[Set[str]], None]) -> None:
+        self._loop = loop
+        loop.add_reader(self.fd, lambda: on_changes(self.read_changes()))
+
+    def close(self) -> None:
+        if self.fd < 0:
+            return
+        if self._loop is not None:
+            try:
+                self._loop.remove_reader(self.fd)
+            except Exception:
+                pass
+        os.close(self.fd)
+        self.fd = -1
+
+
+class PollSource:
+    # Portable fallback: one stat per relevant file every poll interval.
+    backend = "poll"
+
+    def __init__(self, root: str, interval: float = DEFAULT_POLL_SECONDS):
+        self.root = root
+        self.interval = max(0.05, float(interval))
+        self.files = snapshot_files(root)
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def read_changes(self) -> Set[str]:
+        new = snapshot_files(self.root)
+        changed = {rel for rel, key in new.items() if self.files.get(rel) != key}
+        changed.update(rel for rel in self.files if rel not in new)
+        self.files = new
+        return changed
+
+    async def _poll(self, on_changes: Callable[[Set[str]], None]) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            changed = await asyncio.to_thread(self.read_changes)
+            if changed:
+                on_changes(changed)
+
+    def start(self, loop: asyncio.AbstractEventLoop, on_changes: Callable[[Set[str]], None]) -> None:
+        self._task = loop.create_task(self._poll(on_changes))
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+def open_source(root: str, backend: str = "auto", poll_seconds: float = DEFAULT_POLL_SECONDS):
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifySource(root)
+        except OSError:
+            if backend == "inotify":
+                raise
+    return PollSource(root, poll_seconds)
+
+
+class Snapshot:
+    def __init__(self, tree_hash: str, project_dir: str, records: List[Dict[str, Any]], last_run: Dict[str, Any]):
+        self.tree_hash = tree_hash
+        self.project_dir = project_dir
+        self.records = records
+        self.last_run = last_run
+        self.created = time.time()
+        # Opened code context, memoized per open_context/open_contexts arguments; valid for as
+        # long as the snapshot is (same tree hash).
+        self.contexts: Dict[str, Dict[str, Any]] = {}
+
+    def run_result(self) -> Dict[str, Any]:
+        # Shaped like a run_pytest result, so debug_project can consume it unchanged.
+        last = self.last_run
+        return {
+            "ok": True,
+            "target": last.get("target"),
+            "exit_code": 1 if self.records else int(last.get("exit_code") or 0),
+            "output_tail": "" if self.records else (last.get("output_tail") or ""),
+            "output_line_count": 0 if self.records else int(last.get("output_line_count") or 0),
+            "cwd": self.project_dir,
+            "failure_records": list(self.records),
+        }
+
+    def info(self) -> Dict[str, Any]:
+        nodeids = list(dict.fromkeys(r.get("nodeid") for r in self.records))
+        return {
+            "tree_hash": self.tree_hash[:16],
+            "age_seconds": round(time.time() - self.created, 3),
+            "failures": len(nodeids),
+            "failing": nodeids[:MAX_STATUS_NODEIDS],
+            "contexts": len(self.contexts),
+        }
+
+
+def merge_records(previous: Dict[str, List[Dict[str, Any]]], res: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    # Tests that ran this time replace what we knew about them; failures of tests that were not
+    # selected are carried over while they are still collected.
+    impact = res.get("impact") or {}
+    if not impact or impact.get("full_run"):
+        merged: Dict[str, List[Dict[str, Any]]] = {}
+    else:
+        ran = set(impact.get("selected") or [])
+        alive = set(impact.get("collected_ids") or [])
+        merged = {nid: recs for nid, recs in previous.items() if nid not in ran and nid in alive}
+    for rec in res.get("failure_records") or []:
+        nid = str(rec.get("nodeid") or "")
+        merged.setdefault(nid, []).append(rec)
+    return merged
+
+
+class Watcher:
+    def __init__(
+        self,
+        *,
+        key: str,
+        target: str,
+        project_dir: str,
+        run_fn: RunFn,
+        prepare_fn: Optional[Callable[[Snapshot], Awaitable[None]]] = None,
+        debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+        poll_seconds: float = DEFAULT_POLL_SECONDS,
+        backend: str = "auto",
+        logger=None,
+    ):
+        self.key = key
+        self.target = target
+        self.project_dir = project_dir
+        self.run_fn = run_fn
+        self.prepare_fn = prepare_fn
+        self.debounce = max(0.0, float(debounce))
+        self.logger = logger
+        self.source = open_source(project_dir, backend, poll_seconds)
+        self.snapshot: Optional[Snapshot] = None
+        self.state = "starting"
+        self.runs = 0
+        self.events = 0
+        self.last_error = ""
+        self.last_run_seconds = 0.0
+        self.last_changed: List[str] = []
+        self._records: Dict[str, List[Dict[str, Any]]] = {}
+        self._pending: Set[str] = set()
+        self._changed = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def _on_changes(self, changed: Set[str]) -> None:
+        if not changed:
+            return
+        self.events += len(changed)
+        incr("watch.events", len(changed))
+        self._pending.update(changed)
+        self._changed.set()
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.source.start(loop, self._on_changes)
+        self._task = loop.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        await self._refresh([])
+        while True:
+            self.state = "idle"
+            await self._changed.wait()
+            # Debounce: wait until no event has arrived for `debounce` seconds (editors save in bursts).
+            while True:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self.debounce)
+                except asyncio.TimeoutError:
+                    break
+            changed, self._pending = sorted(self._pending), set()
+            await self._refresh(changed)
+
+    async def _refresh(self, changed: List[str]) -> None:
+        self.state = "running"
+        started = time.monotonic()
+        with span("watch.refresh"):
+            # Hashed before the run: files edited while pytest runs make the snapshot stale, and
+            # their events schedule the next refresh.
+            tree = await asyncio.to_thread(get_tree_hasher().tree_hash, Path(self.project_dir))
+            try:
+                res = await self.run_fn()
+            except Exception as e:
+                res = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.runs += 1
+            self.last_changed = changed[:MAX_STATUS_NODEIDS]
+            self.last_run_seconds = round(time.monotonic() - started, 3)
+            if not res.get("ok"):
+                self.last_error = str(res.get("error") or "run failed")
+                return
+            self.last_error = ""
+            self._records = merge_records(self._records, res)
+            snap = Snapshot(tree, self.project_dir, [r for recs in self._records.values() for r in recs], res)
+            if self.prepare_fn is not None and snap.records:
+                try:
+                    await self.prepare_fn(snap)
+                except Exception as e:
+                    if self.logger is not None:
+                        self.logger.warning("Preparing snapshot context failed: %s", e)
+            self.snapshot = snap
+            incr("watch.refreshes")
+
+    async def fresh_snapshot(self) -> Tuple[Optional[Snapshot], str]:
+        snap = self.snapshot
+        if snap is None:
+            return None, "no snapshot yet"
+        if self._pending or self.state == "running":
+            return None, "changes are being processed"
+        tree = await asyncio.to_thread(get_tree_hasher().tree_hash, Path(self.project_dir))
+        if tree != snap.tree_hash:
+            return None, "tree changed since the snapshot"
+        return snap, ""
+
+    async def stop(self) -> None:
+        self.source.close()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.state = "stopped"
+
+    def status(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "target": self.target,
+            "project_dir": self.project_dir,
+            "backend": self.source.backend,
+            "state": self.state,
+            "runs": self.runs,
+            "events": self.events,
+            "pending_changes": len(self._pending),
+            "last_changed": self.last_changed,
+            "last_run_seconds": self.last_run_seconds,
+        }
+        if self.last_error:
+            out["last_error"] = self.last_error
+        if self.snapshot is not None:
+            out["snapshot"] = self.snapshot.info()
+        return out
+
+
+_WATCHERS: Dict[str, Watcher] = {}
+
+
+def get_watcher(key: str) -> Optional[Watcher]:
+    return _WATCHERS.get(key)
+
+
+def watchers() -> List[Watcher]:
+    return list(_WATCHERS.values())
+
+
+async def start_watch(**kw) -> Tuple[Watcher, bool]:
+    # Returns (watcher, created); a target that is already watched keeps its watcher.
+    key = kw["key"]
+    existing = _WATCHERS.get(key)
+    if existing is not None:
+        return existing, False
+    watcher = Watcher(**kw)
+    _WATCHERS[key] = watcher
+    watcher.start()
+    return watcher, True
+
+
+async def stop_watch(key: str) -> Optional[Watcher]:
+    watcher = _WATCHERS.pop(key, None)
+    if watcher is not None:
+        await watcher.stop()
+    return watcher
+
+
+async def stop_all() -> None:
+    for key in list(_WATCHERS):
+        await stop_watch(key)
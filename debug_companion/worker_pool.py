@@ -0,0 +1,299 @@
+import atexit
+import json
+import os
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MAX_WORKERS = 4
+STARTUP_TIMEOUT_SECONDS = 60.0
+# Extra time the manager waits for a reply on top of the pytest timeout enforced by the fork server.
+REPLY_GRACE_SECONDS = 10.0
+# How often a run with a stop event checks it while waiting for the fork server's reply.
+STOP_POLL_SECONDS = 0.05
+
+
+def warm_pool_supported() -> bool:
+    return hasattr(os, "fork") and sys.platform != "win32"
+
+
+def _preload_from_env() -> Tuple[str, ...]:
+    raw = os.environ.get("MCP_WARM_PRELOAD", "")
+    return tuple(sorted({m.strip() for m in raw.split(",") if m.strip()}))
+
+
+def _stat_key(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def tail_file_lines(path: str, max_lines: int) -> Tuple[List[str], int]:
+    tail: deque = deque(maxlen=max(1, int(max_lines)))
+    count = 0
+    with open(path, "r", encoding="utf-8", errors="replace", newline=None) as f:
+        for line in f:
+            tail.append(line.rstrip("\n"))
+            count += 1
+    return list(tail), count
+
+
+class WarmWorker:
+    def __init__(self, *, cwd: str, python: str, preload: Tuple[str, ...]):
+        self.cwd = cwd
+        self.python = python
+        self.preload = preload
+        self.runs = 0
+
+        env = dict(os.environ)
+        env["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"
+        pp = env.get("PYTHONPATH", "")
+        env["PYTHONPATH"] = str(PACKAGE_ROOT) + (os.pathsep + pp if pp else "")
+
+        self.proc = subprocess.Popen(
+            [python, "-m", "debug_companion.forkserver", ",".join(preload)],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=env,
+            text=True,
+            bufsize=1,
+        )
+        ready = self._read_reply(STARTUP_TIMEOUT_SECONDS)
+        if not ready or not ready.get("ready"):
+            self.close()
+            raise RuntimeError("warm worker failed to start")
+
+        self.pid = int(ready.get("pid") or self.proc.pid)
+        self.preloaded: List[str] = list(ready.get("preloaded") or [])
+        self.preload_errors: Dict[str, str] = dict(ready.get("preload_errors") or {})
+        self._watch = {f: _stat_key(f) for f in (ready.get("watch_files") or [])}
+
+    def _read_reply(self, timeout: float) -> Optional[Dict[str, Any]]:
+        out = self.proc.stdout
+        if out is None:
+            return None
+        ready, _, _ = select.select([out], [], [], timeout)
+        if not ready:
+            return None
+        line = out.readline()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def _send(self, msg: Dict[str, Any]) -> None:
+        assert self.proc.stdin is not None
+        self.proc.stdin.write(json.dumps(msg) + "\n")
+        self.proc.stdin.flush()
+
+    def _wait_reply(self, timeout: float, stop: Optional[threading.Event], run_id: int) -> Optional[Dict[str, Any]]:
+        # Once `stop` is set the fork server is told to kill the run; it still replies as usual.
+        deadline = time.monotonic() + timeout
+        kill_sent = stop is None
+        out = self.proc.stdout
+        while out is not None:
+            if not kill_sent and stop is not None and stop.is_set():
+                self._send({"op": "kill", "id": run_id})
+                kill_sent = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([out], [], [], remaining if kill_sent else min(remaining, STOP_POLL_SECONDS))
+            if ready:
+                return self._read_reply(0)
+        return None
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def is_stale(self) -> bool:
+        if not self.alive():
+            return True
+        for f, key in self._watch.items():
+            if _stat_key(f) != key:
+                return True
+        return False
+
+    def run(
+        self,
+        *,
+        args: List[str],
+        cwd: str,
+        env: Dict[str, str],
+        timeout: int,
+        output_path: str,
+        stop: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        run_id = self.runs + 1
+        req = {"id": run_id, "args": args, "cwd": cwd, "env": env, "timeout": timeout, "output_path": output_path}
+        self._send(req)
+
+        reply = self._wait_reply(timeout + REPLY_GRACE_SECONDS, stop, run_id)
+        if reply is None or not reply.get("ok"):
+            self.close()
+            raise RuntimeError("warm worker did not reply")
+        self.runs += 1
+        return reply
+
+    def close(self) -> None:
+        if self.proc.poll() is None:
+            try:
+                self._send({"op": "shutdown"})
+                self.proc.wait(timeout=2)
+            except Exception:
+                self.proc.kill()
+                self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                if stream is not None:
+                    stream.close()
+            except Exception:
+                pass
+
+
+class WarmPool:
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.max_workers = max(1, int(max_workers))
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Idle workers per (cwd, python, preload), least recently used first.
+        self._idle: "OrderedDict[Tuple[str, str, Tuple[str, ...]], List[WarmWorker]]" = OrderedDict()
+        self._busy = 0
+        self.recycled = 0
+
+    def _idle_count(self) -> int:
+        return sum(len(ws) for ws in self._idle.values())
+
+    def _evict_one_idle(self) -> bool:
+        for key in list(self._idle.keys()):
+            workers = self._idle[key]
+            if workers:
+                workers.pop(0).close()
+                if not workers:
+                    del self._idle[key]
+                return True
+        return False
+
+    def _acquire(self, key: Tuple[str, str, Tuple[str, ...]]) -> WarmWorker:
+        with self._cond:
+            while True:
+                workers = self._idle.get(key) or []
+                while workers:
+                    w = workers.pop()
+                    if w.is_stale():
+                        w.close()
+                        self.recycled += 1
+                        continue
+                    self._idle.move_to_end(key)
+                    self._busy += 1
+                    return w
+
+                if self._busy + self._idle_count() < self.max_workers or self._evict_one_idle():
+                    self._busy += 1
+                    break
+                self._cond.wait()
+
+        try:
+            return WarmWorker(cwd=key[0], python=key[1], preload=key[2])
+        except Exception:
+            with self._cond:
+                self._busy -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, key: Tuple[str, str, Tuple[str, ...]], worker: WarmWorker) -> None:
+        with self._cond:
+            self._busy -= 1
+            if worker.alive():
+                self._idle.setdefault(key, []).append(worker)
+                self._idle.move_to_end(key)
+            self._cond.notify()
+
+    def run(
+        self,
+        *,
+        args: List[str],
+        cwd: str,
+        env: Dict[str, str],
+        timeout: int,
+        max_output_lines: int,
+        python: Optional[str] = None,
+        preload: Optional[Tuple[str, ...]] = None,
+        on_output: Optional[Callable[[str], Any]] = None,
+        on_start: Optional[Callable[[str], Any]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        # on_start gets the path of the output file as the run starts (to follow it), on_output
+        # the same path once it is complete, before it is removed. Setting `stop` kills the run.
+        key = (cwd, python or sys.executable, _preload_from_env() if preload is None else tuple(preload))
+        worker = self._acquire(key)
+
+        fd, output_path = tempfile.mkstemp(prefix="dc-pytest-", suffix=".log")
+        os.close(fd)
+        try:
+            if on_start is not None:
+                on_start(output_path)
+            reply = worker.run(args=args, cwd=cwd, env=env, timeout=timeout, output_path=output_path, stop=stop)
+            tail, count = tail_file_lines(output_path, max_output_lines)
+            if on_output is not None:
+                on_output(output_path)
+        finally:
+            self._release(key, worker)
+            try:
+                os.unlink(output_path)
+            except OSError:
+                pass
+
+        return {
+            "exit_code": int(reply.get("exit_code", 3)),
+            "timed_out": bool(reply.get("timed_out")),
+            "killed": bool(reply.get("killed")),
+            "output_tail": "\n".join(tail),
+            "output_line_count": count,
+            "worker_pid": worker.pid,
+            "preloaded": worker.preloaded,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "busy": self._busy,
+                "idle": self._idle_count(),
+                "recycled": self.recycled,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for workers in self._idle.values():
+                for w in workers:
+                    w.close()
+            self._idle.clear()
+
+
+_POOL: Optional[WarmPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_warm_pool() -> WarmPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            raw = (os.environ.get("MCP_WARM_WORKERS") or "").strip()
+            _POOL = WarmPool(max_workers=int(raw) if raw.isdigit() else DEFAULT_MAX_WORKERS)
+            atexit.register(_POOL.close)
+        return _POOL
@@ -1,22 +1,36 @@
+import asyncio
+import inspect
+import json
 import logging
-import os
-import re
-import subprocess  
-import sys
+import subprocess
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
-from debug_companion.path_safety import safe_path as _safe_path_core
-from debug_companion.pytest_runner import run_pytest_impl
-from debug_companion.context_tools import extract_failures_impl, open_context_impl
-from debug_companion.gemini_client import analyze_error_with_gemini_impl
-from debug_companion.orchestrator import debug_project_impl
+from debug_companion.jobs import get_job_scheduler
+from debug_companion.metrics import get_registry, timed
+from debug_companion.orchestrator import DEFAULT_CONCURRENCY, debug_project_async_impl, debug_project_impl
+from debug_companion.prompt_builder import DEFAULT_TOKEN_BUDGET
 
+# The impl modules (pytest runner, parsers, caches, LLM client) are imported inside the tools
+# that use them: MCP hosts restart the server often and most sessions touch only a few tools.
 
-load_dotenv()
+
+def _load_env_file() -> None:
+    # Same lookup as python-dotenv's find_dotenv() (from this file's directory upwards), but
+    # dotenv itself is only imported when there is a .env to read.
+    for d in (Path(__file__).resolve().parent, *Path(__file__).resolve().parents):
+        env_file = d / ".env"
+        if env_file.is_file():
+            from dotenv import load_dotenv
+
+            load_dotenv(env_file)
+            return
+
+
+_load_env_file()
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("debug-companion")
@@ -31,6 +45,8 @@ DEFAULT_TARGET = "demo_project"
 # --- BACKWARD COMPATIBILITY for tests ---
 def _safe_path(user_path: str) -> Path:
     # Uses current ROOT_DIR (which tests monkeypatch)
+    from debug_companion.path_safety import safe_path as _safe_path_core
+
     return _safe_path_core(user_path, root_dir=ROOT_DIR)
 
 
@@ -39,8 +55,15 @@ def ping() -> Dict[str, Any]:
     return {"ok": True, "msg": "pong"}
 
 
-@mcp.tool()
-def run_pytest(target: str = "", max_output_lines: int = 250, timeout_seconds: int = 30) -> Dict[str, Any]:
+def run_pytest(
+    target: str = "",
+    max_output_lines: int = 250,
+    timeout_seconds: int = 30,
+    warm: bool = False,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    from debug_companion.pytest_runner import run_pytest_impl
+
     return run_pytest_impl(
         target=target,
         root_dir=ROOT_DIR,
@@ -49,32 +72,123 @@ def run_pytest(target: str = "", max_output_lines: int = 250, timeout_seconds: i
         timeout_seconds=timeout_seconds,
         logger=log,
         subprocess_run=subprocess.run,  # <-- CRITICAL: uses server.subprocess.run
+        warm=warm,
+        use_cache=use_cache,
     )
 
 
-@mcp.tool()
-def extract_failures(pytest_output: str, limit: int = 10, base_dir: str = "") -> Dict[str, Any]:
+def extract_failures(pytest_output: str = "", limit: int = 10, base_dir: str = "", log_path: str = "") -> Dict[str, Any]:
+    from debug_companion.context_tools import extract_failures_impl
+
     return extract_failures_impl(
         pytest_output=pytest_output,
         limit=limit,
         base_dir=base_dir,
         root_dir=ROOT_DIR,
+        log_path=log_path,
     )
 
 
 @mcp.tool()
-def open_context(path: str, line: int, radius: int = 25, base_dir: str = "") -> Dict[str, Any]:
+@timed("tool.open_context")
+def open_context(
+    path: str,
+    line: int,
+    radius: int = 25,
+    base_dir: str = "",
+    mode: str = "lines",
+    include_callees: bool = False,
+    max_bytes: int = 0,
+) -> Dict[str, Any]:
+    from debug_companion.context_tools import open_context_impl
+
     return open_context_impl(
         path=path,
         line=line,
         radius=radius,
         base_dir=base_dir,
         root_dir=ROOT_DIR,
+        mode=mode,
+        include_callees=include_callees,
+        max_bytes=max_bytes,
     )
 
 
 @mcp.tool()
+@timed("tool.open_contexts")
+def open_contexts(locations: List[Dict[str, Any]], base_dir: str = "") -> Dict[str, Any]:
+    from debug_companion.context_tools import open_contexts_impl
+
+    return open_contexts_impl(locations=locations, base_dir=base_dir, root_dir=ROOT_DIR)
+
+
+def read_output(
+    run_id: str,
+    start_line: int = 1,
+    count: int = 200,
+    grep: str = "",
+    ignore_case: bool = False,
+    max_matches: int = 50,
+    context: int = 0,
+) -> Dict[str, Any]:
+    from debug_companion.output_log import grep_log, read_range
+
+    if grep:
+        return grep_log(
+            run_id,
+            grep,
+            ignore_case=ignore_case,
+            max_matches=max_matches,
+            context=context,
+            start_line=max(1, start_line),
+        )
+    return read_range(run_id, start_line=start_line, count=count)
+
+
+@mcp.tool()
+@timed("tool.run_history")
+async def run_history(target: str = "", limit: int = 10) -> Dict[str, Any]:
+    from debug_companion.history import history_summary
+    from debug_companion.pytest_runner import project_dir_for
+
+    try:
+        tgt_path = _safe_path((target or "").strip() or DEFAULT_TARGET)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return await asyncio.to_thread(history_summary, project_dir_for(tgt_path, ROOT_DIR), limit)
+
+
+@mcp.tool()
+@timed("tool.cache_stats")
+def cache_stats() -> Dict[str, Any]:
+    from debug_companion.ast_index import get_scope_cache
+    from debug_companion.file_cache import get_file_cache
+    from debug_companion.path_safety import get_resolve_cache
+
+    return {
+        "ok": True,
+        "file_cache": get_file_cache().stats(),
+        "scope_cache": get_scope_cache().stats(),
+        "path_cache": get_resolve_cache().stats(),
+    }
+
+
+@mcp.tool()
+@timed("tool.metrics")
+def metrics(reset: bool = False) -> Dict[str, Any]:
+    registry = get_registry()
+    res = {"ok": True, **registry.snapshot()}
+    prom_file = registry.export()
+    if prom_file:
+        res["prometheus_file"] = prom_file
+    if reset:
+        registry.reset()
+    return res
+
+
 def analyze_error_with_gemini(error_message: str, code_context: str = "") -> Dict[str, Any]:
+    from debug_companion.gemini_client import analyze_error_with_gemini_impl
+
     return analyze_error_with_gemini_impl(
         logger=log,
         error_message=error_message,
@@ -82,18 +196,22 @@ def analyze_error_with_gemini(error_message: str, code_context: str = "") -> Dic
     )
 
 
-@mcp.tool()
 def debug_project(
     target: str,
     max_output_lines: int = 1200,
     timeout_seconds: int = 60,
     failure_limit: int = 1,
     radius: int = 35,
+    warm: bool = False,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline_seconds: float = 0,
 ) -> Dict[str, Any]:
+    run_kw = {"warm": True} if warm else {}
     return debug_project_impl(
         target=target,
         root_dir=ROOT_DIR,
-        run_pytest_fn=lambda **kw: run_pytest(**kw),
+        run_pytest_fn=lambda **kw: run_pytest(**kw, **run_kw),
         extract_failures_fn=lambda **kw: extract_failures(**kw),
         open_context_fn=lambda **kw: open_context(**kw),
         analyze_fn=lambda **kw: analyze_error_with_gemini(**kw),
@@ -101,8 +219,571 @@ def debug_project(
         timeout_seconds=timeout_seconds,
         failure_limit=failure_limit,
         radius=radius,
+        token_budget=token_budget,
+        concurrency=concurrency,
+        deadline_seconds=deadline_seconds,
     )
 
 
+# --- MCP tools for the slow paths are async so one long pytest/LLM call does not stall the server loop.
+# The sync functions above stay as the module API (tests monkeypatch them).
+class _ProgressSink:
+    # One per tool call: the pytest progress and the streamed LLM chunks share the MCP progress
+    # token, whose value must strictly increase across both.
+
+    def __init__(self, ctx: Context):
+        self.ctx = ctx
+        self.last = 0.0
+        self.sent = False
+
+    async def send(self, progress: Optional[float], message: str) -> None:
+        value = self.last + 1 if progress is None else float(progress)
+        if self.sent and value <= self.last:
+            value = self.last + 0.001
+        self.last, self.sent = value, True
+        await self.ctx.report_progress(progress=value, message=message)
+
+
+_SINKS: Dict[int, _ProgressSink] = {}
+
+
+def _progress_sink(ctx: Context) -> _ProgressSink:
+    return _SINKS.get(id(ctx)) or _ProgressSink(ctx)
+
+
+def _progress_reporter(ctx: Optional[Context]):
+    if ctx is None:
+        return None
+    sink = _progress_sink(ctx)
+
+    async def report(p: Dict[str, Any]) -> None:
+        # MCP progress must increase monotonically, so use the finished-test count, not the percentage.
+        msg = p.get("message") or ""
+        if p.get("percent") is not None:
+            msg = f"{msg} [{p['percent']}%]"
+        await sink.send(float(p.get("done") or 0), msg)
+
+    return report
+
+
+async def _stream_analysis(error_message: str, code_context: str, ctx: Context) -> Dict[str, Any]:
+    from debug_companion.gemini_client import analyze_error_with_gemini_impl
+
+    # The (blocking) client runs in a worker thread; its chunks are handed to the loop through a
+    # queue and forwarded in order as progress messages.
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+    sink = _progress_sink(ctx)
+
+    async def pump() -> None:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            try:
+                await sink.send(None, chunk)
+            except Exception as e:
+                log.debug("progress report failed: %s", e)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        return await asyncio.to_thread(
+            analyze_error_with_gemini_impl,
+            logger=log,
+            error_message=error_message,
+            code_context=code_context,
+            on_chunk=lambda chunk: loop.call_soon_threadsafe(queue.put_nowait, chunk),
+        )
+    finally:
+        queue.put_nowait(None)
+        await pump_task
+
+
+# Set by debug_project around the run it starts (tool parameters cannot carry callables):
+# {"on_record": coroutine fn receiving plugin records while pytest runs, "maxfail": int,
+# "max_clusters": int}, and by background jobs: {"max_timeout_seconds": int}.
+_RUN_HOOKS: ContextVar[Optional[Dict[str, Any]]] = ContextVar("debug_companion_run_hooks", default=None)
+
+
+@mcp.tool(name="run_pytest")
+@timed("tool.run_pytest")
+async def run_pytest_async(
+    target: str = "",
+    max_output_lines: int = 250,
+    timeout_seconds: int = 30,
+    warm: bool = False,
+    shards: int = 1,
+    fail_fast: bool = True,
+    use_cache: bool = False,
+    impact: str = "",
+    prioritize: bool = False,
+    time_budget_seconds: float = 0,
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    # Runs on the same target (direct calls and background jobs) never overlap.
+    async with get_job_scheduler().target_lock(_target_key(target)):
+        return await _run_pytest_locked(
+            target=target,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            warm=warm,
+            shards=shards,
+            fail_fast=fail_fast,
+            use_cache=use_cache,
+            impact=impact,
+            prioritize=prioritize,
+            time_budget_seconds=time_budget_seconds,
+            ctx=ctx,
+        )
+
+
+async def _run_pytest_locked(
+    *,
+    target: str,
+    max_output_lines: int,
+    timeout_seconds: int,
+    warm: bool,
+    shards: int,
+    fail_fast: bool,
+    use_cache: bool,
+    impact: str,
+    prioritize: bool,
+    time_budget_seconds: float,
+    ctx: Optional[Context],
+) -> Dict[str, Any]:
+    from debug_companion.impact import run_impacted_pytest_async_impl
+    from debug_companion.pytest_runner import MAX_TIMEOUT_SECONDS, run_pytest_async_impl
+    from debug_companion.sharding import run_sharded_pytest_async_impl
+
+    # Impact and sharded runs build their own pytest invocations; options they cannot honor
+    # are refused rather than dropped.
+    if impact or shards != 1:
+        ignored = {
+            "warm": warm,
+            "prioritize": prioritize,
+            "time_budget_seconds": time_budget_seconds > 0,
+            "shards": bool(impact) and shards != 1,
+            "use_cache": bool(impact) and use_cache,
+        }
+        unsupported = [name for name, on in ignored.items() if on]
+        if unsupported:
+            mode = "impact" if impact else "sharded"
+            return {"ok": False, "error": f"not supported for {mode} runs: {', '.join(unsupported)}", "target": target}
+
+    if impact:
+        return await run_impacted_pytest_async_impl(
+            target=target,
+            root_dir=ROOT_DIR,
+            default_target=DEFAULT_TARGET,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            logger=log,
+            mode=impact,
+            on_progress=_progress_reporter(ctx),
+            maxfail=1 if fail_fast else 0,
+        )
+    if shards != 1:
+        return await run_sharded_pytest_async_impl(
+            target=target,
+            root_dir=ROOT_DIR,
+            default_target=DEFAULT_TARGET,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            logger=log,
+            shards=shards,
+            fail_fast=fail_fast,
+            on_progress=_progress_reporter(ctx),
+            use_cache=use_cache,
+        )
+    hooks = _RUN_HOOKS.get() or {}
+    return await run_pytest_async_impl(
+        target=target,
+        root_dir=ROOT_DIR,
+        default_target=DEFAULT_TARGET,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+        logger=log,
+        warm=warm,
+        on_progress=_progress_reporter(ctx),
+        use_cache=use_cache,
+        maxfail=int(hooks.get("maxfail", 1)),
+        max_clusters=int(hooks.get("max_clusters") or 0),
+        on_record=hooks.get("on_record"),
+        max_timeout_seconds=int(hooks.get("max_timeout_seconds") or MAX_TIMEOUT_SECONDS),
+        prioritize=prioritize,
+        time_budget_seconds=time_budget_seconds,
+    )
+
+
+@mcp.tool(name="analyze_error_with_gemini")
+@timed("tool.analyze_error_with_gemini")
+async def analyze_error_with_gemini_async(
+    error_message: str,
+    code_context: str = "",
+    stream: bool = True,
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    if stream and ctx is not None:
+        return await _stream_analysis(error_message, code_context, ctx)
+    return await asyncio.to_thread(analyze_error_with_gemini, error_message=error_message, code_context=code_context)
+
+
+# Log files can be hundreds of MB; they are parsed and searched off the event loop.
+@mcp.tool(name="extract_failures")
+@timed("tool.extract_failures")
+async def extract_failures_async(
+    pytest_output: str = "", limit: int = 10, base_dir: str = "", log_path: str = ""
+) -> Dict[str, Any]:
+    return await asyncio.to_thread(
+        extract_failures, pytest_output=pytest_output, limit=limit, base_dir=base_dir, log_path=log_path
+    )
+
+
+@mcp.tool(name="read_output")
+@timed("tool.read_output")
+async def read_output_async(
+    run_id: str,
+    start_line: int = 1,
+    count: int = 200,
+    grep: str = "",
+    ignore_case: bool = False,
+    max_matches: int = 50,
+    context: int = 0,
+) -> Dict[str, Any]:
+    return await asyncio.to_thread(
+        read_output,
+        run_id=run_id,
+        start_line=start_line,
+        count=count,
+        grep=grep,
+        ignore_case=ignore_case,
+        max_matches=max_matches,
+        context=context,
+    )
+
+
+@mcp.tool(name="debug_project")
+@timed("tool.debug_project")
+async def debug_project_async(
+    target: str,
+    max_output_lines: int = 1200,
+    timeout_seconds: int = 60,
+    failure_limit: int = 1,
+    radius: int = 35,
+    warm: bool = False,
+    shards: int = 1,
+    fail_fast: bool = True,
+    use_cache: bool = False,
+    impact: str = "",
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    stream: bool = True,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline_seconds: float = 0,
+    pipeline: bool = True,
+    use_snapshot: bool = False,
+    prioritize: bool = False,
+    time_budget_seconds: float = 0,
+    ctx: Optional[Context] = None,
+) -> Dict[str, Any]:
+    limit = max(1, int(failure_limit))
+
+    async def run_fn(on_record=None, **kw):
+        # With fail_fast the run ends once failure_limit failure clusters are known. One cluster
+        # is one failure, so --maxfail does it; beyond that, --maxfail (counting tests) would stop
+        # too early and the plugin counts clusters instead. Either way pytest finishes normally.
+        hooks = {**(_RUN_HOOKS.get() or {}), "on_record": on_record, "maxfail": 0}
+        if fail_fast and limit == 1:
+            hooks["maxfail"] = 1
+        elif fail_fast:
+            hooks["max_clusters"] = limit
+        token = _RUN_HOOKS.set(hooks)
+        try:
+            return await run_pytest_async(
+                **kw,
+                warm=warm,
+                shards=shards,
+                fail_fast=fail_fast,
+                use_cache=use_cache,
+                impact=impact,
+                prioritize=prioritize,
+                time_budget_seconds=time_budget_seconds,
+                ctx=ctx,
+            )
+        finally:
+            _RUN_HOOKS.reset(token)
+
+    async def extract_fn(**kw):
+        return await asyncio.to_thread(extract_failures, **kw)
+
+    async def open_fn(**kw):
+        return await asyncio.to_thread(open_context, **kw)
+
+    async def open_many_fn(**kw):
+        return await asyncio.to_thread(open_contexts, **kw)
+
+    async def analyze_fn(**kw):
+        if stream and ctx is not None:
+            return await analyze_error_with_gemini_async(**kw, stream=True, ctx=ctx)
+        return await analyze_error_with_gemini_async(**kw)
+
+    fns = (run_fn, open_fn, open_many_fn)
+    snapshot_info: Optional[Dict[str, Any]] = None
+    if use_snapshot:
+        snap, snapshot_info = await _fresh_snapshot(target)
+        if snap is not None:
+            fns = _snapshot_fns(snap)
+    run_pytest_fn, open_context_fn, open_contexts_fn = fns
+
+    if ctx is not None:
+        _SINKS[id(ctx)] = _ProgressSink(ctx)
+    try:
+        res = await debug_project_async_impl(
+            target=target,
+            root_dir=ROOT_DIR,
+            run_pytest_fn=run_pytest_fn,
+            extract_failures_fn=extract_fn,
+            open_context_fn=open_context_fn,
+            analyze_fn=analyze_fn,
+            max_output_lines=max_output_lines,
+            timeout_seconds=timeout_seconds,
+            failure_limit=failure_limit,
+            radius=radius,
+            token_budget=token_budget,
+            open_contexts_fn=open_contexts_fn,
+            concurrency=concurrency,
+            deadline_seconds=deadline_seconds,
+            pipeline=pipeline,
+        )
+    finally:
+        if ctx is not None:
+            _SINKS.pop(id(ctx), None)
+    if snapshot_info is not None:
+        res["snapshot"] = snapshot_info
+    return res
+
+
+# --- Background jobs: start_run returns at once, poll_run / cancel_run follow up. Jobs may run
+# longer than the 300 s cap of the direct tools.
+JOB_MAX_TIMEOUT_SECONDS = 3600
+CANCEL_WAIT_SECONDS = 10.0
+
+
+def _target_key(target: str) -> str:
+    tgt = (target or "").strip() or DEFAULT_TARGET
+    try:
+        return str(_safe_path(tgt))
+    except Exception:
+        return tgt
+
+
+def _job_tool(kind: str):
+    # Looked up at call time, so monkeypatched tools are used.
+    return {"run_pytest": run_pytest_async, "debug_project": debug_project_async}.get(kind)
+
+
+@mcp.tool()
+@timed("tool.start_run")
+async def start_run(target: str = "", kind: str = "run_pytest", args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    tool = _job_tool(kind)
+    if tool is None:
+        return {"ok": False, "error": f"unknown kind: {kind} (expected run_pytest or debug_project)"}
+    try:
+        bound = inspect.signature(tool).bind_partial(target=target, **(args or {}))
+    except TypeError as e:
+        return {"ok": False, "error": f"bad args for {kind}: {e}"}
+    if "ctx" in bound.arguments:
+        return {"ok": False, "error": f"bad args for {kind}: ctx cannot be set"}
+    # Defaults are filled in so that spelled-out and omitted defaults coalesce onto one job.
+    bound.apply_defaults()
+    call_args = {k: v for k, v in bound.arguments.items() if k != "ctx"}
+
+    async def factory(job) -> Dict[str, Any]:
+        token = _RUN_HOOKS.set({"max_timeout_seconds": JOB_MAX_TIMEOUT_SECONDS})
+        try:
+            return await _job_tool(kind)(**call_args, ctx=job)
+        finally:
+            _RUN_HOOKS.reset(token)
+
+    job, coalesced = get_job_scheduler().submit(kind, _target_key(target), call_args, factory)
+    return {"ok": True, "coalesced": coalesced, **job.view(include_result=False)}
+
+
+@mcp.tool()
+@timed("tool.poll_run")
+async def poll_run(job_id: str = "", wait_seconds: float = 0, include_result: bool = True) -> Dict[str, Any]:
+    scheduler = get_job_scheduler()
+    if not job_id:
+        return {"ok": True, **scheduler.stats(), "runs": [j.view(include_result=False) for j in scheduler.jobs()]}
+    job = scheduler.get(job_id)
+    if job is None:
+        return {"ok": False, "error": f"unknown job: {job_id}"}
+    await scheduler.wait(job, float(wait_seconds or 0))
+    return {"ok": True, **job.view(include_result=include_result)}
+
+
+@mcp.tool()
+@timed("tool.cancel_run")
+async def cancel_run(job_id: str) -> Dict[str, Any]:
+    scheduler = get_job_scheduler()
+    job = scheduler.cancel(job_id)
+    if job is None:
+        return {"ok": False, "error": f"unknown job: {job_id}"}
+    # Give the run a moment to kill its pytest process tree before reporting.
+    await scheduler.wait(job, CANCEL_WAIT_SECONDS)
+    return {"ok": True, **job.view(include_result=False)}
+
+
+# --- Watch mode: keeps a failure snapshot of a target fresh in the background (see debug_companion/watch.py).
+# The snapshot's opened contexts are prepared for debug_project's defaults (radius 35, up to
+# SNAPSHOT_PREPARED_FAILURES failures); other arguments are opened on first use and memoized.
+SNAPSHOT_PREPARED_FAILURES = 4
+
+
+def _snapshot_fns(snap):
+    async def run_fn(**kw):
+        return snap.run_result()
+
+    def memo(name: str, fn):
+        async def call(**kw):
+            key = name + json.dumps(kw, sort_keys=True, default=str)
+            hit = snap.contexts.get(key)
+            if hit is None:
+                hit = await asyncio.to_thread(fn, **kw)
+                if hit.get("ok"):
+                    snap.contexts[key] = hit
+            return hit
+
+        return call
+
+    return (
+        run_fn,
+        memo("open_context", lambda **kw: open_context(**kw)),
+        memo("open_contexts", lambda **kw: open_contexts(**kw)),
+    )
+
+
+async def _fresh_snapshot(target: str):
+    from debug_companion.watch import get_watcher
+
+    watcher = get_watcher(_target_key(target))
+    if watcher is None:
+        return None, {"used": False, "reason": "target is not watched (see watch_start)"}
+    snap, reason = await watcher.fresh_snapshot()
+    if snap is None:
+        return None, {"used": False, "reason": reason}
+    return snap, {"used": True, **snap.info()}
+
+
+async def _prepare_snapshot(snap) -> None:
+    # Opens the code context debug_project will ask for, without calling the LLM.
+    run_fn, open_fn, open_many_fn = _snapshot_fns(snap)
+
+    async def extract_fn(**kw):
+        return await asyncio.to_thread(extract_failures, **kw)
+
+    async def skip_analysis(**kw):
+        return {"ok": False, "skipped": True}
+
+    await debug_project_async_impl(
+        target="",
+        root_dir=ROOT_DIR,
+        run_pytest_fn=run_fn,
+        extract_failures_fn=extract_fn,
+        open_context_fn=open_fn,
+        analyze_fn=skip_analysis,
+        max_output_lines=1,
+        timeout_seconds=1,
+        failure_limit=SNAPSHOT_PREPARED_FAILURES,
+        radius=35,
+        open_contexts_fn=open_many_fn,
+        concurrency=SNAPSHOT_PREPARED_FAILURES,
+    )
+
+
+@mcp.tool()
+@timed("tool.watch_start")
+async def watch_start(
+    target: str = "",
+    debounce_ms: int = 300,
+    poll_seconds: float = 1.0,
+    backend: str = "auto",
+    max_output_lines: int = 250,
+    timeout_seconds: int = 300,
+) -> Dict[str, Any]:
+    from debug_companion.failure_records import discard_report
+    from debug_companion.impact import run_impacted_pytest_async_impl
+    from debug_companion.pytest_runner import prepare_run
+    from debug_companion.watch import BACKENDS, start_watch
+
+    if backend not in BACKENDS:
+        return {"ok": False, "error": f"unknown backend: {backend!r} (expected one of {', '.join(BACKENDS)})"}
+    run = prepare_run(
+        target=target,
+        root_dir=ROOT_DIR,
+        default_target=DEFAULT_TARGET,
+        max_output_lines=max_output_lines,
+        timeout_seconds=timeout_seconds,
+    )
+    if not run["ok"]:
+        return run
+    discard_report(run["report_path"])
+    key = _target_key(target)
+
+    async def run_fn() -> Dict[str, Any]:
+        # Affected tests only (impact="mtime"), without --maxfail, under the target lock.
+        async with get_job_scheduler().target_lock(key):
+            return await run_impacted_pytest_async_impl(
+                target=target,
+                root_dir=ROOT_DIR,
+                default_target=DEFAULT_TARGET,
+                max_output_lines=max_output_lines,
+                timeout_seconds=timeout_seconds,
+                logger=log,
+                mode="mtime",
+                maxfail=0,
+                full_lists=True,
+            )
+
+    try:
+        watcher, created = await start_watch(
+            key=key,
+            target=run["target"],
+            project_dir=run["cwd"],
+            run_fn=run_fn,
+            prepare_fn=_prepare_snapshot,
+            debounce=max(0, int(debounce_ms)) / 1000.0,
+            poll_seconds=poll_seconds,
+            backend=backend,
+            logger=log,
+        )
+    except OSError as e:
+        return {"ok": False, "error": f"cannot watch {run['cwd']}: {e}"}
+    return {"ok": True, "created": created, **watcher.status()}
+
+
+@mcp.tool()
+@timed("tool.watch_stop")
+async def watch_stop(target: str = "") -> Dict[str, Any]:
+    from debug_companion.watch import stop_watch
+
+    watcher = await stop_watch(_target_key(target))
+    if watcher is None:
+        return {"ok": False, "error": f"not watched: {target or DEFAULT_TARGET}"}
+    return {"ok": True, **watcher.status()}
+
+
+@mcp.tool()
+@timed("tool.watch_status")
+async def watch_status(target: str = "") -> Dict[str, Any]:
+    from debug_companion.watch import get_watcher, watchers
+
+    if not target:
+        return {"ok": True, "watches": [w.status() for w in watchers()]}
+    watcher = get_watcher(_target_key(target))
+    if watcher is None:
+        return {"ok": False, "error": f"not watched: {target}"}
+    return {"ok": True, **watcher.status()}
+
+
 if __name__ == "__main__":
     mcp.run()
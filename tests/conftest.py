@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache_dir(tmp_path_factory, monkeypatch):
+    # Keep on-disk caches and stores out of the user's home directory.
+    monkeypatch.setenv("MCP_CACHE_DIR", str(tmp_path_factory.mktemp("mcp-cache")))
+
+
+@pytest.fixture
+def write_project(tmp_path):
+    # write_project({"test_mod.py": source, ...}, name="proj") creates tmp_path/<name> with
+    # those files (relative paths, parents created) and returns the directory.
+    def write(files, name="proj"):
+        proj = tmp_path / name
+        proj.mkdir(exist_ok=True)
+        for rel, text in files.items():
+            path = proj / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+        return proj
+
+    return write
@@ -0,0 +1,108 @@
+import os
+
+import server as mod
+
+HELPERS = "def helper(a, b=2) -> int:\n    return a + b\n"
+
+MODULE = '''from helpers import helper
+
+X = 1
+
+
+class Calc:
+    def add(self, a, b):
+        total = a + b
+        return total
+
+    @staticmethod
+    def twice(a):
+        def inner(v):
+            return v * 2
+        return inner(helper(a))
+
+
+def top():
+    return Calc().add(1, 2)
+'''
+
+
+def _setup(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "helpers.py").write_text(HELPERS, encoding="utf-8")
+    (tmp_path / "m.py").write_text(MODULE, encoding="utf-8")
+
+
+def test_scope_mode_returns_enclosing_def(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    res = mod.open_context(path="m.py", line=8, mode="scope")
+    assert res["ok"] is True
+    assert res["scope"]["qualname"] == "Calc.add"
+    assert (res["start_line"], res["end_line"]) == (7, 9)
+
+    nested = mod.open_context(path="m.py", line=14, mode="scope")
+    assert nested["scope"]["qualname"] == "Calc.twice.inner"
+
+    decorated = mod.open_context(path="m.py", line=15, mode="scope")
+    assert decorated["scope"]["qualname"] == "Calc.twice"
+    assert decorated["start_line"] == 11  # includes the decorator
+
+    module_level = mod.open_context(path="m.py", line=3, radius=5, mode="scope")
+    assert module_level["scope"] is None
+    assert module_level["start_line"] == 1
+
+
+def test_scope_mode_callees_and_budget(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+
+    res = mod.open_context(path="m.py", line=15, mode="scope", include_callees=True)
+    sigs = {c["name"]: c["signature"] for c in res["callees"]}
+    assert sigs["helper"] == "def helper(a, b=2) -> int"
+    assert sigs["Calc.twice.inner"] == "def inner(v)"
+
+    small = mod.open_context(path="m.py", line=13, mode="scope", max_bytes=40)
+    assert small["truncated"] is True
+    assert sum(len(x["text"]) + 1 for x in small["content"]) <= 40
+    assert small["start_line"] <= 13 <= small["end_line"]
+
+
+def test_scope_index_invalidated_on_change(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    first = mod.open_context(path="m.py", line=19, mode="scope")
+    assert first["scope"]["qualname"] == "top"
+
+    (tmp_path / "m.py").write_text("\n\n" + MODULE, encoding="utf-8")
+    os.utime(tmp_path / "m.py", ns=(1, 1))
+    moved = mod.open_context(path="m.py", line=21, mode="scope")
+    assert moved["scope"]["qualname"] == "top"
+    assert moved["start_line"] == 20
+
+
+def test_scope_mode_syntax_error_falls_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "bad.py").write_text("def f(:\n    pass\n", encoding="utf-8")
+    res = mod.open_context(path="bad.py", line=1, mode="scope")
+    assert res["ok"] is True
+    assert res["scope"] is None
+    assert "SyntaxError" in res["scope_error"]
+
+
+def test_callees_outside_allowed_roots_are_skipped(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    (root / "pkg").mkdir(parents=True)
+    monkeypatch.setattr(mod, "ROOT_DIR", root)
+    monkeypatch.delenv("MCP_ALLOWED_ROOTS", raising=False)
+    (tmp_path / "outside.py").write_text("def leak(token):\n    pass\n", encoding="utf-8")
+    (tmp_path / "secret.py").write_text("def hidden(key):\n    pass\n", encoding="utf-8")
+    (root / "linked.py").symlink_to(tmp_path / "secret.py")
+    (root / "pkg" / "m.py").write_text(
+        "from ...outside import leak\nfrom linked import hidden\n\n\ndef f():\n    leak(1)\n    hidden(2)\n",
+        encoding="utf-8",
+    )
+
+    res = mod.open_context(path="pkg/m.py", line=6, mode="scope", include_callees=True)
+    assert res["ok"] is True and res["callees"] == []
+
+    monkeypatch.setenv("MCP_ALLOWED_ROOTS", str(tmp_path))
+    res = mod.open_context(path="pkg/m.py", line=6, mode="scope", include_callees=True)
+    assert sorted(c["name"] for c in res["callees"]) == ["hidden", "leak"]
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import server as mod
+from debug_companion import pytest_runner
+
+
+def test_run_pytest_async_runs_real_pytest(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project({"test_mod.py": "def test_ok():\n    assert True\n\ndef test_bad():\n    assert 1 == 2\n"})
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", max_output_lines=50, timeout_seconds=30))
+    assert res["ok"] is True
+    assert res["exit_code"] == 1
+    assert res["cwd"] == str(tmp_path)
+    assert "assert 1 == 2" in res["output_tail"]
+
+
+def test_run_pytest_async_missing_target(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    res = asyncio.run(mod.run_pytest_async(target="no_such_folder"))
+    assert res["ok"] is False
+    assert "target not found" in res["error"]
+
+
+def test_run_pytest_async_timeout_kills_process(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    monkeypatch.setattr(pytest_runner, "MIN_TIMEOUT_SECONDS", 1)
+    write_project(
+        {"test_mod.py": "import time\n\ndef test_slow():\n    print('started', flush=True)\n    time.sleep(60)\n"}
+    )
+
+    started = time.monotonic()
+    res = asyncio.run(mod.run_pytest_async(target="proj", timeout_seconds=1))
+    assert time.monotonic() - started < 30
+    assert res["ok"] is False
+    assert "timed out (1s)" in res["error"]
+
+
+def test_run_pytest_async_cancel_and_concurrency(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project({"test_mod.py": "import time\n\ndef test_slow():\n    time.sleep(60)\n"})
+
+    async def scenario():
+        slow = asyncio.create_task(mod.run_pytest_async(target="proj", timeout_seconds=120))
+        await asyncio.sleep(0.2)
+        # The loop is not blocked by the running pytest.
+        assert mod.ping()["ok"] is True
+        slow.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+
+    started = time.monotonic()
+    asyncio.run(scenario())
+    assert time.monotonic() - started < 30
+
+
+def test_log_tools_run_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def blocking(**kw):
+        threads.append(threading.get_ident())
+        return {"ok": True, "count": 1, "failures": [{"path_for_open_context": "t.py", "line": 7}]}
+
+    async def fake_run(target, max_output_lines, timeout_seconds, **kw):
+        return {"ok": True, "exit_code": 1, "output_tail": "t.py:7: AssertionError", "cwd": "/tmp"}
+
+    async def fake_gemini(error_message, code_context):
+        return {"ok": True, "analysis": "x"}
+
+    monkeypatch.setattr(mod, "read_output", blocking)
+    monkeypatch.setattr(mod, "extract_failures", blocking)
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+    monkeypatch.setattr(mod, "open_context", lambda **kw: {"ok": True, "content": []})
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+
+    async def scenario():
+        await mod.read_output_async(run_id="r", grep="x")
+        await mod.extract_failures_async(log_path="big.log")
+        await mod.debug_project_async(target="demo_project")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 3 and loop_thread not in threads
+
+
+def test_debug_project_async_pipeline(monkeypatch):
+    async def fake_run(target, max_output_lines, timeout_seconds, **kw):
+        return {"ok": True, "exit_code": 1, "output_tail": "t.py:7: AssertionError", "cwd": "/tmp"}
+
+    def fake_extract_failures(pytest_output, limit, base_dir):
+        return {"ok": True, "count": 1, "failures": [{"path_for_open_context": "t.py", "line": 7}]}
+
+    def fake_open_context(path, line, radius, base_dir):
+        return {"ok": True, "content": [{"line": 7, "text": "assert 1 == 2"}]}
+
+    async def fake_gemini(error_message, code_context):
+        return {"ok": True, "analysis": code_context}
+
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+    monkeypatch.setattr(mod, "extract_failures", fake_extract_failures)
+    monkeypatch.setattr(mod, "open_context", fake_open_context)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+
+    res = asyncio.run(mod.debug_project_async(target="demo_project"))
+    assert res["ok"] is True
+    assert res["stage"] == "done"
+    assert res["gemini"]["analysis"] == "7: assert 1 == 2"
+
+
+def test_debug_project_async_opens_call_chain_while_analyzing(tmp_path, monkeypatch):
+    src = tmp_path / "calc.py"
+    src.write_text("".join(f"x{i} = {i}\n" for i in range(1, 40)), encoding="utf-8")
+    record = {
+        "nodeid": "test_calc.py::test_it",
+        "when": "call",
+        "exc_type": "ValueError",
+        "message": "boom",
+        "frames": [
+            {"path": str(src), "line": 5, "function": "test_it"},
+            {"path": str(src), "line": 20, "function": "helper"},
+            {"path": str(src), "line": 30, "function": "inner"},
+        ],
+    }
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    events = []
+
+    async def fake_run(target, max_output_lines, timeout_seconds, **kw):
+        return {"ok": True, "exit_code": 1, "output_tail": "", "cwd": str(tmp_path), "failure_records": [record]}
+
+    async def fake_gemini(error_message, code_context):
+        events.append("llm-start")
+        await asyncio.sleep(0.2)
+        events.append("llm-end")
+        return {"ok": True, "analysis": "done"}
+
+    real_open_contexts = mod.open_contexts
+
+    def slow_open_contexts(**kw):
+        events.append("frames")
+        return real_open_contexts(**kw)
+
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+    monkeypatch.setattr(mod, "open_contexts", slow_open_contexts)
+
+    res = asyncio.run(mod.debug_project_async(target="."))
+    assert res["stage"] == "done"
+    assert res["failure"]["line"] == 30
+    assert events == ["llm-start", "frames", "llm-end"]
+    frames = res["frames_context"]
+    assert frames["ok"] is True
+    focus = sorted(line for f in frames["files"] for r in f["ranges"] for line in r["focus_lines"])
+    assert focus == [5, 20]
+
+
+def test_debug_project_async_fanout_deadline_cancels(monkeypatch):
+    cancelled = []
+
+    async def fake_run(target, max_output_lines, timeout_seconds, **kw):
+        return {"ok": True, "exit_code": 1, "output_tail": "", "cwd": "/tmp"}
+
+    def fake_extract_failures(pytest_output, limit, base_dir):
+        fails = [{"path_for_open_context": f"t{i}.py", "line": 1} for i in range(4)]
+        return {"ok": True, "count": limit, "failures": fails[:limit]}
+
+    def fake_open_context(path, line, radius, base_dir):
+        return {"ok": True, "content": [{"line": 1, "text": path}]}
+
+    async def fake_gemini(error_message, code_context):
+        try:
+            await asyncio.sleep(0.01 if "t0.py" in code_context else 5)
+        except asyncio.CancelledError:
+            cancelled.append(code_context)
+            raise
+        return {"ok": True, "analysis": code_context}
+
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+    monkeypatch.setattr(mod, "extract_failures", fake_extract_failures)
+    monkeypatch.setattr(mod, "open_context", fake_open_context)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+
+    res = asyncio.run(mod.debug_project_async(target=".", failure_limit=4, concurrency=4, deadline_seconds=0.3))
+    assert res["stage"] == "done"
+    assert [f["stage"] for f in res["failures"]] == ["done", "deadline", "deadline", "deadline"]
+    assert len(cancelled) == 3
+    assert res["fanout"]["elapsed_seconds"] < 2
+
+
+def test_debug_project_async_deadline_covers_the_pytest_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "t.py").write_text("def test_x():\n    raise ValueError('boom')\n", encoding="utf-8")
+    events = []
+
+    async def fake_run(target, max_output_lines, timeout_seconds, **kw):
+        on_record = (mod._RUN_HOOKS.get() or {}).get("on_record")
+        if on_record is not None:
+            await on_record({"event": "start", "invocation_dir": str(tmp_path)})
+            await on_record({
+                "event": "failure",
+                "nodeid": "t.py::test_x",
+                "exc_type": "ValueError",
+                "message": "boom",
+                "frames": [{"path": str(tmp_path / "t.py"), "line": 2, "function": "test_x"}],
+            })
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            events.append("pytest-cancelled")
+            raise
+        return {"ok": True, "exit_code": 1, "output_tail": "", "cwd": str(tmp_path)}
+
+    async def slow_gemini(error_message, code_context):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            events.append("analysis-cancelled")
+            raise
+
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", slow_gemini)
+
+    started = time.monotonic()
+    plain = asyncio.run(mod.debug_project_async(target=".", pipeline=False, deadline_seconds=0.2))
+    assert plain["stage"] == "run_pytest" and "deadline exceeded" in plain["details"]["error"]
+    assert events == ["pytest-cancelled"]
+
+    events.clear()
+    res = asyncio.run(mod.debug_project_async(target=".", deadline_seconds=0.3, token_budget=0))
+    assert time.monotonic() - started < 2
+    assert sorted(events) == ["analysis-cancelled", "pytest-cancelled"]
+    assert res["ok"] is True and res["stage"] == "deadline" and res["failure"]["nodeid"] == "t.py::test_x"
+    assert res["fanout"]["deadline_expired"] is True and "deadline exceeded" in res["pytest"]["error"]
+
+
+def test_debug_project_async_pipeline_analyzes_before_run_ends(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(
+        {"test_mod.py": "import time\n\ndef test_bad():\n    assert 1 == 2\n\ndef test_slow():\n    time.sleep(2)\n"}
+    )
+    analyzed = []
+
+    async def fake_gemini(error_message, code_context):
+        analyzed.append(time.monotonic())
+        return {"ok": True, "analysis": error_message}
+
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+
+    started = time.monotonic()
+    res = asyncio.run(mod.debug_project_async(target="proj", fail_fast=False, timeout_seconds=30))
+    finished = time.monotonic()
+    assert res["stage"] == "done"
+    assert res["failure"]["nodeid"] == "proj/test_mod.py::test_bad"
+    assert "AssertionError" in res["gemini"]["analysis"]
+    assert res["pipeline"]["started_during_run"] == 1
+    assert res["pipeline"]["first_started_seconds"] < res["pipeline"]["pytest_seconds"] - 1
+    assert analyzed[0] - started < finished - started - 1
@@ -1,3 +1,6 @@
+import threading
+import time
+
 import pytest
 import server as mod
 
@@ -73,3 +76,91 @@ def test_debug_project_open_context_failure(monkeypatch):
     res = mod.debug_project(target="demo_project")
     assert res["ok"] is True
     assert res["stage"] == "open_context"
+
+
+def _fanout_fakes(monkeypatch, n, gemini):
+    def fake_run_pytest(target, max_output_lines, timeout_seconds):
+        return {"ok": True, "exit_code": 1, "output_tail": "many failures", "cwd": "/tmp"}
+
+    def fake_extract_failures(pytest_output, limit, base_dir):
+        fails = [{"path_for_open_context": f"t{i}.py", "line": i + 1} for i in range(n)]
+        return {"ok": True, "count": min(n, limit), "failures": fails[:limit]}
+
+    def fake_open_context(path, line, radius, base_dir):
+        if path == "t2.py":
+            return {"ok": False, "error": "file not found"}
+        return {"ok": True, "content": [{"line": line, "text": path}]}
+
+    monkeypatch.setattr(mod, "run_pytest", fake_run_pytest)
+    monkeypatch.setattr(mod, "extract_failures", fake_extract_failures)
+    monkeypatch.setattr(mod, "open_context", fake_open_context)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini", gemini)
+
+
+def test_debug_project_fans_out_over_failures(monkeypatch):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_gemini(error_message, code_context):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        if "t3.py" in code_context:
+            raise RuntimeError("llm exploded")
+        return {"ok": True, "analysis": code_context}
+
+    _fanout_fakes(monkeypatch, 6, fake_gemini)
+    res = mod.debug_project(target="demo_project", failure_limit=6, concurrency=3)
+    assert res["stage"] == "done"
+    assert res["gemini"]["analysis"] == "1: t0.py"
+    fails = res["failures"]
+    assert [f["index"] for f in fails] == list(range(6))
+    assert [f["stage"] for f in fails] == ["done", "done", "open_context", "error", "done", "done"]
+    assert "llm exploded" in fails[3]["error"]
+    assert fails[5]["gemini"]["analysis"] == "6: t5.py"
+    assert max(peak) <= 3
+    assert res["fanout"]["concurrency"] == 3 and res["fanout"]["deadline_expired"] is False
+
+
+def test_debug_project_fanout_deadline(monkeypatch):
+    def fake_gemini(error_message, code_context):
+        time.sleep(0.02 if "t0.py" in code_context else 1.0)
+        return {"ok": True, "analysis": code_context}
+
+    _fanout_fakes(monkeypatch, 5, fake_gemini)
+    started = time.monotonic()
+    res = mod.debug_project(target="demo_project", failure_limit=5, concurrency=2, deadline_seconds=0.3)
+    assert time.monotonic() - started < 0.9
+    assert res["fanout"]["deadline_expired"] is True
+    stages = [f["stage"] for f in res["failures"]]
+    assert stages[0] == "done"
+    assert stages[2] == "open_context"
+    assert set(stages[3:]) == {"deadline"}
+    assert "cancelled" in res["failures"][4]["error"]
+
+
+def test_debug_project_deadline_stops_workers_before_their_llm_call(monkeypatch):
+    analyzed = []
+
+    def fake_gemini(error_message, code_context):
+        analyzed.append(code_context)
+        return {"ok": True, "analysis": code_context}
+
+    _fanout_fakes(monkeypatch, 2, fake_gemini)
+    open_context = mod.open_context
+
+    def slow_open_context(path, line, radius, base_dir):
+        if path == "t1.py":
+            time.sleep(0.5)
+        return open_context(path=path, line=line, radius=radius, base_dir=base_dir)
+
+    monkeypatch.setattr(mod, "open_context", slow_open_context)
+    res = mod.debug_project(target="demo_project", failure_limit=2, concurrency=2, deadline_seconds=0.2)
+    assert res["fanout"]["deadline_expired"] is True and res["fanout"]["still_running"] == 1
+    time.sleep(0.6)
+    # The straggler finished opening its context after the deadline and skipped the LLM call.
+    assert analyzed == ["1: t0.py"]
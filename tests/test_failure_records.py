@@ -0,0 +1,67 @@
+import asyncio
+
+import server as mod
+
+
+DEEP_PROJECT = {
+    "helpers.py": "def deep(n):\n"
+    "    if n == 0:\n"
+    "        raise ValueError('boom 42')\n"
+    "    return deep(n - 1)\n",
+    "test_mod.py": "from helpers import deep\n\n"
+    "def test_ok():\n    assert True\n\n"
+    "def test_deep():\n    print('x\\n' * 500)\n    deep(3)\n",
+}
+
+
+def test_run_pytest_returns_plugin_records(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = write_project(DEEP_PROJECT)
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", max_output_lines=3, timeout_seconds=30))
+    assert res["ok"] is True
+    assert res["exit_code"] == 1
+
+    (rec,) = res["failure_records"]
+    assert rec["nodeid"] == "proj/test_mod.py::test_deep"
+    assert rec["exc_type"] == "ValueError"
+    assert rec["message"] == "boom 42"
+    assert rec["frames"][0]["function"] == "test_deep"
+    assert rec["frames"][-1] == {"path": str(proj / "helpers.py"), "line": 3, "function": "deep"}
+    assert rec["duration"] >= 0
+
+
+def test_run_pytest_records_collection_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "test_broken.py").write_text("import no_such_module_xyz\n", encoding="utf-8")
+
+    res = mod.run_pytest(target="proj", timeout_seconds=30)
+    (rec,) = res["failure_records"]
+    assert rec["when"] == "collect"
+    assert "no_such_module_xyz" in rec["message"]
+
+
+def test_debug_project_uses_records_even_when_tail_is_tiny(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(DEEP_PROJECT)
+
+    def fail_extract(**kw):
+        raise AssertionError("text parsing must not be used when records exist")
+
+    seen = {}
+
+    def fake_gemini(error_message, code_context):
+        seen["error_message"] = error_message
+        return {"ok": True, "analysis": "ok"}
+
+    monkeypatch.setattr(mod, "extract_failures", fail_extract)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini", fake_gemini)
+
+    res = mod.debug_project(target="proj", max_output_lines=1, radius=5)
+    assert res["stage"] == "done"
+    assert res["failure"]["path_for_open_context"] == "proj/helpers.py"
+    assert res["failure"]["line"] == 3
+    assert res["context"]["focus_line"] == 3
+    assert "ValueError: boom 42" in seen["error_message"]
@@ -0,0 +1,69 @@
+import os
+
+import server as mod
+from debug_companion.file_cache import INLINE_MAX_BYTES, FileLineCache
+
+
+def _window(cache, path, start, end):
+    index, hit = cache.get(str(path))
+    return index.window(start, end), hit
+
+
+def test_windows_match_splitlines(tmp_path):
+    cases = {
+        "lf.py": "a\nb\n\nc",
+        "crlf.py": "a\r\nb\r\n\r\nc\r\n",
+        "formfeed.py": "a\n\x0c\nb\rc\n",
+        "utf8.py": "é = 1\n# ünïcode\n",
+        "big.py": "".join(f"line {i} ✓\n" for i in range(INLINE_MAX_BYTES // 8)),
+    }
+    cache = FileLineCache()
+    for name, text in cases.items():
+        p = tmp_path / name
+        p.write_bytes(text.encode("utf-8"))
+        expected = p.read_text(encoding="utf-8").splitlines()
+        index, _ = cache.get(str(p))
+        assert index.line_count == len(expected), name
+        assert index.window(1, len(expected)) == expected, name
+        mid = len(expected) // 2 + 1
+        assert index.window(mid, mid) == [expected[mid - 1]], name
+
+
+def test_cache_hits_and_invalidates_on_change(tmp_path):
+    cache = FileLineCache()
+    p = tmp_path / "x.py"
+    p.write_text("one\ntwo\n", encoding="utf-8")
+
+    assert _window(cache, p, 1, 2) == (["one", "two"], False)
+    assert _window(cache, p, 2, 2) == (["two"], True)
+
+    p.write_text("one\ntwo\nthree\n", encoding="utf-8")
+    os.utime(p, ns=(1, 1))
+    assert _window(cache, p, 3, 3) == (["three"], False)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 2, 1)
+
+
+def test_cache_evicts_past_memory_cap(tmp_path):
+    cache = FileLineCache(max_bytes=4096)
+    for i in range(5):
+        p = tmp_path / f"f{i}.py"
+        p.write_text("x = 1\n" * 300, encoding="utf-8")
+        cache.get(str(p))
+    stats = cache.stats()
+    assert stats["evictions"] >= 3
+    assert stats["bytes"] <= 4096 or stats["entries"] == 1
+
+
+def test_open_context_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "y.py").write_text("\n".join(f"v{i} = {i}" for i in range(1, 41)), encoding="utf-8")
+
+    before = mod.cache_stats()["file_cache"]
+    first = mod.open_context(path="y.py", line=20, radius=5)
+    second = mod.open_context(path="y.py", line=30, radius=5)
+    after = mod.cache_stats()["file_cache"]
+
+    assert first["content"][0] == {"line": 15, "text": "v15 = 15"}
+    assert second["content"][-1] == {"line": 35, "text": "v35 = 35"}
+    assert after["hits"] - before["hits"] >= 1
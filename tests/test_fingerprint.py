@@ -0,0 +1,144 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+import server as mod
+from debug_companion.fingerprint import cluster_records, fingerprint, normalize_message
+
+
+def _record(nodeid, message, line=3, path="/proj/helpers.py"):
+    return {
+        "nodeid": nodeid,
+        "exc_type": "ValueError",
+        "message": message,
+        "frames": [
+            {"path": "/proj/test_mod.py", "line": 10, "function": nodeid.rsplit("::", 1)[-1]},
+            {"path": path, "line": line, "function": "check"},
+            {"path": "/usr/lib/python3/site-packages/lib.py", "line": 99, "function": "inner"},
+        ],
+    }
+
+
+def test_fingerprint_ignores_numbers_addresses_and_outer_frames():
+    assert normalize_message("bad value 42 at 0x7f3a2c1d\n  details 7") == "bad value <n> at <addr>"
+    proj = Path("/proj")
+    a, fr = fingerprint(_record("test_mod.py::test_a", "bad value 1 at 0xdeadbeef"), proj)
+    b, _ = fingerprint(_record("test_mod.py::test_b", "bad value 2.5 at 0x1f"), proj)
+    assert a == b and fr["path"] == "/proj/helpers.py"
+    assert fingerprint(_record("test_mod.py::test_c", "bad value 1 at 0x1", line=4), proj)[0] != a
+    assert fingerprint(_record("test_mod.py::test_d", "other 1 at 0x1"), proj)[0] != a
+
+    clusters = cluster_records(
+        [_record(f"test_mod.py::test_{i}", f"bad value {i} at 0x{i:x}") for i in range(30)]
+        + [_record("test_mod.py::test_x", "bad value 1", path="/proj/other.py")],
+        proj,
+    ).summary()
+    assert [c["count"] for c in clusters] == [30, 1]
+    assert clusters[0]["representative"] == "test_mod.py::test_0"
+    assert len(clusters[0]["members"]) == 20 and clusters[0]["members_omitted"] == 10
+    assert clusters[0]["location"] == {"path": "/proj/helpers.py", "line": 3, "function": "check"}
+
+
+CLUSTER_PROJECT = {
+    "helpers.py": "class Box:\n    pass\n\n\n"
+    "def check(n):\n    raise ValueError(f'bad value {n} in {Box()!r}')\n",
+    "test_mod.py": "from helpers import check\n"
+    + "".join(f"\ndef test_shared_{i}():\n    check({i})\n" for i in range(6))
+    + "\ndef test_own():\n    assert 1 + 1 == 3\n",
+}
+
+
+@pytest.mark.parametrize("pipeline", [True, False])
+def test_debug_project_analyzes_one_failure_per_cluster(tmp_path, monkeypatch, pipeline, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(CLUSTER_PROJECT)
+    prompts = []
+
+    async def fake_gemini(error_message, code_context):
+        prompts.append(error_message)
+        return {"ok": True, "analysis": "x"}
+
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+    res = asyncio.run(
+        mod.debug_project_async(target="proj", failure_limit=5, fail_fast=False, pipeline=pipeline, token_budget=0)
+    )
+
+    assert res["stage"] == "done"
+    assert len(prompts) == 2 and len(res["failures"]) == 2
+    assert [c["count"] for c in res["clusters"]] == [6, 1]
+    assert res["fanout"]["clusters"] == 2 and res["fanout"]["clustered_failures"] == 7
+    shared = res["failures"][0]["failure"]
+    assert shared["function"] == "check" and shared["cluster"]["count"] == 6
+    assert shared["cluster"]["members"][-1] == "proj/test_mod.py::test_shared_5"
+    assert res["failures"][1]["failure"]["nodeid"] == "proj/test_mod.py::test_own"
+    if not pipeline:
+        assert "The same failure occurs in 5 other test(s)" in prompts[0]
+
+
+@pytest.mark.parametrize("pipeline", [True, False])
+def test_fail_fast_stops_once_failure_limit_clusters_are_known(tmp_path, monkeypatch, pipeline, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = write_project(CLUSTER_PROJECT)
+    with open(proj / "test_mod.py", "a", encoding="utf-8") as f:
+        f.write("\ndef test_zz_slow():\n    import time\n    time.sleep(30)\n")
+
+    async def fake_gemini(error_message, code_context):
+        return {"ok": True, "analysis": "x"}
+
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+    started = time.monotonic()
+    res = asyncio.run(
+        mod.debug_project_async(target="proj", failure_limit=2, timeout_seconds=60, pipeline=pipeline, token_budget=0)
+    )
+
+    # Six failures share one cluster; --maxfail=2 would have stopped before the second one. The
+    # plugin ends the session instead of the run being killed, so pytest still prints its summary.
+    assert time.monotonic() - started < 20
+    assert "--maxfail" not in " ".join(res["pytest"]["cmd"])
+    assert res["pytest"]["exit_code"] == 1 and not res["pytest"].get("stopped")
+    assert "stopping after 2 failure clusters" in res["pytest"]["output_tail"]
+    assert [c["count"] for c in res["clusters"]] == [6, 1]
+    assert res["failures"][1]["failure"]["nodeid"] == "proj/test_mod.py::test_own"
+
+
+@pytest.mark.parametrize("pipeline", [True, False])
+def test_fail_fast_keeps_the_failure_summary(tmp_path, monkeypatch, pipeline, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(
+        {
+            "test_mod.py": "def test_a():\n    assert 1 == 2\n\n\ndef test_b():\n    import time\n    time.sleep(30)\n",
+        }
+    )
+
+    async def fake_gemini(error_message, code_context):
+        return {"ok": True, "analysis": "x"}
+
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", fake_gemini)
+    res = asyncio.run(mod.debug_project_async(target="proj", timeout_seconds=60, pipeline=pipeline, token_budget=0))
+
+    tail = res["pytest"]["output_tail"]
+    assert "--maxfail=1" in res["pytest"]["cmd"]
+    assert res["pytest"]["exit_code"] == 1
+    assert "= FAILURES =" in tail and "short test summary info" in tail
+    assert "FAILED proj/test_mod.py::test_a" in tail
+
+
+def test_extract_failures_clusters_text_tracebacks(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    blocks = []
+    for i in range(8):
+        blocks.append(
+            f"_____ test_{i} _____\n\n"
+            f"    def test_{i}():\n>       check({i})\n\ntest_mod.py:{10 + i}: \n"
+            f"    def check(n):\n>       raise KeyError(n)\nE       KeyError: {i}\n\nhelpers.py:2: KeyError\n"
+        )
+    output = "=== FAILURES ===\n" + "".join(blocks) + "=== short test summary info ===\n"
+
+    res = mod.extract_failures(pytest_output=output, limit=3)
+    assert len(res["records"]) == 3
+    assert len(res["clusters"]) == 1
+    cluster = res["clusters"][0]
+    assert cluster["count"] == 8 and cluster["message"] == "<n>"
+    assert (cluster["location"]["path"], cluster["location"]["line"]) == ("helpers.py", 2)
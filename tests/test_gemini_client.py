@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+import server as mod
+from debug_companion import gemini_client
+from debug_companion.gemini_client import get_gemini_client, normalize_prompt, prompt_cache_key
+
+log = logging.getLogger("test")
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    monkeypatch.setenv("GEMINI_BACKEND", "fake")
+    monkeypatch.delenv("GEMINI_CACHE_TTL_SECONDS", raising=False)
+    gemini_client.reset_gemini_client()
+    yield
+    gemini_client.reset_gemini_client()
+
+
+def test_client_is_reused(fake_backend):
+    assert get_gemini_client(log) is get_gemini_client(log)
+
+
+def test_response_cache_hit_and_normalization(fake_backend):
+    err = "E   AssertionError: <Foo object at 0x7f3a2b1c0d10>\n1 failed in 0.12s"
+    first = mod.analyze_error_with_gemini(error_message=err, code_context="x = 1")
+    assert first["ok"] is True
+    assert first["cache"]["hit"] is False
+
+    again = mod.analyze_error_with_gemini(
+        error_message=err.replace("0x7f3a2b1c0d10", "0x7f00deadbeef").replace("0.12s", "0.31s"),
+        code_context="x = 1   ",
+    )
+    assert again["cache"]["hit"] is True
+    assert again["analysis"] == first["analysis"]
+    assert get_gemini_client(log).models.calls == 1
+
+    other = mod.analyze_error_with_gemini(error_message=err, code_context="x = 2")
+    assert other["cache"]["hit"] is False
+
+
+def test_cache_key_depends_on_model():
+    assert normalize_prompt("a  \r\n\n\n\nb") == "a\n\nb"
+    assert prompt_cache_key("m1", "p") != prompt_cache_key("m2", "p")
+
+
+def test_response_cache_ttl_expiry(fake_backend, monkeypatch):
+    mod.analyze_error_with_gemini(error_message="E boom", code_context="")
+    real_time = time.time
+    monkeypatch.setattr(gemini_client.time, "time", lambda: real_time() + 10)
+    monkeypatch.setenv("GEMINI_CACHE_TTL_SECONDS", "5")
+    res = mod.analyze_error_with_gemini(error_message="E boom", code_context="")
+    assert res["cache"]["hit"] is False
+    assert get_gemini_client(log).models.calls == 2
+
+
+def test_fake_answers_are_not_served_to_the_real_backend(fake_backend, monkeypatch):
+    err = "E   KeyError: 'backend'"
+    fake = mod.analyze_error_with_gemini(error_message=err, code_context="")
+    assert fake["analysis"].startswith("[fake ")
+
+    class _Response:
+        text = "real analysis"
+
+    class _Models:
+        def generate_content(self, *, model, contents):
+            return _Response()
+
+    class _Client:
+        def __init__(self, api_key):
+            self.models = _Models()
+
+    class _Genai:
+        Client = _Client
+
+    monkeypatch.setattr(gemini_client, "genai", _Genai)
+    monkeypatch.setenv("GEMINI_BACKEND", "gemini")
+    monkeypatch.setenv("GEMINI_API_KEY", "k1")
+    real = mod.analyze_error_with_gemini(error_message=err, code_context="")
+    assert real["cache"]["hit"] is False
+    assert real["analysis"] == "real analysis"
+
+    monkeypatch.setenv("GEMINI_API_KEY", "k2")
+    assert mod.analyze_error_with_gemini(error_message=err, code_context="")["cache"]["hit"] is False
+    monkeypatch.setenv("GEMINI_API_KEY", "k1")
+    assert mod.analyze_error_with_gemini(error_message=err, code_context="")["cache"]["hit"] is True
+
+
+def test_no_backend_configured(monkeypatch):
+    monkeypatch.delenv("GEMINI_BACKEND", raising=False)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    gemini_client.reset_gemini_client()
+    res = mod.analyze_error_with_gemini(error_message="E nothing cached", code_context="")
+    assert res["ok"] is False
+
+
+class _RecordingCtx:
+    def __init__(self):
+        self.events = []
+
+    async def report_progress(self, progress, total=None, message=None):
+        self.events.append((progress, message))
+
+
+def test_streamed_analysis_reports_chunks(fake_backend):
+    ctx = _RecordingCtx()
+    err = "E   ValueError: bad value for streaming"
+    res = asyncio.run(mod.analyze_error_with_gemini_async(error_message=err, code_context="x = 1", ctx=ctx))
+    assert res["ok"] is True and res["streamed"] is True
+    assert len(ctx.events) > 1
+    assert "".join(m for _, m in ctx.events) == res["analysis"]
+    values = [p for p, _ in ctx.events]
+    assert values == sorted(set(values))
+
+    # A cached answer arrives as a single chunk.
+    ctx2 = _RecordingCtx()
+    again = asyncio.run(mod.analyze_error_with_gemini_async(error_message=err, code_context="x = 1", ctx=ctx2))
+    assert again["cache"]["hit"] is True
+    assert [m for _, m in ctx2.events] == [res["analysis"]]
@@ -0,0 +1,75 @@
+import asyncio
+
+import server as mod
+from debug_companion import history
+
+
+def _run(project, outcomes, durations=None):
+    durations = durations or {}
+    tests = [{"nodeid": nid, "outcome": out, "duration": durations.get(nid, 0.01)} for nid, out in outcomes.items()]
+    history.record_run(project, tests, target="t", exit_code=int(any(o == "failed" for o in outcomes.values())), wall_seconds=2.0)
+
+
+def test_summary_slowest_flakiest_and_pruning(monkeypatch):
+    monkeypatch.setattr(history, "MAX_RUNS", 3)
+    for outcome in ("passed", "failed", "passed", "passed"):
+        _run("/p", {"t::flaky": outcome, "t::slow": "passed", "t::fast": "passed"}, {"t::slow": 1.0, "t::fast": 0.001})
+    _run("/p", {"t::slow": "passed", "t::broken": "failed"}, {"t::slow": 3.0})
+    _run("/other", {"t::x": "failed"})
+    assert history.flush()
+
+    res = history.history_summary("/p", limit=5)
+    assert res["ok"] is True and len(res["recent_runs"]) == 3
+    assert res["slowest"][0]["nodeid"] == "t::slow"
+    assert res["slowest"][0]["avg_seconds"] == 2.0 and res["slowest"][0]["max_seconds"] == 3.0
+    assert [t["nodeid"] for t in res["flakiest"]] == ["t::flaky"]
+    assert res["flakiest"][0]["flips"] == 2 and res["flakiest"][0]["last_outcome"] == "passed"
+    assert [t["nodeid"] for t in res["failing"]] == ["t::broken"]
+    assert history.load_durations("/other") == {"t::x": 0.01}
+
+
+HISTORY_PROJECT = {
+    "test_mod.py": "import time\n\n"
+    "def test_slow():\n    time.sleep(0.6)\n\n"
+    "def test_a():\n    pass\n\n"
+    "def test_b():\n    pass\n\n"
+    "def test_broken():\n    assert 1 == 2\n",
+}
+
+
+def test_runs_order_failed_first_and_fit_time_budget(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(HISTORY_PROJECT)
+
+    async def scenario():
+        first = await mod.run_pytest_async(target="proj", timeout_seconds=30, fail_fast=False)
+        ordered = await mod.run_pytest_async(target="proj", timeout_seconds=30, prioritize=True)
+        overhead = history.startup_overhead(first["cwd"])
+        budgeted = await mod.run_pytest_async(
+            target="proj", timeout_seconds=30, fail_fast=False, time_budget_seconds=overhead + 0.3
+        )
+        return first, ordered, budgeted, await mod.run_history(target="proj")
+
+    first, ordered, budgeted, summary = asyncio.run(scenario())
+    assert "plan" not in first
+    plan = ordered["plan"]["first"]
+    assert plan[0] == "proj/test_mod.py::test_broken" and plan[-1] == "proj/test_mod.py::test_slow"
+    # --maxfail=1 stops right after the known failure, before the slow test.
+    assert ordered["exit_code"] == 1 and "1 failed" in ordered["output_tail"] and "passed" not in ordered["output_tail"]
+
+    assert budgeted["plan"]["deselected_ids"] == ["proj/test_mod.py::test_slow"]
+    assert budgeted["plan"]["selected"] == 3 and budgeted["plan"]["known_tests"] == 4
+    assert "1 deselected" in budgeted["output_tail"]
+
+    assert summary["slowest"][0]["nodeid"] == "proj/test_mod.py::test_slow"
+    assert summary["slowest"][0]["runs"] == 1
+    assert summary["failing"][0]["nodeid"] == "proj/test_mod.py::test_broken"
+    assert summary["failing"][0]["failures"] == 3
+    assert len(summary["recent_runs"]) == 3
+
+
+def test_sharded_and_impact_runs_refuse_ordering_options():
+    sharded = asyncio.run(mod.run_pytest_async(target="proj", shards=2, prioritize=True, warm=True))
+    assert sharded["ok"] is False and sharded["error"] == "not supported for sharded runs: warm, prioritize"
+    impacted = asyncio.run(mod.run_pytest_async(target="proj", impact="git", time_budget_seconds=5))
+    assert impacted["ok"] is False and impacted["error"] == "not supported for impact runs: time_budget_seconds"
@@ -0,0 +1,95 @@
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+import server as mod
+from debug_companion.impact import parse_git_diff, select_tests
+
+
+def test_parse_git_diff_old_side_lines():
+    diff = (
+        "diff --git a/lib.py b/lib.py\n"
+        "--- a/lib.py\n"
+        "+++ b/lib.py\n"
+        "@@ -5,2 +5,3 @@ def mul(a, b):\n"
+        "@@ -10 +11,0 @@\n"
+        "@@ -20,0 +21,2 @@\n"
+        "diff --git a/new.py b/new.py\n"
+        "--- /dev/null\n"
+        "+++ b/new.py\n"
+        "@@ -0,0 +1,3 @@\n"
+    )
+    changed = parse_git_diff(diff)
+    assert changed["lib.py"] == {5, 6, 10, 20, 21}
+    assert changed["new.py"] is None
+
+
+def test_select_tests_by_lines_and_fallbacks():
+    cov_map = {
+        "tests": {
+            "t.py::test_add": {"lib.py": [1, 2], "t.py": [3, 4]},
+            "t.py::test_mul": {"lib.py": [5, 6], "t.py": [7, 8]},
+        }
+    }
+    collected = ["t.py::test_add", "t.py::test_mul", "t.py::test_new"]
+
+    selected, reasons, full = select_tests(cov_map, {"lib.py": {6}}, collected)
+    assert not full
+    assert selected == ["t.py::test_mul", "t.py::test_new"]
+    assert reasons["t.py::test_mul"] == ["lib.py:6"]
+
+    # A module-level line no test executed falls back to every test touching the file.
+    selected, _, _ = select_tests(cov_map, {"lib.py": {9}}, collected[:2])
+    assert selected == ["t.py::test_add", "t.py::test_mul"]
+
+    selected, _, full = select_tests(cov_map, {"conftest.py": None}, collected)
+    assert full and selected == collected
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not available")
+def test_impact_git_mode_runs_only_affected_tests(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "lib.py").write_text(
+        "def add(a, b):\n    return a + b\n\n\ndef mul(a, b):\n    return a * b\n", encoding="utf-8"
+    )
+    (proj / "test_lib.py").write_text(
+        "from lib import add, mul\n\n\ndef test_add():\n    assert add(2, 3) == 5\n\n\n"
+        "def test_mul():\n    assert mul(2, 3) == 6\n",
+        encoding="utf-8",
+    )
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "-c", "user.email=t@t", "-c", "user.name=t", "commit", "-q", "-m", "init")
+
+    first = asyncio.run(mod.run_pytest_async(target="proj", impact="git", timeout_seconds=60))
+    assert first["ok"] is True and first["exit_code"] == 0
+    assert first["impact"]["full_run"] is True
+    assert first["impact"]["selected_count"] == 2
+
+    unchanged = asyncio.run(mod.run_pytest_async(target="proj", impact="git", timeout_seconds=60))
+    assert unchanged["exit_code"] == 0
+    assert unchanged["impact"]["selected_count"] == 0
+
+    (proj / "lib.py").write_text(
+        "def add(a, b):\n    return a + b\n\n\ndef mul(a, b):\n    return a * b + 1\n", encoding="utf-8"
+    )
+    res = asyncio.run(mod.run_pytest_async(target="proj", impact="git", timeout_seconds=60))
+    assert res["ok"] is True
+    assert res["exit_code"] == 1
+    assert [nid.split("::")[-1] for nid in res["impact"]["selected"]] == ["test_mul"]
+    assert [r["nodeid"].split("::")[-1] for r in res["failure_records"]] == ["test_mul"]
+
+
+def test_impact_rejects_unknown_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    res = asyncio.run(mod.run_pytest_async(target="", impact="svn"))
+    assert res["ok"] is False
+    assert "unknown impact mode" in res["error"]
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Budget for what `import server` costs on top of the MCP SDK (and asyncio) it cannot avoid.
+IMPORT_BUDGET_MS = float(os.environ.get("MCP_IMPORT_BUDGET_MS") or 250)
+
+LAZY_MODULES = (
+    "google.genai",
+    "debug_companion.gemini_client",
+    "debug_companion.pytest_runner",
+    "debug_companion.context_tools",
+    "debug_companion.impact",
+    "debug_companion.sharding",
+    "debug_companion.ast_index",
+    "debug_companion.file_cache",
+)
+
+
+def _importtime():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=str(ROOT),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def _own_cost_ms(rows) -> float:
+    server = next(r for r in rows if r[3] == "server")
+    # Direct children of server are the rows at depth 1 that follow other rows of depth >= 1;
+    # -X importtime prints children before their parent, so scan backwards from server.
+    idx = rows.index(server)
+    unavoidable = 0
+    for self_us, cumulative_us, depth, name in reversed(rows[:idx]):
+        if depth < server[2] + 1:
+            break
+        if depth == server[2] + 1 and (name == "asyncio" or name.split(".")[0] == "mcp"):
+            unavoidable += cumulative_us
+    return (server[1] - unavoidable) / 1000.0
+
+
+def test_server_import_defers_heavy_modules():
+    names = {r[3] for r in _importtime()}
+    assert not names & set(LAZY_MODULES)
+    assert "server" in names
+
+
+def test_server_import_time_budget():
+    best = min(_own_cost_ms(_importtime()) for _ in range(3))
+    assert best < IMPORT_BUDGET_MS, f"server import costs {best:.1f} ms beyond mcp (budget {IMPORT_BUDGET_MS} ms)"
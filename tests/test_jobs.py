@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import server as mod
+from debug_companion.jobs import JobScheduler
+
+
+def test_start_and_poll_real_run(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project({"test_mod.py": "def test_bad():\n    assert 1 == 2\n"})
+
+    async def scenario():
+        started = await mod.start_run(target="proj", args={"timeout_seconds": 30})
+        assert started["ok"] is True and started["coalesced"] is False
+        assert started["state"] in ("queued", "running")
+        res = await mod.poll_run(job_id=started["job_id"], wait_seconds=30)
+        listing = await mod.poll_run()
+        return res, listing
+
+    res, listing = asyncio.run(scenario())
+    assert res["state"] == "done"
+    assert res["result"]["exit_code"] == 1
+    assert "assert 1 == 2" in res["result"]["output_tail"]
+    assert listing["states"] == {"done": 1}
+    assert "result" not in listing["runs"][0]
+
+
+def test_jobs_coalesce_lock_targets_and_limit_concurrency(monkeypatch):
+    monkeypatch.setenv("MCP_MAX_JOBS", "2")
+    active = {}
+    peak = {"all": 0}
+
+    async def fake_run(target="", timeout_seconds=30, ctx=None):
+        active[target] = active.get(target, 0) + 1
+        peak[target] = max(peak.get(target, 0), active[target])
+        peak["all"] = max(peak["all"], sum(active.values()))
+        await ctx.report_progress(progress=1, message=f"running {target}")
+        await asyncio.sleep(0.1)
+        active[target] -= 1
+        return {"ok": True, "exit_code": 0, "target": target, "timeout_seconds": timeout_seconds}
+
+    monkeypatch.setattr(mod, "run_pytest_async", fake_run)
+
+    async def scenario():
+        a1 = await mod.start_run(target="a", args={"timeout_seconds": 30})
+        a2 = await mod.start_run(target="a")  # same as a1 once defaults are filled in
+        a3 = await mod.start_run(target="a", args={"timeout_seconds": 60})
+        b = await mod.start_run(target="b")
+        c = await mod.start_run(target="c")
+        bad = await mod.start_run(target="a", args={"no_such_arg": 1})
+        ids = [a1["job_id"], a3["job_id"], b["job_id"], c["job_id"]]
+        results = [await mod.poll_run(job_id=i, wait_seconds=10) for i in ids]
+        return a1, a2, bad, results
+
+    a1, a2, bad, results = asyncio.run(scenario())
+    assert a2["job_id"] == a1["job_id"] and a2["coalesced"] is True
+    assert bad["ok"] is False and "no_such_arg" in bad["error"]
+    assert [r["state"] for r in results] == ["done"] * 4
+    assert results[0]["requests"] == 2
+    assert results[1]["result"]["timeout_seconds"] == 60
+    assert results[0]["message"] == "running a"
+    assert peak["a"] == 1
+    assert peak["all"] == 2
+
+
+def test_target_locks_are_dropped_once_released():
+    async def scenario():
+        sched = JobScheduler()
+        order = []
+
+        async def hold(key, tag):
+            async with sched.target_lock(key):
+                order.append(f"{tag}+")
+                await asyncio.sleep(0.05)
+                order.append(f"{tag}-")
+
+        tasks = [asyncio.ensure_future(hold("a", "a1")), asyncio.ensure_future(hold("a", "a2"))]
+        waiter = asyncio.ensure_future(hold("a", "a3"))
+        await asyncio.sleep(0.01)
+        assert sched._target_locks["a"][1] == 3
+        waiter.cancel()
+        await asyncio.gather(*tasks, hold("b", "b"), return_exceptions=True)
+        return order, sched._target_locks
+
+    order, locks = asyncio.run(scenario())
+    assert order.index("a1-") < order.index("a2+") and "a3+" not in order
+    assert locks == {}
+
+
+def test_cancel_run_kills_pytest(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project({"test_mod.py": "import time\n\ndef test_slow():\n    time.sleep(60)\n"})
+
+    async def scenario():
+        started = await mod.start_run(target="proj", args={"timeout_seconds": 600})
+        await asyncio.sleep(0.5)
+        assert (await mod.poll_run(job_id=started["job_id"]))["state"] == "running"
+        cancelled = await mod.cancel_run(job_id=started["job_id"])
+        again = await mod.start_run(target="proj", args={"timeout_seconds": 600})
+        await mod.cancel_run(job_id=again["job_id"])
+        return cancelled, again, started
+
+    t0 = time.monotonic()
+    cancelled, again, started = asyncio.run(scenario())
+    assert time.monotonic() - t0 < 30
+    assert cancelled["state"] == "cancelled"
+    assert cancelled["error"] == "cancelled by request"
+    assert again["job_id"] != started["job_id"]
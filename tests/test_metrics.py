@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+import server as mod
+from debug_companion.metrics import Histogram, Registry, get_registry
+
+
+@pytest.fixture
+def registry():
+    reg = get_registry()
+    reg.reset()
+    yield reg
+    reg.reset()
+
+
+def test_tool_spans_and_counters(tmp_path, monkeypatch, registry):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "m.py").write_text("".join(f"x{i} = {i}\n" for i in range(100)), encoding="utf-8")
+
+    assert mod.open_context(path="m.py", line=50, radius=5)["ok"] is True
+    assert mod.open_context(path="m.py", line=60, radius=5)["ok"] is True
+
+    res = mod.metrics()
+    assert res["ok"] is True and res["enabled"] is True
+    span = res["spans"]["tool.open_context"]
+    assert span["count"] == 2
+    assert 0 < span["min_ms"] <= span["p50_ms"] <= span["p95_ms"] <= span["max_ms"]
+    counters = res["counters"]
+    assert counters["file_cache.misses"] >= 1 and counters["file_cache.hits"] >= 1
+    assert counters["file.bytes_read"] >= (tmp_path / "m.py").stat().st_size
+
+    mod.metrics(reset=True)
+    assert mod.metrics()["spans"] == {}
+
+
+def test_job_watch_and_cache_tools_are_timed(registry):
+    async def calls():
+        await mod.poll_run()
+        await mod.cancel_run(job_id="nope")
+        await mod.watch_status()
+
+    asyncio.run(calls())
+    mod.cache_stats()
+    mod.metrics()
+    spans = mod.metrics()["spans"]
+    for name in ("poll_run", "cancel_run", "watch_status", "cache_stats", "metrics"):
+        assert spans[f"tool.{name}"]["count"] == 1
+
+
+def test_concurrent_prometheus_exports(tmp_path, monkeypatch, registry):
+    out = tmp_path / "metrics.prom"
+    written = []
+    barrier = threading.Barrier(2)
+    real_replace = os.replace
+
+    def replace_together(src, dst):
+        # Both writers have their temp file written before either one renames it.
+        written.append(src)
+        barrier.wait(timeout=5)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace_together)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.export(str(out)))) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [str(out), str(out)]
+    assert len(set(written)) == 2
+
+
+def test_disabled_registry_records_nothing():
+    reg = Registry(enabled=False)
+    assert reg.span("a") is reg.span("b")
+    with reg.span("a"):
+        pass
+    reg.incr("c", 5)
+    assert reg.snapshot()["spans"] == {} and reg.snapshot()["counters"] == {}
+
+
+def test_histogram_quantiles():
+    h = Histogram()
+    for ms in [1] * 90 + [200] * 10:
+        h.observe(ms / 1000)
+    assert h.quantile(0.5) == pytest.approx(0.001)
+    assert h.quantile(0.95) == pytest.approx(0.2)
+    assert h.summary()["count"] == 100
+
+
+def test_prometheus_file(tmp_path, monkeypatch, registry):
+    out = tmp_path / "metrics.prom"
+    monkeypatch.setenv("MCP_METRICS_PROM_FILE", str(out))
+    with registry.span("stage.one"):
+        pass
+    registry.incr("pytest.subprocesses", 2)
+
+    res = mod.metrics()
+    assert res["prometheus_file"] == str(out)
+    text = out.read_text(encoding="utf-8")
+    assert '# TYPE debug_companion_span_seconds histogram' in text
+    assert 'debug_companion_span_seconds_bucket{span="stage.one",le="+Inf"} 1' in text
+    assert 'debug_companion_span_seconds_count{span="stage.one"} 1' in text
+    assert "debug_companion_pytest_subprocesses_total 2" in text
@@ -0,0 +1,52 @@
+import server as mod
+from debug_companion.context_tools import MIN_RADIUS, merge_windows
+from debug_companion.orchestrator import FRAME_CONTEXT_RADIUS
+
+
+def test_merge_windows_joins_overlapping_and_adjacent():
+    ranges = merge_windows([(30, 40, 35), (1, 10, 5), (11, 15, 13), (8, 12, 10), (50, 60, 55)])
+    assert [(r["start_line"], r["end_line"], r["focus_lines"]) for r in ranges] == [
+        (1, 15, [5, 10, 13]),
+        (30, 40, [35]),
+        (50, 60, [55]),
+    ]
+
+
+def test_open_contexts_groups_and_dedupes(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "a.py").write_text("\n".join(f"a{i}" for i in range(1, 201)), encoding="utf-8")
+    (tmp_path / "b.py").write_text("\n".join(f"b{i}" for i in range(1, 21)), encoding="utf-8")
+
+    res = mod.open_contexts(
+        locations=[
+            {"path": "a.py", "line": 20, "radius": 5},
+            {"path": "b.py", "line": 3, "radius": 5},
+            {"path": "a.py", "line": 26, "radius": 5},
+            {"path": "a.py", "line": 150, "radius": 5},
+            {"path": "missing.py", "line": 1},
+        ]
+    )
+    assert res["ok"] is True
+    files = {f["path"].rsplit("/", 1)[-1]: f for f in res["files"]}
+    a_ranges = [(r["start_line"], r["end_line"]) for r in files["a.py"]["ranges"]]
+    assert a_ranges == [(15, 31), (145, 155)]
+    assert files["a.py"]["ranges"][0]["content"][0] == {"line": 15, "text": "a15"}
+    assert [(r["start_line"], r["end_line"]) for r in files["b.py"]["ranges"]] == [(1, 8)]
+
+    assert res["lines_returned"] < res["lines_requested"]
+    assert res["locations"][4]["ok"] is False
+    assert "not found" in res["locations"][4]["error"]
+
+
+def test_open_contexts_rejects_empty():
+    assert mod.open_contexts(locations=[])["ok"] is False
+
+
+def test_frame_context_radius_is_not_clamped(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    (tmp_path / "a.py").write_text("".join(f"x{i} = {i}\n" for i in range(1, 101)), encoding="utf-8")
+
+    assert FRAME_CONTEXT_RADIUS >= MIN_RADIUS
+    res = mod.open_contexts(locations=[{"path": "a.py", "line": 50, "radius": FRAME_CONTEXT_RADIUS}])
+    rng = res["files"][0]["ranges"][0]
+    assert (rng["start_line"], rng["end_line"]) == (50 - FRAME_CONTEXT_RADIUS, 50 + FRAME_CONTEXT_RADIUS)
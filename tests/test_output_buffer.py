@@ -0,0 +1,72 @@
+import asyncio
+
+import server as mod
+from debug_companion.output_buffer import LineRingBuffer, PytestProgress
+
+
+def test_ring_buffer_keeps_last_lines_across_chunk_boundaries():
+    buf = LineRingBuffer(max_lines=3)
+    data = b"".join(f"line{i}\n".encode() for i in range(1, 1001))
+    for i in range(0, len(data), 7):
+        buf.feed(data[i : i + 7])
+    buf.feed(b"no newline at end")
+    buf.close()
+
+    assert buf.line_count == 1001
+    assert buf.lines() == ["line999", "line1000", "no newline at end"]
+
+
+def test_ring_buffer_caps_huge_lines():
+    buf = LineRingBuffer(max_lines=2, max_line_chars=100)
+    buf.feed(b"x" * 100_000)
+    buf.feed(b"y" * 100_000 + b"\nshort\n")
+
+    lines = buf.lines()
+    assert lines[-1] == "short"
+    assert len(lines[0]) == 100
+    assert len(buf._partial) == 0
+
+
+def test_progress_counts_marks_and_stops_at_report():
+    p = PytestProgress()
+    assert p.feed_partial("..F") is True
+    assert p.snapshot()["done"] == 3
+    p.feed_line("..F.s                                 [ 50%]")
+    p.feed_line("=================== FAILURES ===================")
+    p.feed_line("....")  # captured output inside the report, not progress
+
+    snap = p.snapshot()
+    assert snap["passed"] == 3
+    assert snap["failed"] == 1
+    assert snap["skipped"] == 1
+    assert snap["percent"] == 50
+
+
+def test_run_pytest_async_reports_progress(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "test_many.py").write_text(
+        "import pytest\n\n"
+        "@pytest.mark.parametrize('i', range(30))\n"
+        "def test_i(i):\n    print('noise ' * 50)\n    assert i != 7\n",
+        encoding="utf-8",
+    )
+
+    seen = []
+
+    class FakeCtx:
+        async def report_progress(self, progress, total=None, message=None):
+            seen.append((progress, message))
+
+    res = asyncio.run(
+        mod.run_pytest_async(target="proj", max_output_lines=5, timeout_seconds=30, ctx=FakeCtx())
+    )
+    assert res["ok"] is True
+    assert res["exit_code"] == 1
+    assert len(res["output_tail"].splitlines()) == 5
+    assert res["output_line_count"] > 5
+    assert res["progress"]["failed"] == 1
+    assert seen
+    assert [p for p, _ in seen] == sorted(p for p, _ in seen)
+    assert "1 failed" in seen[-1][1]
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import random
+import time
+
+import server as mod
+from debug_companion import output_log
+from debug_companion.output_log import OutputLog, grep_log, read_range
+
+
+def _write_log(lines, max_bytes=None, trailing_newline=True):
+    log = OutputLog(max_bytes=max_bytes)
+    data = "\n".join(lines).encode("utf-8") + (b"\n" if trailing_newline else b"")
+    rng = random.Random(7)
+    pos = 0
+    while pos < len(data):
+        step = rng.randint(1, 5000)
+        log.feed(data[pos : pos + step])
+        pos += step
+    return log.close()
+
+
+def test_read_range_uses_sparse_index():
+    lines = [f"line {i}" for i in range(1, 10_001)]
+    info = _write_log(lines)
+    assert info["lines"] == 10_000 and info["truncated"] is False
+
+    res = read_range(info["run_id"], start_line=255, count=4)
+    assert [x["text"] for x in res["content"]] == ["line 255", "line 256", "line 257", "line 258"]
+    assert res["next_line"] == 259
+
+    tail = read_range(info["run_id"], start_line=-2, count=10)
+    assert [x["line"] for x in tail["content"]] == [9998, 9999, 10000]
+    assert tail["next_line"] is None
+    assert read_range(info["run_id"], start_line=20_000)["content"] == []
+
+
+def test_grep_reports_line_numbers_context_and_paging():
+    lines = [f"noise {i}" for i in range(1, 3001)]
+    for n in (10, 600, 2999):
+        lines[n - 1] = f"E   AssertionError: boom {n}"
+    info = _write_log(lines, trailing_newline=False)
+    assert info["lines"] == 3000
+
+    res = grep_log(info["run_id"], r"assertionerror: boom \d+$", ignore_case=True, max_matches=2, context=1)
+    assert [m["line"] for m in res["matches"]] == [10, 600]
+    assert res["matches"][0]["before"] == [{"line": 9, "text": "noise 9"}]
+    assert res["matches"][1]["after"] == [{"line": 601, "text": "noise 601"}]
+    assert res["next_line"] == 2999
+
+    rest = grep_log(info["run_id"], "boom", start_line=res["next_line"])
+    assert [m["text"] for m in rest["matches"]] == ["E   AssertionError: boom 2999"]
+    assert grep_log(info["run_id"], "(")["ok"] is False
+
+
+def test_size_cap_and_unknown_runs():
+    info = _write_log([f"{i:05d}" for i in range(1000)], max_bytes=600)
+    assert info["truncated"] is True and info["bytes"] == 600
+    assert info["lines"] == 100
+    assert read_range(info["run_id"], start_line=0, count=1)["content"][0]["text"] == "00099"
+
+    assert "unknown or expired" in read_range("20200101-000000-deadbeef")["error"]
+    assert "invalid run_id" in read_range("../../etc/passwd")["error"]
+
+    ids = [_write_log(["x"])["run_id"] for _ in range(3)]
+    for age, run_id in enumerate(reversed(ids)):
+        meta = output_log._paths(run_id)[2]
+        os.utime(meta, (time.time() - age * 10, time.time() - age * 10))
+    output_log.prune_logs(keep=2)
+    assert read_range(ids[0])["ok"] is False and read_range(ids[2])["ok"] is True
+
+
+def _chatty_project(root):
+    proj = root / "proj"
+    proj.mkdir()
+    (proj / "test_mod.py").write_text(
+        "def test_bad():\n    print('\\n'.join(f'chatty {i}' for i in range(5000)))\n    assert 1 == 2\n",
+        encoding="utf-8",
+    )
+
+
+def test_run_pytest_output_is_kept_beyond_the_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    _chatty_project(tmp_path)
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", max_output_lines=20, timeout_seconds=30))
+    assert "chatty 10\n" not in res["output_tail"]
+    run_id = res["output_log"]["run_id"]
+    assert res["output_log"]["lines"] == res["output_line_count"]
+
+    hits = mod.read_output(run_id=run_id, grep=r"^chatty 10$")
+    assert len(hits["matches"]) == 1
+    window = mod.read_output(run_id=run_id, start_line=hits["matches"][0]["line"], count=2)
+    assert [x["text"] for x in window["content"]] == ["chatty 10", "chatty 11"]
+
+
+def test_sync_run_output_goes_to_the_log_not_the_pipe(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    _chatty_project(tmp_path)
+    piped = []
+    real_run = mod.subprocess.run
+
+    def spy(*args, **kwargs):
+        proc = real_run(*args, **kwargs)
+        piped.append(len(proc.stdout) + len(proc.stderr))
+        return proc
+
+    monkeypatch.setattr(mod.subprocess, "run", spy)
+    res = mod.run_pytest(target="proj", max_output_lines=20, timeout_seconds=30)
+    assert res["exit_code"] == 1 and "1 failed" in res["output_tail"]
+    assert piped == [0]
+    assert res["output_line_count"] > 5000 and res["output_log"]["lines"] == res["output_line_count"]
+    assert len(mod.read_output(run_id=res["output_log"]["run_id"], grep=r"^chatty 4999$")["matches"]) == 1
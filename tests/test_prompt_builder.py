@@ -0,0 +1,82 @@
+import server as mod
+from debug_companion.prompt_builder import build_analysis_inputs, clean_error_text, estimate_tokens
+
+NOISY_TAIL = "\n".join(
+    ["." * 60 + " [ 40%]"] * 30
+    + ["tests/test_ok.py::test_%d PASSED" % i for i in range(20)]
+    + [
+        "=================================== FAILURES ===================================",
+        "___________________________________ test_div ___________________________________",
+        "test_x.py:5: in test_div",
+        "    assert div(4, 0) == 1",
+        "mod.py:2: in div",
+        "    return a // b",
+        "E   ZeroDivisionError: integer division or modulo by zero",
+        "___________________________________ test_div2 __________________________________",
+        "test_x.py:5: in test_div",
+        "    assert div(4, 0) == 1",
+        "mod.py:2: in div",
+        "    return a // b",
+        "E   ZeroDivisionError: integer division or modulo by zero",
+        "=========================== short test summary info ============================",
+        "FAILED test_x.py::test_div - ZeroDivisionError: integer division or modulo by...",
+        "========================= 1 failed, 20 passed in 0.31s =========================",
+    ]
+)
+
+
+def test_clean_error_text_drops_noise_and_repeated_frames():
+    lines, dropped = clean_error_text(NOISY_TAIL)
+    text = "\n".join(lines)
+    assert dropped["progress"] == 30
+    assert dropped["passed"] == 20
+    assert dropped["duplicate"] == 2
+    assert "E   ZeroDivisionError: integer division or modulo by zero" in text
+    assert "FAILED test_x.py::test_div" in text
+    assert "1 failed, 20 passed" in text
+    assert "FAILURES" not in text
+
+
+def test_budget_keeps_summary_and_code_near_focus():
+    code = "\n".join(f"{i}: line_{i} = compute({i})" for i in range(1, 201))
+    err, ctx, stats = build_analysis_inputs(error_message=NOISY_TAIL, code_context=code, token_budget=300, focus_line=150)
+
+    assert stats["tokens_before"] > stats["tokens_after"]
+    assert stats["tokens_after"] <= 300 + 10
+    assert stats["code_trimmed"] is True
+    assert "150: line_150 = compute(150)" in ctx
+    assert "1: line_1 = compute(1)" not in ctx
+    assert "ZeroDivisionError" in err
+    assert estimate_tokens(err) + estimate_tokens(ctx) == stats["tokens_after"]
+
+
+def test_zero_budget_passes_through():
+    err, ctx, stats = build_analysis_inputs(error_message="a\n\n\nb", code_context="1: x", token_budget=0)
+    assert (err, ctx) == ("a\n\n\nb", "1: x")
+    assert stats["tokens_before"] == stats["tokens_after"]
+
+
+def test_debug_project_reports_prompt_tokens(monkeypatch):
+    def fake_run_pytest(target, max_output_lines, timeout_seconds):
+        return {"ok": True, "exit_code": 1, "output_tail": NOISY_TAIL, "cwd": "/tmp"}
+
+    def fake_extract_failures(pytest_output, limit, base_dir):
+        return {"ok": True, "count": 1, "failures": [{"path_for_open_context": "mod.py", "line": 2}]}
+
+    def fake_open_context(path, line, radius, base_dir):
+        return {"ok": True, "focus_line": 2, "content": [{"line": 2, "text": "    return a // b"}]}
+
+    seen = {}
+
+    def fake_gemini(error_message, code_context):
+        seen["error_message"] = error_message
+        return {"ok": True, "analysis": "divide by zero"}
+
+    monkeypatch.setattr(mod, "run_pytest", fake_run_pytest)
+    monkeypatch.setattr(mod, "extract_failures", fake_extract_failures)
+    monkeypatch.setattr(mod, "open_context", fake_open_context)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini", fake_gemini)
+
+    res = mod.debug_project(target="demo_project", token_budget=500)
+    assert res["prompt"]["tokens_after"] < res["prompt"]["tokens_before"]
+    assert "PASSED" not in seen["error_message"]
@@ -0,0 +1,133 @@
+import os
+from types import SimpleNamespace
+
+import server as mod
+from debug_companion import output_log
+from debug_companion.result_cache import ResultCache, TreeHasher
+
+
+def _project(root):
+    proj = root / "demo_project"
+    proj.mkdir()
+    (proj / "test_dummy.py").write_text("def test_ok(): assert True\n", encoding="utf-8")
+    (proj / "notes.txt").write_text("not hashed", encoding="utf-8")
+    return proj
+
+
+def test_tree_hash_tracks_relevant_files_and_reuses_digests(tmp_path):
+    proj = _project(tmp_path)
+    hasher = TreeHasher()
+
+    h1 = hasher.tree_hash(proj)
+    assert hasher.files_hashed == 1
+    assert hasher.tree_hash(proj) == h1
+    assert hasher.files_hashed == 1  # (inode, mtime, size) unchanged => no re-read
+
+    (proj / "notes.txt").write_text("still not hashed", encoding="utf-8")
+    assert hasher.tree_hash(proj) == h1
+
+    (proj / "pytest.ini").write_text("[pytest]\n", encoding="utf-8")
+    h2 = hasher.tree_hash(proj)
+    assert h2 != h1
+
+    (proj / "test_dummy.py").write_text("def test_ok(): assert 1\n", encoding="utf-8")
+    assert hasher.tree_hash(proj) != h2
+
+
+def test_run_pytest_cache_hit_skips_subprocess(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = _project(tmp_path)
+    calls = []
+
+    def fake_run(cmd, cwd, capture_output, text, timeout, env, stdin):
+        calls.append(cmd)
+        return SimpleNamespace(returncode=1, stdout="F\n1 failed\n", stderr="")
+
+    monkeypatch.setattr(mod.subprocess, "run", fake_run)
+
+    r1 = mod.run_pytest(target="demo_project", use_cache=True)
+    r2 = mod.run_pytest(target="demo_project", use_cache=True)
+    assert len(calls) == 1
+    assert r1["cache"]["hit"] is False
+    assert r2["cache"]["hit"] is True
+    assert r2["exit_code"] == 1
+    assert r2["output_tail"] == r1["output_tail"]
+
+    (proj / "test_dummy.py").write_text("def test_ok(): assert False\n", encoding="utf-8")
+    r3 = mod.run_pytest(target="demo_project", use_cache=True)
+    assert r3["cache"]["hit"] is False
+    assert len(calls) == 2
+
+    mod.run_pytest(target="demo_project", max_output_lines=10, use_cache=True)
+    assert len(calls) == 3  # different arguments => different key
+
+
+def test_cache_hit_drops_a_pruned_output_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    _project(tmp_path)
+
+    def fake_run(cmd, cwd, capture_output, text, timeout, env, stdin):
+        return SimpleNamespace(returncode=1, stdout="F\n1 failed\n", stderr="")
+
+    monkeypatch.setattr(mod.subprocess, "run", fake_run)
+    run_id = mod.run_pytest(target="demo_project", use_cache=True)["output_log"]["run_id"]
+    assert mod.run_pytest(target="demo_project", use_cache=True)["output_log"]["run_id"] == run_id
+
+    for p in output_log._paths(run_id):
+        p.unlink()
+    hit = mod.run_pytest(target="demo_project", use_cache=True)
+    assert hit["cache"]["hit"] is True and "output_log" not in hit
+
+
+def test_cache_key_covers_sibling_packages(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = _project(tmp_path)
+    (proj / "pyproject.toml").write_text("[tool.pytest.ini_options]\n", encoding="utf-8")
+    (proj / "test_dummy.py").write_text("from lib.helper import X\n\ndef test_ok(): assert X\n", encoding="utf-8")
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    (lib / "helper.py").write_text("X = 1\n", encoding="utf-8")
+
+    def fake_run(cmd, cwd, capture_output, text, timeout, env, stdin):
+        return SimpleNamespace(returncode=0, stdout="1 passed\n", stderr="")
+
+    monkeypatch.setattr(mod.subprocess, "run", fake_run)
+    assert mod.run_pytest(target="demo_project", use_cache=True)["cache"]["hit"] is False
+    assert mod.run_pytest(target="demo_project", use_cache=True)["cache"]["hit"] is True
+
+    # The project imports lib/ from the run directory, outside its own pyproject.toml.
+    (lib / "helper.py").write_text("X = 0\n", encoding="utf-8")
+    assert mod.run_pytest(target="demo_project", use_cache=True)["cache"]["hit"] is False
+
+    # A conftest.py above the project still applies to it.
+    (tmp_path / "conftest.py").write_text("X = 1\n", encoding="utf-8")
+    assert mod.run_pytest(target="demo_project", use_cache=True)["cache"]["hit"] is False
+
+
+def test_timeouts_are_not_cached(tmp_path, monkeypatch):
+    import subprocess
+
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    _project(tmp_path)
+
+    def fake_run(cmd, cwd, capture_output, text, timeout, env, stdin):
+        raise subprocess.TimeoutExpired(cmd=cmd, timeout=timeout, output="", stderr="")
+
+    monkeypatch.setattr(mod.subprocess, "run", fake_run)
+    mod.run_pytest(target="demo_project", use_cache=True)
+    res = mod.run_pytest(target="demo_project", use_cache=True)
+    assert res["cache"]["hit"] is False
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=1500)
+    for i in range(3):
+        cache.put(f"k{i}", {"ok": True, "blob": "x" * 400})
+        os.utime(tmp_path / f"k{i}.json", (1000 + i, 1000 + i))
+    assert cache.get("k0") is not None  # touch: k0 becomes most recent
+
+    cache.put("k3", {"ok": True, "blob": "x" * 400})
+    remaining = sorted(p.stem for p in tmp_path.glob("*.json"))
+    assert "k0" in remaining
+    assert "k1" not in remaining
+    assert sum(p.stat().st_size for p in tmp_path.glob("*.json")) <= 1500
@@ -56,6 +56,7 @@ def test_safe_path_absolute_outside_root_allowed_by_allowlist(tmp_path, monkeypa
     p = mod._safe_path(str(f))
     assert p.resolve() == f.resolve()
 
+
 def test_safe_path_empty_rejected(tmp_path, monkeypatch):
     monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
     with pytest.raises(ValueError):
@@ -63,3 +64,61 @@ def test_safe_path_empty_rejected(tmp_path, monkeypatch):
     with pytest.raises(ValueError):
         mod._safe_path("   ")
 
+
+def test_safe_path_allowlist_rebuilt_when_env_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path / "root")
+    (tmp_path / "root").mkdir()
+    a = tmp_path / "a"
+    b = tmp_path / "b"
+    a.mkdir()
+    b.mkdir()
+
+    monkeypatch.setenv("MCP_ALLOWED_ROOTS", str(a))
+    assert mod._safe_path(str(a / "x.py")) == (a / "x.py").resolve()
+    with pytest.raises(ValueError):
+        mod._safe_path(str(b / "x.py"))
+
+    monkeypatch.setenv("MCP_ALLOWED_ROOTS", f"{b}{os.pathsep}{tmp_path / 'missing'}")
+    assert mod._safe_path(str(b / "x.py")) == (b / "x.py").resolve()
+    with pytest.raises(ValueError):
+        mod._safe_path(str(a / "x.py"))
+    with pytest.raises(ValueError):
+        mod._safe_path(str(tmp_path / "ab" / "x.py"))  # prefix of a name is not a parent
+
+
+def test_safe_path_cached_resolution_keeps_escape_checks(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path / "root")
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    (tmp_path / "outside").mkdir()
+    (root / "link").symlink_to(tmp_path / "outside")
+
+    for _ in range(3):
+        assert mod._safe_path("sub/x.py") == (root / "sub" / "x.py").resolve()
+        with pytest.raises(ValueError):
+            mod._safe_path("sub/../../outside/x.py")
+        with pytest.raises(ValueError):
+            mod._safe_path("link/x.py")  # symlink out of the root
+
+
+def test_safe_path_notices_directory_swapped_for_symlink(tmp_path, monkeypatch):
+    # Within the cache's TTL: every hit is revalidated, not only expired entries.
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path / "root")
+    root = tmp_path / "root"
+    (root / "d" / "e").mkdir(parents=True)
+    (root / "d" / "e" / "f.py").write_text("pass", encoding="utf-8")
+    outside = tmp_path / "outside"
+    (outside / "e").mkdir(parents=True)
+    (outside / "e" / "f.py").write_text("secret", encoding="utf-8")
+
+    for _ in range(2):
+        assert mod._safe_path("d/x.py") == (root / "d" / "x.py").resolve()
+        assert mod._safe_path("d/e/f.py") == (root / "d" / "e" / "f.py").resolve()
+    (root / "d" / "e" / "f.py").unlink()
+    (root / "d" / "e").rmdir()
+    (root / "d").rmdir()
+    (root / "d").symlink_to(outside)
+    with pytest.raises(ValueError):
+        mod._safe_path("d/x.py")
+    with pytest.raises(ValueError):
+        mod._safe_path("d/e/f.py")
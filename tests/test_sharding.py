@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import server as mod
+from debug_companion import sharding
+from debug_companion.sharding import merge_exit_codes, split_shards
+
+
+def test_split_shards_balances_by_duration_and_keeps_order():
+    ids = [f"t.py::test_{i}" for i in range(6)]
+    durations = {ids[0]: 10.0, ids[1]: 1.0, ids[2]: 1.0, ids[3]: 1.0, ids[4]: 1.0}
+
+    shards = split_shards(ids, 2, durations)
+    assert sorted(sum(shards, [])) == sorted(ids)
+    assert [ids[0]] in shards  # the slow test gets a shard of its own
+    for shard in shards:
+        assert shard == sorted(shard, key=ids.index)
+
+
+def test_merge_exit_codes():
+    assert merge_exit_codes([0, 0]) == 0
+    assert merge_exit_codes([0, 1, 0]) == 1
+    assert merge_exit_codes([5, 0]) == 0
+    assert merge_exit_codes([5, 5]) == 5
+    assert merge_exit_codes([0, 2]) == 2
+
+
+def _suite(failing):
+    # Four modules of three tests each; (module, test) pairs in `failing` fail.
+    files = {}
+    for m in range(4):
+        body = "import time\n\n"
+        for t in range(3):
+            body += f"def test_{t}():\n    time.sleep(0.05)\n"
+            body += "    assert False\n\n" if (m, t) in failing else "    assert True\n\n"
+        files[f"test_m{m}.py"] = body
+    return files
+
+
+@pytest.fixture
+def many_cpus(monkeypatch):
+    monkeypatch.setattr(sharding.os, "cpu_count", lambda: 4)
+
+
+def test_sharded_run_merges_results(tmp_path, monkeypatch, many_cpus, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(_suite({(1, 0), (3, 2)}))
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", shards=3, fail_fast=False, timeout_seconds=60))
+    assert res["ok"] is True
+    assert res["exit_code"] == 1
+    assert res["sharding"]["shards"] == 3
+    assert res["sharding"]["collected"] == 12
+    assert sum(d["tests"] for d in res["sharding"]["details"]) == 12
+    assert sorted(r["nodeid"] for r in res["failure_records"]) == [
+        "proj/test_m1.py::test_0",
+        "proj/test_m3.py::test_2",
+    ]
+
+
+def test_sharded_run_all_passing(tmp_path, monkeypatch, many_cpus, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    write_project(_suite(set()))
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", shards=0, timeout_seconds=60))
+    assert res["ok"] is True
+    assert res["exit_code"] == 0
+    assert res["failure_records"] == []
+    assert "12 passed" not in res["output_tail"]  # each shard only runs its own slice
+
+
+def test_sharded_fail_fast_stops_other_shards(tmp_path, monkeypatch, many_cpus):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "test_fast.py").write_text("def test_fail():\n    assert False\n", encoding="utf-8")
+    (proj / "test_slow.py").write_text(
+        "import time\n\ndef test_slow():\n    time.sleep(30)\n", encoding="utf-8"
+    )
+
+    res = asyncio.run(mod.run_pytest_async(target="proj", shards=2, fail_fast=True, timeout_seconds=60))
+    assert res["exit_code"] == 1
+    assert [d["stopped"] for d in res["sharding"]["details"]].count(True) == 1
+    assert res["failure_records"][0]["nodeid"] == "proj/test_fast.py::test_fail"
+
+
+def test_unsharded_fallback_keeps_fail_fast_setting(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "test_one.py").write_text("def test_only():\n    assert False\n", encoding="utf-8")
+
+    # A single node id is run without sharding, with the caller's fail_fast.
+    res = asyncio.run(mod.run_pytest_async(target="proj", shards=4, fail_fast=False, timeout_seconds=60))
+    assert "sharding" not in res and res["exit_code"] == 1
+    assert not any(a.startswith("--maxfail") for a in res["cmd"])
+
+    # One CPU: one shard, same fallback; both failures are reported.
+    (proj / "test_two.py").write_text("def test_also():\n    assert False\n", encoding="utf-8")
+    monkeypatch.setattr(sharding.os, "cpu_count", lambda: 1)
+    res = asyncio.run(mod.run_pytest_async(target="proj", shards=4, fail_fast=False, timeout_seconds=60))
+    assert sorted(r["nodeid"] for r in res["failure_records"]) == [
+        "proj/test_one.py::test_only",
+        "proj/test_two.py::test_also",
+    ]
@@ -0,0 +1,114 @@
+import server as mod
+
+SHORT_LOG = """FFFE                                                                     [100%]
+==================================== ERRORS ====================================
+__________________________ ERROR at setup of test_fx ___________________________
+test_x.py:16: in broken
+    raise RuntimeError("fixture boom")
+E   RuntimeError: fixture boom
+=================================== FAILURES ===================================
+___________________________________ test_div ___________________________________
+test_x.py:5: in test_div
+    assert div(4, 0) == 1
+mod.py:2: in div
+    return a // b
+E   ZeroDivisionError: integer division or modulo by zero
+___________________________________ test_eq ____________________________________
+test_x.py:8: in test_eq
+    assert div(4, 2) == 3
+E   assert 2 == 3
+E    +  where 2 = div(4, 2)
+_________________________________ TestK.test_k _________________________________
+test_x.py:12: in test_k
+    raise ValueError("bad value 0x1234")
+E   ValueError: bad value 0x1234
+=========================== short test summary info ============================
+FAILED test_x.py::test_div - ZeroDivisionError: integer division or modulo by...
+FAILED test_x.py::test_eq - assert 2 == 3
+FAILED test_x.py::TestK::test_k - ValueError: bad value 0x1234
+ERROR test_x.py::test_fx - RuntimeError: fixture boom
+3 failed, 1 error in 0.05s
+"""
+
+LONG_TAIL = """=================================== FAILURES ===================================
+___________________________________ test_div ___________________________________
+
+    def test_div():
+>       assert div(4, 0) == 1
+
+test_x.py:5: 
+_ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ 
+
+a = 4, b = 0
+
+    def div(a, b):
+>       return a // b
+E       ZeroDivisionError: integer division or modulo by zero
+
+mod.py:2: ZeroDivisionError
+=========================== short test summary info ============================
+FAILED test_x.py::test_div - ZeroDivisionError: integer division or modulo by...
+"""
+
+
+def _records(res):
+    return {r["nodeid"]: r for r in res["records"]}
+
+
+def test_structured_records_from_short_traceback(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    res = mod.extract_failures(pytest_output=SHORT_LOG, limit=10, base_dir=str(tmp_path))
+    assert res["ok"] is True
+    recs = _records(res)
+    assert set(recs) == {"test_x.py::test_div", "test_x.py::test_eq", "test_x.py::TestK::test_k", "test_x.py::test_fx"}
+
+    div = recs["test_x.py::test_div"]
+    assert div["exc_type"] == "ZeroDivisionError"
+    assert [(f["path"], f["line"], f["function"]) for f in div["frames"]] == [("test_x.py", 5, "test_div"), ("mod.py", 2, "div")]
+    assert recs["test_x.py::test_eq"]["exc_type"] == "AssertionError"
+    assert recs["test_x.py::test_eq"]["message"].startswith("assert 2 == 3")
+    assert recs["test_x.py::test_fx"]["test"] == "ERROR at setup of test_fx"
+
+    # Flat file:line list keeps its previous shape and order.
+    assert [(f["path"], f["line"]) for f in res["failures"]][:3] == [("test_x.py", 16), ("test_x.py", 5), ("mod.py", 2)]
+    assert res["stats"]["unique_paths"] == 2
+
+
+def test_long_traceback_and_log_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    log = tmp_path / "pytest.log"
+    log.write_text(("." * 70 + "\n") * 5000 + LONG_TAIL, encoding="utf-8")
+
+    res = mod.extract_failures(log_path=str(log), limit=5, base_dir=str(tmp_path))
+    assert res["ok"] is True
+    assert res["stats"]["lines"] > 5000
+    (rec,) = res["records"]
+    assert rec["nodeid"] == "test_x.py::test_div"
+    assert rec["exc_type"] == "ZeroDivisionError"
+    assert [f["line"] for f in rec["frames"]] == [5, 2]
+
+
+def test_native_traceback(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    out = (
+        "Traceback (most recent call last):\n"
+        '  File "/x/app.py", line 10, in main\n'
+        "    run()\n"
+        '  File "/x/lib.py", line 3, in run\n'
+        "    raise KeyError('k')\n"
+        "KeyError: 'k'\n"
+    )
+    res = mod.extract_failures(pytest_output=out, limit=5, base_dir="")
+    (rec,) = res["records"]
+    assert rec["exc_type"] == "KeyError"
+    assert rec["message"] == "'k'"
+    assert [(f["path"], f["function"]) for f in rec["frames"]] == [("/x/app.py", "main"), ("/x/lib.py", "run")]
+
+
+def test_log_path_outside_root_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path / "root")
+    (tmp_path / "root").mkdir()
+    outside = tmp_path / "out.log"
+    outside.write_text("a.py:1: E\n", encoding="utf-8")
+    res = mod.extract_failures(log_path=str(outside))
+    assert res["ok"] is False
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+import server as mod
+from debug_companion import watch
+
+
+CALC_PROJECT = {
+    "calc.py": "def add(a, b):\n    return a - b\n",
+    "test_calc.py": "from calc import add\n\n\n"
+    "def test_add():\n    assert add(2, 2) == 4\n\n\n"
+    "def test_other():\n    assert True\n",
+    "conftest.py": "",
+}
+
+
+async def _wait_for(target, pred, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        st = await mod.watch_status(target=target)
+        if pred(st):
+            return st
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"watch did not reach the expected state: {st}")
+
+
+async def _fake_gemini(error_message, code_context):
+    return {"ok": True, "analysis": code_context}
+
+
+@pytest.mark.parametrize("backend", ["inotify", "poll"])
+def test_watch_refreshes_snapshot_on_change(tmp_path, monkeypatch, backend, write_project):
+    if backend == "inotify" and not watch.inotify_supported():
+        pytest.skip("inotify not available")
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", _fake_gemini)
+    proj = write_project(CALC_PROJECT)
+
+    async def scenario():
+        started = await mod.watch_start(target="proj", debounce_ms=100, poll_seconds=0.1, backend=backend)
+        assert started["ok"] is True and started["backend"] == backend
+        try:
+            st = await _wait_for("proj", lambda s: "snapshot" in s and s["state"] == "idle")
+            assert st["snapshot"]["failing"] == ["proj/test_calc.py::test_add"]
+            assert st["snapshot"]["contexts"] >= 1
+
+            t0 = time.perf_counter()
+            res = await mod.debug_project_async(target="proj", use_snapshot=True)
+            fast = time.perf_counter() - t0
+            assert res["snapshot"]["used"] is True
+            assert res["stage"] == "done"
+            assert res["failure"]["nodeid"] == "proj/test_calc.py::test_add"
+            assert "assert add(2, 2) == 4" in res["gemini"]["analysis"]
+
+            runs = st["runs"]
+            (proj / "calc.py").write_text("def add(a, b):\n    return a + b\n", encoding="utf-8")
+            st = await _wait_for("proj", lambda s: s["runs"] > runs and s["state"] == "idle" and not s["pending_changes"])
+            assert st["last_changed"] == ["proj/calc.py"]
+            assert st["snapshot"]["failures"] == 0
+
+            res = await mod.debug_project_async(target="proj", use_snapshot=True)
+            assert res["snapshot"]["used"] is True
+            assert res["msg"] == "All tests passed"
+            return fast
+        finally:
+            stopped = await mod.watch_stop(target="proj")
+            assert stopped["state"] == "stopped"
+
+    fast = asyncio.run(scenario())
+    assert fast < 1.0
+
+
+def test_use_snapshot_falls_back_when_tree_changed(tmp_path, monkeypatch, write_project):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    monkeypatch.setattr(mod, "analyze_error_with_gemini_async", _fake_gemini)
+    proj = write_project(CALC_PROJECT)
+
+    async def scenario():
+        unwatched = await mod.debug_project_async(target="proj", use_snapshot=True)
+        # Polling so slowly that the edit below is not picked up before debug_project runs.
+        await mod.watch_start(target="proj", poll_seconds=60, backend="poll")
+        try:
+            await _wait_for("proj", lambda s: "snapshot" in s)
+            (proj / "calc.py").write_text("def add(a, b):\n    return a + b  # fixed\n", encoding="utf-8")
+            stale = await mod.debug_project_async(target="proj", use_snapshot=True)
+        finally:
+            await watch.stop_all()
+        return unwatched, stale
+
+    unwatched, stale = asyncio.run(scenario())
+    assert unwatched["snapshot"] == {"used": False, "reason": "target is not watched (see watch_start)"}
+    assert unwatched["stage"] == "done"
+    assert stale["snapshot"] == {"used": False, "reason": "tree changed since the snapshot"}
+    assert stale["msg"] == "All tests passed"
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+import server as mod
+from debug_companion.pytest_runner import discard_run_files, execute_run_async, prepare_run
+from debug_companion.worker_pool import WarmPool, get_warm_pool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="warm pool requires os.fork")
+
+
+def _make_project(root):
+    proj = root / "proj"
+    proj.mkdir()
+    (proj / "helper.py").write_text("VALUE = 1\n", encoding="utf-8")
+    (proj / "test_mod.py").write_text(
+        "from helper import VALUE\n\n"
+        "def test_ok():\n    assert VALUE == 1\n\n"
+        "def test_bad():\n    assert VALUE == 2\n",
+        encoding="utf-8",
+    )
+    return proj
+
+
+def test_warm_pool_runs_pytest_and_reuses_worker(tmp_path):
+    proj = _make_project(tmp_path)
+    pool = WarmPool(max_workers=1)
+    try:
+        env = dict(os.environ, PYTEST_DISABLE_PLUGIN_AUTOLOAD="1")
+        args = ["-q", "-p", "no:cacheprovider", str(proj)]
+        r1 = pool.run(args=args, cwd=str(proj), env=env, timeout=30, max_output_lines=50, preload=())
+        r2 = pool.run(args=args, cwd=str(proj), env=env, timeout=30, max_output_lines=50, preload=())
+    finally:
+        pool.close()
+
+    assert r1["exit_code"] == 1
+    assert r1["timed_out"] is False
+    assert "1 failed, 1 passed" in r1["output_tail"]
+    assert r1["worker_pid"] == r2["worker_pid"]
+
+
+def test_warm_pool_recycles_when_preloaded_source_changes(tmp_path):
+    proj = _make_project(tmp_path)
+    pool = WarmPool(max_workers=1)
+    try:
+        env = dict(os.environ, PYTEST_DISABLE_PLUGIN_AUTOLOAD="1")
+        args = ["-q", "-p", "no:cacheprovider", str(proj)]
+        r1 = pool.run(args=args, cwd=str(proj), env=env, timeout=30, max_output_lines=50, preload=("helper",))
+        (proj / "helper.py").write_text("VALUE = 2\n\n", encoding="utf-8")
+        r2 = pool.run(args=args, cwd=str(proj), env=env, timeout=30, max_output_lines=50, preload=("helper",))
+    finally:
+        pool.close()
+
+    assert r1["worker_pid"] != r2["worker_pid"]
+    assert pool.recycled == 1
+    assert "1 failed, 1 passed" in r2["output_tail"]
+
+
+def test_warm_pool_timeout_kills_child(tmp_path):
+    proj = tmp_path / "slow"
+    proj.mkdir()
+    (proj / "test_slow.py").write_text("import time\n\ndef test_sleep():\n    time.sleep(30)\n", encoding="utf-8")
+    pool = WarmPool(max_workers=1)
+    try:
+        env = dict(os.environ, PYTEST_DISABLE_PLUGIN_AUTOLOAD="1")
+        res = pool.run(args=["-q", str(proj)], cwd=str(proj), env=env, timeout=1, max_output_lines=10, preload=())
+    finally:
+        pool.close()
+
+    assert res["timed_out"] is True
+
+
+def test_run_pytest_warm_keeps_result_shape(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "ROOT_DIR", tmp_path)
+    _make_project(tmp_path)
+
+    res = mod.run_pytest(target="proj", max_output_lines=20, timeout_seconds=30, warm=True)
+    assert res["ok"] is True
+    assert res["runner"] == "warm"
+    assert res["exit_code"] == 1
+    assert res["python"] == sys.executable
+    assert res["cwd"] == str(tmp_path)
+    assert res["output_line_count"] >= 1
+
+
+def _slow_run(tmp_path):
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    (proj / "test_mod.py").write_text(
+        "import time\n\n"
+        "def test_bad():\n    assert 1 == 2\n\n"
+        "def test_sleep():\n    time.sleep(30)\n",
+        encoding="utf-8",
+    )
+    return prepare_run(
+        target="proj", root_dir=tmp_path, default_target=".", max_output_lines=50, timeout_seconds=60, maxfail=0
+    )
+
+
+def test_warm_async_run_streams_records_and_honors_stop(tmp_path):
+    run = _slow_run(tmp_path)
+    records, updates = [], []
+    stop = asyncio.Event()
+
+    async def on_record(rec):
+        records.append(rec)
+        if rec.get("event") == "failure":
+            stop.set()
+
+    async def on_progress(p):
+        updates.append(p)
+
+    started = time.monotonic()
+    try:
+        res = asyncio.run(
+            execute_run_async(run, logging.getLogger("t"), True, on_progress, stop=stop, on_record=on_record)
+        )
+    finally:
+        discard_run_files(run)
+
+    assert time.monotonic() - started < 20
+    assert res["runner"] == "warm" and res["stopped"] is True
+    assert [r["nodeid"] for r in records if r.get("event") == "failure"] == ["proj/test_mod.py::test_bad"]
+    assert res["progress"]["failed"] == 1 and updates
+
+
+def test_warm_async_run_is_killed_on_cancel(tmp_path):
+    run = _slow_run(tmp_path)
+
+    async def scenario():
+        task = asyncio.ensure_future(execute_run_async(run, logging.getLogger("t"), True, None))
+        await asyncio.sleep(2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return get_warm_pool().stats()["busy"]
+
+    started = time.monotonic()
+    try:
+        busy = asyncio.run(scenario())
+    finally:
+        discard_run_files(run)
+    # The run was killed before the cancellation finished, not left sleeping in the pool.
+    assert busy == 0 and time.monotonic() - started < 10